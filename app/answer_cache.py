@@ -0,0 +1,122 @@
+from __future__ import annotations
+import hashlib, json, os, re, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from .env import load as load_env
+load_env()
+
+CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1") not in ("0", "false", "no")
+CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")  # empty -> memory only
+
+_TRAILING = re.compile(r"[\s?!.]+$")
+
+def normalize_question(q: str) -> str:
+    return _TRAILING.sub("", " ".join(q.lower().split()))
+
+def cache_key(question: str, model: str, index_version: Any, team: Optional[str] = None) -> str:
+    raw = f"{normalize_question(question)}\n{model}\n{index_version}"
+    if team:
+        raw += f"\n{team}"  # teams see different partitions, so they get different answers
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class AnswerCache:
+    """LRU + TTL cache of /ask answers with an optional SQLite tier.
+
+    Keys embed the index version, so answers from before an /ingest are never
+    served; they just age out.
+    """
+    def __init__(self, max_entries: int = CACHE_SIZE, ttl_s: float = CACHE_TTL_S, path: str = CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.path = path or None
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._mem: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM answers WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None:
+                if item[0] > now:
+                    self._mem.move_to_end(key)
+                    self.hits += 1
+                    return dict(item[1])
+                del self._mem[key]
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT expires_at, value FROM answers WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[0] > now:
+                    value = json.loads(row[1])
+                    self._put_mem(key, row[0], value)  # promote to the memory tier
+                    self.hits += 1
+                    return dict(value)
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        expires_at = time.time() + self.ttl_s
+        with self._lock:
+            self._put_mem(key, expires_at, dict(value))
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO answers VALUES (?, ?, ?)",
+                    (key, expires_at, json.dumps(value, ensure_ascii=False)),
+                )
+                self._puts += 1
+                if self._puts % 100 == 0:
+                    self._conn.execute("DELETE FROM answers WHERE expires_at < ?", (time.time(),))
+                self._conn.commit()
+
+    def _put_mem(self, key: str, expires_at: float, value: Dict[str, Any]) -> None:
+        self._mem[key] = (expires_at, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM answers")
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._mem),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "disk": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else None,
+        }
+
+_CACHE: Optional[AnswerCache] = None
+_CACHE_LOCK = threading.Lock()
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    global _CACHE
+    if not CACHE_ENABLED:
+        return None
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = AnswerCache()
+    return _CACHE
@@ -0,0 +1,165 @@
+from __future__ import annotations
+import os, re, threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from .env import load as load_env
+load_env()
+
+# Context token budget for the prompt's snippets. CONTEXT_TOKEN_BUDGETS
+# overrides it per model: "gpt-5-nano=1500,gpt-4o=4000".
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2500"))
+CONTEXT_TOKEN_BUDGETS = {
+    m.strip(): int(v) for m, _, v in
+    (item.partition("=") for item in os.getenv("CONTEXT_TOKEN_BUDGETS", "").split(",") if "=" in item)
+}
+CONTEXT_MAX_SNIPPETS = int(os.getenv("CONTEXT_MAX_SNIPPETS", "5"))  # matches format_citations
+_MIN_OVERLAP = 20      # shorter shared edges are coincidence, not chunk overlap
+_MAX_OVERLAP = 600     # chunk_docs uses 150
+_MIN_TAIL_TOKENS = 40  # don't bother appending a stub of a snippet
+
+def budget_for(model: Optional[str]) -> int:
+    return CONTEXT_TOKEN_BUDGETS.get(model or "", CONTEXT_TOKEN_BUDGET)
+
+# --- token counting ---
+
+_APPROX_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+class _Tokenizer:
+    """tiktoken when its encoding is available, otherwise a word/punct estimate.
+
+    tiktoken downloads encodings on first use; offline that fails, so the
+    failure is remembered and the estimate is used from then on.
+    """
+    def __init__(self):
+        self._enc: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.exact = True
+
+    def _encoding(self, model: Optional[str]):
+        key = model or ""
+        if key in self._enc:
+            return self._enc[key]
+        with self._lock:
+            if key not in self._enc:
+                enc = None
+                if self.exact:
+                    try:
+                        import tiktoken
+                        try:
+                            enc = tiktoken.encoding_for_model(model or "gpt-4o")
+                        except KeyError:
+                            enc = tiktoken.get_encoding("o200k_base")
+                    except Exception:
+                        self.exact = False
+                self._enc[key] = enc
+        return self._enc[key]
+
+    def count(self, text: str, model: Optional[str] = None) -> int:
+        enc = self._encoding(model)
+        if enc is not None:
+            return len(enc.encode(text, disallowed_special=()))
+        return len(_APPROX_RE.findall(text))
+
+    def truncate(self, text: str, n: int, model: Optional[str] = None) -> str:
+        enc = self._encoding(model)
+        if enc is not None:
+            ids = enc.encode(text, disallowed_special=())
+            return text if len(ids) <= n else enc.decode(ids[:n])
+        m = list(_APPROX_RE.finditer(text))
+        return text if len(m) <= n else text[:m[n - 1].end()]
+
+TOKENIZER = _Tokenizer()
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    return TOKENIZER.count(text, model)
+
+# --- packing ---
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of ``a`` that is a prefix of ``b``."""
+    tail = a[-_MAX_OVERLAP:]
+    for n in range(min(len(tail), len(b)), _MIN_OVERLAP - 1, -1):
+        if tail.endswith(b[:n]):
+            return n
+    return 0
+
+def _join(parts: List[Tuple[Optional[int], str]]) -> str:
+    """Join same-source snippets in document order, stitching overlaps."""
+    text, prev_idx = "", None
+    for idx, part in parts:
+        if not text:
+            text = part
+        elif part in text:
+            pass                                  # fully contained: redundant
+        else:
+            n = _overlap(text, part)
+            if n:
+                text += part[n:]
+            elif idx is not None and prev_idx is not None and idx == prev_idx + 1:
+                text += "\n" + part               # neighbours without a shared edge
+            else:
+                text += "\n…\n" + part
+        prev_idx = idx
+    return text
+
+def _dedup_paragraphs(text: str, seen: set) -> str:
+    out = []
+    for para in text.split("\n\n"):
+        key = " ".join(para.lower().split())
+        if len(key) > 40 and key in seen:
+            continue
+        seen.add(key)
+        out.append(para)
+    return "\n\n".join(out)
+
+def pack_context(docs: List[Document], model: Optional[str] = None,
+                 budget: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+    """Context block for the prompt and token stats.
+
+    The first CONTEXT_MAX_SNIPPETS docs keep their [n] numbers (the same ones
+    format_citations prints). Snippets from one source become a single block
+    labelled with all their numbers, ordered by chunk_index with the overlap
+    between neighbouring chunks removed; paragraphs already seen in an
+    earlier block are dropped. Blocks are added in rank order until the token
+    budget is spent; the last one may be truncated.
+    """
+    budget = budget if budget is not None else budget_for(model)
+    docs = docs[:CONTEXT_MAX_SNIPPETS]
+    # what the unpacked prompt used to carry, for comparison
+    raw_tokens = count_tokens("\n\n".join(
+        f"[{n}] SOURCE={d.metadata.get('source', 'unknown')}\n{d.page_content}" for n, d in enumerate(docs, start=1)), model)
+
+    groups: Dict[str, List[Tuple[int, Document]]] = {}
+    for n, d in enumerate(docs, start=1):
+        groups.setdefault(d.metadata.get("source", "unknown"), []).append((n, d))
+
+    blocks: List[str] = []
+    seen: set = set()
+    used = 0
+    for source, items in groups.items():  # dict order = rank of each source's best snippet
+        ordered = sorted(items, key=lambda it: (it[1].metadata.get("chunk_index", it[0]), it[0]))
+        text = _join([(d.metadata.get("chunk_index"), d.page_content) for _, d in ordered])
+        text = _dedup_paragraphs(text, seen)
+        label = "".join(f"[{n}]" for n, _ in items)
+        block = f"{label} SOURCE={source}\n{text}"
+        cost = count_tokens(block, model)
+        if used + cost > budget:
+            room = budget - used
+            if room >= _MIN_TAIL_TOKENS:
+                blocks.append(TOKENIZER.truncate(block, room, model) + " …")
+                used = budget
+            break
+        blocks.append(block)
+        used += cost
+
+    stats = {
+        "context_tokens": used,
+        "context_tokens_raw": raw_tokens,
+        "context_budget": budget,
+        "snippets": len(docs),
+        "blocks": len(blocks),
+        "tokenizer": "tiktoken" if TOKENIZER.exact else "approx",
+    }
+    return "\n\n".join(blocks), stats
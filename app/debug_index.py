@@ -1,53 +1,111 @@
 from __future__ import annotations
-from typing import Any, Dict, List
-from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import os
 
-from langchain_chroma import Chroma
-from .state import STATE
-from .rag import make_embeddings
-
-def snapshot(limit: int = 200) -> Dict[str, Any]:
-    vs = Chroma(
-        collection_name=STATE.get("collection_name","skyro_rag"),
-        persist_directory=STATE.get("persist_dir",".chroma"),
-        embedding_function=make_embeddings(),
-    )
-
-    # Try modern chromadb get() signature
-    try:
-        got = vs._collection.get(include=["metadatas","documents"], limit=limit)
-        ids = got.get("ids", [])  # ids are returned even if not requested in include
-        metadatas = got.get("metadatas", []) or []
-        documents = got.get("documents", []) or []
-        n = min(len(ids), len(metadatas), len(documents))
-        items = []
-        for i in range(n):
-            md = metadatas[i] or {}
-            src = md.get("source") or md.get("filename") or ""
-            items.append({
-                "id": ids[i],
-                "source": src,
-                "filename": os.path.basename(str(src)) if src else "",
-            })
-    except Exception as e:
-        # Fallback: derive a snapshot via a sample search
+from .retriever.pool import get_pool
+from .rag import DENSE_BACKEND, DENSE_DTYPE
+
+def snapshot(check: bool = False) -> Dict[str, Any]:
+    """Index stats kept up to date by ingest_paths (manifest), no collection scan.
+
+    ``check=True`` also asks the dense store for its live count, to spot
+    drift between the manifest and the collection.
+    """
+    pool = get_pool()
+    m = pool.manifest()
+    st = m.stats
+    out: Dict[str, Any] = {
+        "index_version": m.version,
+        "embedding_model": m.embedding_model,
+        "dense_backend": DENSE_BACKEND if DENSE_BACKEND != "mmap" else f"mmap/{DENSE_DTYPE}",
+        "count": st.get("chunks", 0),
+        "sources": st.get("sources", 0),
+        "bytes": st.get("bytes", 0),
+        "chunk_bytes": st.get("chunk_bytes", 0),
+        "tokens": st.get("tokens", 0),
+        "sources_without_stats": st.get("sources_without_stats", 0),
+        "dedup": {
+            "duplicates": st.get("duplicates", 0),
+            "duplicate_bytes": st.get("duplicate_bytes", 0),
+            "saved_pct": st.get("dedup_saved_pct", 0.0),
+        },
+        "unique_filenames": st.get("unique_filenames", 0),
+        "top_filenames": st.get("top_filenames", []),
+        "top_sources": [_source_row(s, m.files[s]) for s in st.get("top_sources", []) if s in m.files],
+        "updated_at": st.get("updated_at"),
+    }
+    if check:
         try:
-            docs = vs.similarity_search("status payout provider risk limits oncall postmortem", k=min(50, limit))
-            items = [{
-                "id": f"sample_{i}",
-                "source": (d.metadata or {}).get("source",""),
-                "filename": os.path.basename((d.metadata or {}).get("source","")) if (d.metadata or {}).get("source") else ""
-            } for i, d in enumerate(docs)]
-        except Exception as e2:
-            return {"error": f"cannot inspect collection: {e}; fallback failed: {e2}"}
-
-    by_file = Counter(x["filename"].lower() for x in items if x["filename"])
-    unique_sources = sorted({x["source"] for x in items if x["source"]})
+            vs = pool.vectorstore()
+            coll = getattr(vs, "_collection", None)
+            out["dense_count"] = coll.count() if coll is not None else vs.count()
+        except Exception as e:
+            out["dense_count_error"] = str(e)
+        out["sparse_count"] = len(pool.sparse())
+        out["dedup"].update(pool.dedup().stats())
+    return out
+
+def _source_row(source: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "source": source,
+        "filename": os.path.basename(source),
+        "chunks": entry.get("chunks", len(entry.get("chunk_ids", []))),
+        "bytes": entry.get("size", 0),
+        "chunk_bytes": entry.get("chunk_bytes"),
+        "tokens": entry.get("tokens"),
+        "duplicates": entry.get("duplicates", 0),
+    }
 
+def list_sources(offset: int = 0, limit: int = 100, prefix: str = "") -> Dict[str, Any]:
+    """One page of per-source stats, in manifest order."""
+    files = get_pool().manifest().files
+    sources: List[str] = [s for s in files if s.startswith(prefix)] if prefix else list(files)
+    page = sources[offset:offset + limit]
     return {
-        "count_sampled": len(items),
-        "unique_filenames": len(by_file),
-        "top_filenames": by_file.most_common(20),
-        "sample_sources": unique_sources[:20],
+        "total": len(sources),
+        "offset": offset,
+        "next_offset": offset + len(page) if offset + len(page) < len(sources) else None,
+        "items": [_source_row(s, files[s]) for s in page],
     }
+
+def iter_chunks(source: Optional[str] = None, offset: int = 0, limit: int = 100,
+                text: bool = True) -> Tuple[int, Iterator[Dict[str, Any]]]:
+    """(total, rows) for one page of chunks of ``source`` (or of every source).
+
+    Chunk ids come from the manifest and text/metadata from the BM25 index,
+    which holds every ingested chunk, so the page is read without touching
+    the dense store. Raises KeyError for an unknown source.
+    """
+    pool = get_pool()
+    m = pool.manifest()
+    if source is not None:
+        ids = m.files[source].get("chunk_ids", [])
+        total = len(ids)
+        page = [(source, cid) for cid in ids[offset:offset + limit]]
+    else:
+        # skip whole sources until the offset, so a page costs O(sources), not O(chunks)
+        total, page, pos = m.stats.get("chunks", 0), [], 0
+        for src, e in m.files.items():
+            ids = e.get("chunk_ids", [])
+            if pos + len(ids) > offset and len(page) < limit:
+                lo = max(0, offset - pos)
+                page += [(src, cid) for cid in ids[lo:lo + limit - len(page)]]
+            pos += len(ids)
+            if len(page) >= limit:
+                break
+    sparse = pool.sparse()
+
+    def rows() -> Iterator[Dict[str, Any]]:
+        for src, cid in page:
+            d = sparse.docs.get(cid)
+            row: Dict[str, Any] = {"id": cid, "source": src}
+            if d is None:
+                row["missing"] = True  # in the manifest but not in the sparse index
+            else:
+                row["chunk_index"] = d["metadata"].get("chunk_index")
+                row["chars"] = len(d["text"])
+                if text:
+                    row["text"] = d["text"]
+            yield row
+
+    return total, rows()
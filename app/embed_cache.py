@@ -0,0 +1,179 @@
+from __future__ import annotations
+import hashlib, os, sqlite3, threading, time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from .env import load as load_env
+load_env()
+
+CACHE_PATH = os.getenv("EMBED_CACHE_PATH", ".cache/embeddings.sqlite")
+CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+CACHE_ENABLED = os.getenv("EMBED_CACHE", "1") not in ("0", "false", "no")
+# Hits only record last_used in memory; it reaches SQLite in batches (LRU order is approximate)
+TOUCH_BATCH = int(os.getenv("EMBED_CACHE_TOUCH_BATCH", "1024"))
+TOUCH_FLUSH_S = float(os.getenv("EMBED_CACHE_TOUCH_FLUSH_S", "60"))
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """SQLite store of float32 vectors keyed by (embedding model, normalized text hash).
+
+    Least-recently-used rows are evicted once the table grows past max_entries.
+    A hit does not write: its last_used is buffered and flushed with the next
+    put, or once TOUCH_BATCH hits / TOUCH_FLUSH_S seconds have piled up.
+    """
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._touched: Dict[Tuple[str, str], float] = {}
+        self._touched_since = time.monotonic()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS emb ("
+            " model TEXT NOT NULL, key TEXT NOT NULL, vec BLOB NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS emb_last_used ON emb(last_used)")
+        self._conn.commit()
+
+    def get_many(self, model: str, keys: List[str]) -> List[Optional[List[float]]]:
+        out: List[Optional[List[float]]] = [None] * len(keys)
+        if not keys:
+            return out
+        pos: Dict[str, List[int]] = {}
+        for i, k in enumerate(keys):
+            pos.setdefault(k, []).append(i)
+        uniq = list(pos)
+        now = time.time()
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for s in range(0, len(uniq), 500):
+                part = uniq[s:s + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM emb WHERE model = ? AND key IN ({marks})", [model, *part]
+                ).fetchall()
+                for key, blob in rows:
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    for i in pos[key]:
+                        out[i] = vec.tolist()
+                for key, _ in rows:
+                    self._touched[(model, key)] = now
+            found = sum(1 for v in out if v is not None)
+            self.hits += found
+            self.misses += len(keys) - found
+            if len(self._touched) >= TOUCH_BATCH or time.monotonic() - self._touched_since >= TOUCH_FLUSH_S:
+                self._flush_touched()
+                self._conn.commit()
+        return out
+
+    def _flush_touched(self) -> None:
+        # caller holds the lock and commits
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE emb SET last_used = ? WHERE model = ? AND key = ?",
+                [(t, model, key) for (model, key), t in self._touched.items()],
+            )
+            self._touched = {}
+        self._touched_since = time.monotonic()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+
+    def put_many(self, model: str, keys: List[str], vectors: List[List[float]]) -> None:
+        if not keys:
+            return
+        now = time.time()
+        rows = [(model, k, array("f", v).tobytes(), now) for k, v in zip(keys, vectors)]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO emb VALUES (?, ?, ?, ?)", rows)
+            self._flush_touched()  # so eviction sees current last_used
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self) -> None:
+        n = self._conn.execute("SELECT COUNT(*) FROM emb").fetchone()[0]
+        if n <= self.max_entries:
+            return
+        # Trim to 90% so we don't evict on every insert once full
+        drop = n - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM emb WHERE rowid IN (SELECT rowid FROM emb ORDER BY last_used LIMIT ?)", (drop,)
+        )
+        self._conn.commit()
+        self.evictions += drop
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n = self._conn.execute("SELECT COUNT(*) FROM emb").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": n,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else None,
+            "evictions": self.evictions,
+            "pending_touches": len(self._touched),
+        }
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an Embeddings client; only texts missing from the cache reach it."""
+    def __init__(self, inner: Embeddings, model: str, cache: EmbeddingCache):
+        self.inner = inner
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_key(t) for t in texts]
+        vecs = self.cache.get_many(self.model, keys)
+        miss = [i for i, v in enumerate(vecs) if v is None]
+        if miss:
+            # Embed each distinct missing text once
+            first: Dict[str, int] = {}
+            for i in miss:
+                first.setdefault(keys[i], i)
+            todo = list(first.values())
+            fresh = self.inner.embed_documents([texts[i] for i in todo])
+            self.cache.put_many(self.model, [keys[i] for i in todo], fresh)
+            by_key = {keys[i]: v for i, v in zip(todo, fresh)}
+            for i in miss:
+                vecs[i] = by_key[keys[i]]
+        return vecs  # type: ignore[return-value]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = text_key(text)
+        vec = self.cache.get_many(self.model, [key])[0]
+        if vec is None:
+            vec = self.inner.embed_query(text)
+            self.cache.put_many(self.model, [key], [vec])
+        return vec
+
+_CACHE: Optional[EmbeddingCache] = None
+_CACHE_LOCK = threading.Lock()
+
+def get_embed_cache() -> Optional[EmbeddingCache]:
+    global _CACHE
+    if not CACHE_ENABLED:
+        return None
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = EmbeddingCache()
+    return _CACHE
@@ -1,13 +1,16 @@
 from __future__ import annotations
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import json, math
+import json, sys, time
+
+import numpy as np
 
-from langchain_chroma import Chroma
 from langchain_core.documents import Document
 
-from .state import STATE
-from .rag import make_embeddings  
+from .retriever.pool import get_pool
+from .rag import DENSE_BACKEND, make_vectorstore
+from .metrics import _percentile
 import os
 
 _EQUIV_EXT = {"csv","yaml","yml","txt","md"}
@@ -29,56 +32,6 @@ def _gold_hit(top_sources, gold_paths) -> bool:
     return not top_keys.isdisjoint(gold_keys)
 
 
-class LocalHybridRetriever:
-    def __init__(self, vs: Chroma, bm25=None, top_k: int = 8):
-        self.vs = vs
-        self.bm25 = bm25
-        self.top_k = top_k
-        # If the BM25 retriever supports a .k attribute, set it
-        try:
-            if hasattr(self.bm25, "k"):
-                self.bm25.k = top_k
-        except Exception:
-            pass
-
-    def _bm25_docs(self, query: str):
-        if not self.bm25:
-            return []
-        try:
-            # Newer API (Runnable)
-            if hasattr(self.bm25, "invoke"):
-                res = self.bm25.invoke(query)
-            # Older API
-            elif hasattr(self.bm25, "get_relevant_documents"):
-                res = self.bm25.get_relevant_documents(query)
-            else:
-                res = []
-        except Exception:
-            res = []
-        # Ensure list and truncate
-        if not isinstance(res, list):
-            res = list(res) if res is not None else []
-        return res[: self.top_k]
-
-    def get_relevant_documents(self, query: str) -> List[Document]:
-        # Dense
-        try:
-            dense_docs = self.vs.similarity_search(query, k=self.top_k) or []
-        except Exception:
-            dense_docs = []
-        # Sparse (BM25)
-        bm25_docs = self._bm25_docs(query)
-
-        # Simple fusion + dedup
-        seen, out = set(), []
-        for d in dense_docs + bm25_docs:
-            key = (d.metadata.get("source"), d.page_content[:160])
-            if key in seen:
-                continue
-            seen.add(key)
-            out.append(d)
-        return out[: self.top_k]
-
 def _dcg(rel):
     import math
     return sum(r / math.log2(i + 2) for i, r in enumerate(rel))
@@ -92,35 +45,224 @@ def _ndcg_at_k(sources, gold, k=8):
     idcg = _dcg(sorted(rel, reverse=True))
     return 0.0 if idcg == 0 else _dcg(rel) / idcg
 
-def _build_retriever(top_k: int = 8) -> LocalHybridRetriever:
-    vs = Chroma(
-        collection_name=STATE.get("collection_name", "skyro_rag"),
-        persist_directory=STATE.get("persist_dir", ".chroma"),
-        embedding_function=make_embeddings(),
-    )
-    return LocalHybridRetriever(vs=vs, bm25=STATE.get("bm25"), top_k=top_k)
+FUSIONS = ("concat", "interleave", "rrf", "dense", "sparse")
+BACKENDS = ("chroma", "mmap", "bundle")
+EVAL_WORKERS = int(os.getenv("EVAL_WORKERS", "8"))
+_RRF_K = 60
 
-def run_eval(k: int = 8, path: str = "eval/questions.jsonl") -> Dict[str, Any]:
-    retriever = _build_retriever(top_k=k)
-    items = [json.loads(l) for l in Path(path).read_text(encoding="utf-8").splitlines() if l.strip()]
+def _doc_key(d: Document):
+    return d.metadata.get("chunk_id") or (d.metadata.get("source"), d.page_content[:160])
+
+def _dedup(docs: List[Document], k: int) -> List[Document]:
+    seen, out = set(), []
+    for d in docs:
+        key = _doc_key(d)
+        if key not in seen:
+            seen.add(key)
+            out.append(d)
+            if len(out) >= k:
+                break
+    return out
+
+def fuse(dense: List[Document], sparse: List[Document], k: int, strategy: str = "concat") -> List[Document]:
+    """Combine cached candidate lists. ``concat`` is dense-then-sparse with
+    dedup, ``interleave`` is what /ask uses (SimpleHybridRetriever._fuse)."""
+    dense, sparse = dense[:k], sparse[:k]
+    if strategy == "concat":
+        return _dedup(dense + sparse, k)
+    if strategy == "interleave":
+        mixed = [d for pair in zip(sparse, dense) for d in pair]
+        n = min(len(sparse), len(dense))
+        return _dedup(mixed + sparse[n:] + dense[n:] + dense + sparse, k)
+    if strategy == "rrf":
+        scores: Dict[Any, float] = {}
+        first: Dict[Any, Document] = {}
+        for lst in (dense, sparse):
+            for rank, d in enumerate(lst):
+                key = _doc_key(d)
+                scores[key] = scores.get(key, 0.0) + 1.0 / (_RRF_K + rank + 1)
+                first.setdefault(key, d)
+        return [first[key] for key in sorted(scores, key=scores.get, reverse=True)[:k]]
+    if strategy == "dense":
+        return _dedup(dense, k)
+    if strategy == "sparse":
+        return _dedup(sparse, k)
+    raise ValueError(f"unknown fusion {strategy!r}; use one of {list(FUSIONS)}")
+
+def load_items(path: str = "eval/questions.jsonl") -> List[Dict[str, Any]]:
+    return [json.loads(l) for l in Path(path).read_text(encoding="utf-8").splitlines() if l.strip()]
+
+def _pcts(values: List[float]) -> Dict[str, float]:
+    return {"p50": round(_percentile(values, 50), 3), "p95": round(_percentile(values, 95), 3)}
+
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    res = fn(*args, **kwargs)
+    return res, (time.perf_counter() - t0) * 1000
+
+def _vectorstore(backend: str):
+    pool = get_pool()
+    if backend == "bundle":  # the float16 mmap snapshot /ask serves from
+        bundle = pool.bundle()
+        if bundle is None:
+            raise ValueError("the live index generation has no bundle (RAG_BUNDLE=0 or not re-ingested yet)")
+        return bundle
+    if backend == DENSE_BACKEND:
+        return pool.vectorstore()
+    return make_vectorstore(pool.embeddings(), backend=backend, index_dir=pool.index_dir())
+
+def collect_candidates(items: List[Dict[str, Any]], kmax: int, backends: List[str],
+                       workers: int = EVAL_WORKERS, progress: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Run retrieval once per question at depth ``kmax``; every (k, fusion)
+    config is then scored from these lists without touching the index again."""
+    progress = progress if progress is not None else {}
+    questions = [it["q"] for it in items]
+    pool = get_pool()
+
+    progress["stage"] = "embed"
+    vecs, embed_ms = _timed(pool.embeddings().embed_documents, questions)  # one batched call
+    sparse = pool.sparse()
+
+    out: Dict[str, Any] = {"embed_ms": embed_ms, "dense": {}, "dense_ms": {}}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        progress["stage"] = "sparse"
+        res = list(ex.map(lambda q: _timed(sparse.search, q, k=kmax), questions))
+        out["sparse"] = [r for r, _ in res]
+        out["sparse_ms"] = [ms for _, ms in res]
+        for b in backends:
+            progress["stage"] = f"dense:{b}"
+            vs = _vectorstore(b)
+            if hasattr(vs, "search_by_vectors"):
+                # mmap backend scores all questions in one matmul; per-question time is amortized
+                lists, ms = _timed(vs.search_by_vectors, np.asarray(vecs, dtype=np.float32), k=kmax)
+                out["dense"][b], out["dense_ms"][b] = lists, [ms / max(1, len(questions))] * len(questions)
+            else:
+                res = list(ex.map(lambda v: _timed(vs.similarity_search_by_vector, v, k=kmax), vecs))
+                out["dense"][b], out["dense_ms"][b] = [r for r, _ in res], [ms for _, ms in res]
+    return out
+
+def _matched_source(d: Document, gold, dedup) -> str:
+    # a chunk deduplicated at ingest stands for its alias sources too
+    src = d.metadata.get("source", "")
+    if dedup is None or _gold_hit([src], gold):
+        return src
+    return next((a for a in dedup.alias_sources(d.metadata.get("chunk_id", "")) if _gold_hit([a], gold)), src)
+
+def _score(items: List[Dict[str, Any]], docs_per_q: List[List[Document]], k: int) -> Dict[str, float]:
     n = len(items)
     hits = grounded_hits = 0
     ndcgs: List[float] = []
-    for it in items:
-        q, gold, must = it["q"], it["gold"], it.get("must_contain", [])
-        docs = retriever.get_relevant_documents(q)
-        sources = [d.metadata.get("source","") for d in docs]
-        if _gold_hit(sources[:k], gold):
-            hits += 1
+    dedup = get_pool().dedup()
+    for it, docs in zip(items, docs_per_q):
+        gold, must = it["gold"], it.get("must_contain", [])
+        sources = [_matched_source(d, gold, dedup) for d in docs]
+        hit = _gold_hit(sources[:k], gold)
+        hits += 1 if hit else 0
         ndcgs.append(_ndcg_at_k(sources, gold, k=k))
-
         context = " ".join(d.page_content for d in docs[:k])[:20000].lower()
-        grounded = (_gold_hit(sources[:k], gold) and all(m.lower() in context for m in must))
-
-        grounded_hits += 1 if grounded else 0
+        grounded_hits += 1 if (hit and all(m.lower() in context for m in must)) else 0
     return {
-        f"n": n,
         f"recall@{k}": hits / n if n else 0.0,
         f"mean_nDCG@{k}": (sum(ndcgs) / n) if n else 0.0,
         f"groundedness@{k}": grounded_hits / n if n else 0.0,
     }
+
+def _check_sweep(ks, fusions, backends):
+    ks = sorted({int(k) for k in ks})
+    backends = list(backends or [get_pool().serving_backend()])  # default: what /ask serves from
+    for f in fusions:
+        if f not in FUSIONS:
+            raise ValueError(f"unknown fusion {f!r}; use one of {list(FUSIONS)}")
+    for b in backends:
+        if b not in BACKENDS:
+            raise ValueError(f"unknown backend {b!r}; use one of {list(BACKENDS)}")
+    if not ks or ks[0] < 1:
+        raise ValueError("k must be >= 1")
+    return ks, backends
+
+def run_sweep(ks: List[int] = (8,), fusions: List[str] = ("concat",), backends: Optional[List[str]] = None,
+              path: str = "eval/questions.jsonl", workers: int = EVAL_WORKERS,
+              progress: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Score every (backend, fusion, k) combination from one retrieval pass."""
+    ks, backends = _check_sweep(ks, fusions, backends)
+    progress = progress if progress is not None else {}
+
+    items = load_items(path)
+    t0 = time.perf_counter()
+    cand = collect_candidates(items, ks[-1], backends, workers=workers, progress=progress)
+    n = len(items)
+
+    progress["stage"] = "score"
+    runs = []
+    for b in backends:
+        for f in fusions:
+            for k in ks:
+                fused = [_timed(fuse, dense, sp, k, f) for dense, sp in zip(cand["dense"][b], cand["sparse"])]
+                fuse_ms = [ms for _, ms in fused]
+                # per-question retrieval = dense + sparse + fusion (+ its share of the batched embed)
+                per_q_embed = cand["embed_ms"] / n if n else 0.0
+                retrieval_ms = [
+                    per_q_embed + (dm if f != "sparse" else 0.0) + (sm if f != "dense" else 0.0) + fm
+                    for dm, sm, fm in zip(cand["dense_ms"][b], cand["sparse_ms"], fuse_ms)
+                ]
+                runs.append({
+                    "backend": b, "fusion": f, "k": k,
+                    **_score(items, [d for d, _ in fused], k),
+                    "fuse_ms": _pcts(fuse_ms),
+                    "retrieval_ms": _pcts(retrieval_ms),
+                })
+    progress["stage"] = "done"
+    return {
+        "n": n,
+        "path": path,
+        "kmax": ks[-1],
+        "stages": {
+            "embed_ms": {"total": round(cand["embed_ms"], 3), "per_question": round(cand["embed_ms"] / n, 3) if n else 0.0},
+            "sparse_ms": _pcts(cand["sparse_ms"]),
+            "dense_ms": {b: _pcts(ms) for b, ms in cand["dense_ms"].items()},
+        },
+        "total_ms": round((time.perf_counter() - t0) * 1000, 3),
+        "runs": runs,
+    }
+
+def run_eval(k: int = 8, path: str = "eval/questions.jsonl") -> Dict[str, Any]:
+    res = run_sweep(ks=[k], fusions=["concat"], path=path)
+    run = res["runs"][0]
+    return {
+        "n": res["n"],
+        f"recall@{k}": run[f"recall@{k}"],
+        f"mean_nDCG@{k}": run[f"mean_nDCG@{k}"],
+        f"groundedness@{k}": run[f"groundedness@{k}"],
+        "stages": {**res["stages"], "retrieval_ms": run["retrieval_ms"]},
+    }
+
+def submit_eval_job(ks: List[int], fusions: List[str], backends: Optional[List[str]] = None,
+                    path: str = "eval/questions.jsonl"):
+    from .jobs import get_jobs
+    _, backends = _check_sweep(ks, fusions, backends)  # reject bad params before queueing
+    params = {"k": list(ks), "fusion": list(fusions), "backend": backends, "path": path}
+    return get_jobs().submit(
+        "eval",
+        lambda job: run_sweep(ks, fusions, backends, path=path, progress=job.progress),
+        params,
+    )
+
+def main(argv=None) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Retrieval eval: sweep k / fusion / dense backend in one pass.")
+    ap.add_argument("--k", type=int, nargs="+", default=[8])
+    ap.add_argument("--fusion", nargs="+", default=["concat"], choices=FUSIONS)
+    ap.add_argument("--backend", nargs="+", default=None, choices=BACKENDS)
+    ap.add_argument("--path", default="eval/questions.jsonl")
+    ap.add_argument("--workers", type=int, default=EVAL_WORKERS)
+    ap.add_argument("--out", default="")
+    args = ap.parse_args(argv)
+    res = run_sweep(args.k, args.fusion, args.backend, path=args.path, workers=args.workers)
+    text = json.dumps(res, indent=2)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,315 @@
+from __future__ import annotations
+import asyncio, atexit, fcntl, gzip, os, queue, re, shutil, threading, time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from .env import load as load_env
+load_env()
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH = int(os.getenv("LOG_BATCH", "256"))
+LOG_FLUSH_INTERVAL_S = float(os.getenv("LOG_FLUSH_INTERVAL_S", "0.5"))
+LOG_ROTATE_BYTES = int(os.getenv("LOG_ROTATE_BYTES", str(64 * 1024 * 1024)))  # 0 -> never
+LOG_ROTATE_S = float(os.getenv("LOG_ROTATE_S", "0"))                           # 0 -> never
+LOG_COMPRESS = os.getenv("LOG_COMPRESS", "1") not in ("0", "false", "no")
+# "block": wait up to LOG_BLOCK_TIMEOUT_S for room, then drop; "drop": drop immediately.
+# On an event loop "block" never waits inline: the wait moves to the default executor.
+LOG_QUEUE_POLICY = os.getenv("LOG_QUEUE_POLICY", "block")
+LOG_BLOCK_TIMEOUT_S = float(os.getenv("LOG_BLOCK_TIMEOUT_S", "0.05"))
+
+# --- segments ---
+# The active file is <name>; rotation renames it to <name>.<seq> (seq grows
+# by one each time), optionally gzipped afterwards to <name>.<seq>.gz.
+
+def _segment_re(path: Path) -> "re.Pattern[str]":
+    return re.compile(re.escape(path.name) + r"\.(\d+)(\.gz)?$")
+
+def rotated_segments(path: Path) -> List[Path]:
+    """Rotated segments of ``path``, oldest first (one entry per seq)."""
+    if not path.parent.exists():
+        return []
+    pat = _segment_re(path)
+    by_seq: Dict[int, Path] = {}
+    for p in path.parent.iterdir():
+        m = pat.match(p.name)
+        if m:
+            seq = int(m.group(1))
+            # while compressing both exist for a moment; the plain file is complete
+            if seq not in by_seq or not m.group(2):
+                by_seq[seq] = p
+    return [by_seq[s] for s in sorted(by_seq)]
+
+def segment_seq(path: Path, segment: Path) -> int:
+    m = _segment_re(path).match(segment.name)
+    return int(m.group(1)) if m else -1
+
+def next_seq(path: Path) -> int:
+    segs = rotated_segments(path)
+    return segment_seq(path, segs[-1]) + 1 if segs else 1
+
+def find_segment(path: Path, seq: int) -> Optional[Path]:
+    plain = path.with_name(f"{path.name}.{seq}")
+    if plain.exists():
+        return plain
+    gz = path.with_name(f"{path.name}.{seq}.gz")
+    return gz if gz.exists() else None
+
+def open_segment(p: Path, mode: str = "rb"):
+    return gzip.open(p, mode) if p.suffix == ".gz" else p.open(mode)
+
+def all_segments(path: Path) -> List[Path]:
+    """Rotated segments then the active file — i.e. the whole log in order."""
+    return rotated_segments(path) + ([path] if path.exists() else [])
+
+@contextmanager
+def _flock(path: Path, op: int):
+    """fcntl lock on ``<name>.lock``, shared by every process writing ``path``.
+
+    Writers hold it shared while appending, rotation holds it exclusive, so
+    no worker appends to a segment that another worker has just rotated out.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path.with_name(path.name + ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, op)
+        yield
+    finally:
+        os.close(fd)  # releases the lock
+
+# --- writer ---
+
+class EventLogWriter:
+    """Background JSONL writer: bounded queue, batched writes, rotation.
+
+    Callers only enqueue a serialized line; one thread owns the open file,
+    writes whatever has queued up (up to ``batch``) in one go and flushes at
+    least every ``flush_interval_s``. When the queue is full the line is
+    dropped (after a short wait under the "block" policy) and counted.
+    Several processes may share one path; see ``_flock``.
+    """
+    def __init__(self, path: Path, queue_size: int = LOG_QUEUE_SIZE, batch: int = LOG_BATCH,
+                 flush_interval_s: float = LOG_FLUSH_INTERVAL_S, rotate_bytes: int = LOG_ROTATE_BYTES,
+                 rotate_s: float = LOG_ROTATE_S, compress: bool = LOG_COMPRESS,
+                 policy: str = LOG_QUEUE_POLICY, block_timeout_s: float = LOG_BLOCK_TIMEOUT_S):
+        self.path = Path(path)
+        self.batch = batch
+        self.flush_interval_s = flush_interval_s
+        self.rotate_bytes = rotate_bytes
+        self.rotate_s = rotate_s
+        self.compress = compress
+        self.policy = policy
+        self.block_timeout_s = block_timeout_s
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self._q: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._f = None
+        self._opened_at = 0.0
+        self._closed = False
+        self._deferred = 0  # blocking puts handed off to the executor
+        self._deferred_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"event-log:{self.path.name}", daemon=True)
+        self._thread.start()
+
+    def write(self, line: str) -> bool:
+        if self._closed:
+            return False
+        try:
+            self._q.put_nowait(line)
+            return True
+        except queue.Full:
+            pass
+        if self.policy == "block":
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return self._put_blocking(line)
+            # never stall the loop: wait for room on an executor thread
+            with self._deferred_lock:
+                if self._deferred < self.batch:
+                    self._deferred += 1
+                    loop.run_in_executor(None, self._put_deferred, line)
+                    return True
+        self.dropped += 1
+        return False
+
+    def _put_blocking(self, line: str) -> bool:
+        try:
+            self._q.put(line, timeout=self.block_timeout_s)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _put_deferred(self, line: str) -> None:
+        try:
+            self._put_blocking(line)
+        finally:
+            with self._deferred_lock:
+                self._deferred -= 1
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Block until everything queued before this call is on disk."""
+        if self._closed or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        try:
+            self._q.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        self._q.put(None)
+        self._thread.join(timeout)
+
+    # --- writer thread ---
+
+    def _open(self):
+        if self._f is not None and not self._is_current(self._f):
+            # another process rotated the file away; follow it to the new one
+            self._f.close()
+            self._f = None
+        if self._f is None:
+            self._f = self.path.open("a", encoding="utf-8")
+            self._opened_at = time.time()
+        return self._f
+
+    def _is_current(self, f) -> bool:
+        try:
+            return os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _write(self, lines: List[str]) -> None:
+        with _flock(self.path, fcntl.LOCK_SH):
+            f = self._open()
+            f.write("".join(lines))
+            f.flush()
+
+    def _maybe_rotate(self) -> None:
+        f = self._f
+        if f is None:
+            return
+        size = os.fstat(f.fileno()).st_size  # the file is shared: tell() only knows our writes
+        too_big = self.rotate_bytes and size >= self.rotate_bytes
+        too_old = self.rotate_s and size and time.time() - self._opened_at >= self.rotate_s
+        if not (too_big or too_old):
+            return
+        with _flock(self.path, fcntl.LOCK_EX):
+            current = self._is_current(f)
+            f.close()
+            self._f = None
+            if not current:
+                return  # another worker rotated it first
+            target = self.path.with_name(f"{self.path.name}.{next_seq(self.path)}")
+            os.replace(self.path, target)
+        self.rotations += 1
+        if self.compress:
+            threading.Thread(target=_gzip_segment, args=(target,), daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self._q.get(timeout=self.flush_interval_s)
+            except queue.Empty:
+                self._maybe_rotate()
+                continue
+            lines: List[str] = []
+            waiters: List[threading.Event] = []
+            stop = False
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    lines.append(item)
+                if stop or len(lines) >= self.batch:
+                    break
+                try:
+                    item = self._q.get_nowait()
+                except queue.Empty:
+                    break
+            if lines:
+                try:
+                    self._write(lines)
+                    self.written += len(lines)
+                except OSError:
+                    self.dropped += len(lines)
+                self._maybe_rotate()
+            for w in waiters:
+                w.set()
+            if stop:
+                if self._f is not None:
+                    self._f.close()
+                    self._f = None
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "queued": self._q.qsize() + self._deferred,
+            "written": self.written,
+            "dropped": self.dropped,
+            "rotations": self.rotations,
+            "policy": self.policy,
+        }
+
+def _gzip_segment(p: Path) -> None:
+    gz = p.with_name(p.name + ".gz")
+    tmp = p.with_name(p.name + ".gz.tmp")
+    try:
+        with p.open("rb") as src, gzip.open(tmp, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp, gz)
+        p.unlink()
+    except OSError:
+        tmp.unlink(missing_ok=True)
+
+_WRITERS: Dict[str, EventLogWriter] = {}
+_WRITERS_LOCK = threading.Lock()
+
+def get_writer(path: Path) -> EventLogWriter:
+    key = str(Path(path).resolve())
+    w = _WRITERS.get(key)
+    if w is None:
+        with _WRITERS_LOCK:
+            w = _WRITERS.get(key)
+            if w is None:
+                w = _WRITERS[key] = EventLogWriter(Path(path))
+    return w
+
+def flush_writer(path: Path) -> None:
+    """Flush the in-process writer for ``path``, if there is one."""
+    w = _WRITERS.get(str(Path(path).resolve()))
+    if w is not None:
+        w.flush()
+
+def close_writers() -> None:
+    with _WRITERS_LOCK:
+        writers = list(_WRITERS.values())
+        _WRITERS.clear()
+    for w in writers:
+        w.close()
+
+def writer_stats() -> List[Dict[str, Any]]:
+    return [w.stats() for w in list(_WRITERS.values())]
+
+atexit.register(close_writers)
+
+def iter_lines(path: Path) -> Iterator[bytes]:
+    """Every line of the log across rotated segments, oldest first."""
+    for seg in all_segments(path):
+        if not seg.exists() and seg.suffix != ".gz":
+            seg = seg.with_name(seg.name + ".gz")  # compressed between listing and opening
+        try:
+            with open_segment(seg) as f:
+                yield from f
+        except FileNotFoundError:
+            continue
@@ -0,0 +1,164 @@
+from __future__ import annotations
+import os, pickle, threading, zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from ..rag import active_index_dir
+from ..retriever.sparse import tokenize
+
+# Near-duplicate chunks (copied meeting notes, runbook boilerplate) are stored
+# once: the first chunk of a cluster is canonical, later ones become aliases
+# (source + chunk id) that citations list next to it. DEDUP=0 turns it off.
+DEDUP_ENABLED = os.getenv("DEDUP", "1") != "0"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))  # estimated Jaccard of word shingles
+SHINGLE = 3
+BANDS, ROWS = 16, 8  # 128 MinHash values; LSH candidates from ~0.7 Jaccard up
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(1)  # fixed: signatures must match across runs and processes
+_A = _rng.randint(1, _PRIME, size=BANDS * ROWS).astype(np.uint64)
+_B = _rng.randint(0, _PRIME, size=BANDS * ROWS).astype(np.uint64)
+
+def signature(text: str) -> Optional[np.ndarray]:
+    """MinHash of the chunk's word 3-shingles (None for chunks without words)."""
+    words = tokenize(text)
+    if not words:
+        return None
+    shingles = {" ".join(words[i:i + SHINGLE]) for i in range(max(1, len(words) - SHINGLE + 1))}
+    x = np.fromiter((zlib.crc32(s.encode("utf-8")) & _PRIME for s in shingles), dtype=np.uint64, count=len(shingles))
+    return ((_A[:, None] * x[None, :] + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+class DedupIndex:
+    """LSH over MinHash signatures of canonical chunks, plus the alias map.
+
+    Persisted next to the BM25 index of each generation (``dedup.pkl``).
+    Clusters never span teams, so team-filtered search still finds every
+    team's copy of shared boilerplate.
+    """
+    FORMAT = 1
+
+    def __init__(self, path: Optional[str] = None, threshold: float = DEDUP_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.RLock()
+        self.sigs: Dict[str, np.ndarray] = {}                      # canonical chunk_id -> signature
+        self.meta: Dict[str, Tuple[str, str]] = {}                  # canonical chunk_id -> (source, team)
+        self.buckets: Dict[Tuple[int, str, bytes], List[str]] = {}  # (band, team, band bytes) -> [chunk_id]
+        self.aliases: Dict[str, List[Tuple[str, str]]] = {}         # canonical -> [(source, chunk_id)]
+
+    def __len__(self) -> int:
+        return len(self.sigs)
+
+    def _keys(self, sig: np.ndarray, team: str):
+        for b in range(BANDS):
+            yield (b, team, sig[b * ROWS:(b + 1) * ROWS].tobytes())
+
+    def _match(self, sig: np.ndarray, team: str) -> Optional[str]:
+        best, best_j = None, self.threshold
+        seen: Set[str] = set()
+        for key in self._keys(sig, team):
+            for cid in self.buckets.get(key, ()):
+                if cid in seen:
+                    continue
+                seen.add(cid)
+                j = float(np.mean(self.sigs[cid] == sig))
+                if j >= best_j:
+                    best, best_j = cid, j
+        return best
+
+    def filter(self, chunks: List[Document]) -> Tuple[List[Document], List[Document]]:
+        """Split ``chunks`` into (kept, duplicates); kept ones become canonical,
+        each duplicate is recorded as an alias of the chunk it matched."""
+        kept, dups = [], []
+        with self._lock:
+            for c in chunks:
+                cid, source = c.metadata["chunk_id"], c.metadata["source"]
+                team = str(c.metadata.get("team", ""))
+                sig = signature(c.page_content)
+                canonical = None if sig is None else self._match(sig, team)
+                if canonical is None or canonical == cid:
+                    kept.append(c)
+                    if sig is not None and cid not in self.sigs:
+                        self.sigs[cid] = sig
+                        self.meta[cid] = (source, team)
+                        for key in self._keys(sig, team):
+                            self.buckets.setdefault(key, []).append(cid)
+                    continue
+                c.metadata["duplicate_of"] = canonical
+                self.aliases.setdefault(canonical, []).append((source, cid))
+                dups.append(c)
+        return kept, dups
+
+    def delete_sources(self, sources: List[str]) -> Set[str]:
+        """Forget ``sources`` (their canonicals and their aliases).
+
+        Returns the other sources that had aliases of a dropped canonical:
+        those chunks are no longer in the index, so the caller re-ingests them.
+        """
+        drop = set(sources)
+        orphaned: Set[str] = set()
+        with self._lock:
+            for cid in [c for c, (src, _) in self.meta.items() if src in drop]:
+                sig = self.sigs.pop(cid)
+                _, team = self.meta.pop(cid)
+                for key in self._keys(sig, team):
+                    ids = self.buckets.get(key)
+                    if ids is not None:
+                        ids.remove(cid)
+                        if not ids:
+                            del self.buckets[key]
+                orphaned.update(src for src, _ in self.aliases.pop(cid, []) if src not in drop)
+            for cid in list(self.aliases):
+                kept = [a for a in self.aliases[cid] if a[0] not in drop]
+                if kept:
+                    self.aliases[cid] = kept
+                else:
+                    del self.aliases[cid]
+        return orphaned
+
+    def alias_sources(self, chunk_id: str) -> List[str]:
+        """Other sources holding a near-copy of ``chunk_id`` (for citations)."""
+        own = self.meta.get(chunk_id, ("",))[0]
+        return list(dict.fromkeys(src for src, _ in self.aliases.get(chunk_id, ()) if src != own))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "canonical_chunks": len(self.sigs),
+                "clusters": len(self.aliases),
+                "aliases": sum(len(v) for v in self.aliases.values()),
+                "threshold": self.threshold,
+            }
+
+    # --- persistence ---
+
+    def save(self, path: Optional[str] = None) -> None:
+        path = path or self.path
+        if not path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            payload = {"format": self.FORMAT, "sigs": self.sigs, "meta": self.meta, "aliases": self.aliases}
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "DedupIndex":
+        idx = cls(path=path)
+        if not os.path.exists(path):
+            return idx
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+        if payload.get("format") != cls.FORMAT:
+            return idx
+        idx.sigs, idx.meta, idx.aliases = payload["sigs"], payload["meta"], payload["aliases"]
+        for cid, sig in idx.sigs.items():  # buckets are derived, so not stored
+            for key in idx._keys(sig, idx.meta[cid][1]):
+                idx.buckets.setdefault(key, []).append(cid)
+        return idx
+
+def dedup_path(index_dir: Optional[str] = None) -> str:
+    return os.path.join(index_dir or active_index_dir(), "dedup.pkl")
@@ -1,24 +1,174 @@
 from __future__ import annotations
-from typing import List
-from langchain_core.documents import Document 
-from .loaders import load_path
-from ..rag import chunk_docs, build_or_load_vectorstore, bm25_from_docs
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .dedup import DEDUP_ENABLED, DedupIndex, dedup_path
+from .manifest import Manifest, file_sha256, manifest_path
+from .pipeline import IO_WORKERS, discover_files, run_pipeline
+from .staging import discard, prune, publish, stage, write_lock
+from ..rag import (
+    BUNDLE_ENABLED, SHARED_TEAM, active_index_dir, bundle_path, delete_sources, load_sparse_index, make_vectorstore,
+    normalize_team,
+)
+from ..retriever.bundle import IndexBundle, write_bundle
+from ..retriever.pool import get_pool
 
-def ingest_paths(paths: List[str]):
-    # 1) загрузка
-    raw_docs: List[Document] = []
-    for p in paths:
-        raw_docs += load_path(p)
+def _check(manifest: Manifest, path: str, team: str) -> Tuple[str, str, os.stat_result, Optional[str]]:
+    # -> (path, source, stat, sha256 or None when the file is unchanged)
+    source = os.path.relpath(path)
+    st = os.stat(path)
+    prev = manifest.files.get(source)
+    same_team = bool(prev) and prev.get("team") == team  # другая команда = перетегировать чанки
+    if same_team and manifest.is_fresh(source, st):
+        return path, source, st, None
+    digest = file_sha256(path)
+    if same_team and prev["sha256"] == digest:
+        # touched but identical: only refresh the stat fields
+        prev.update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+        return path, source, st, None
+    return path, source, st, digest
 
-    if not raw_docs:
-        return {"indexed": 0, "chunks": 0}
+def _orphans(dedup: DedupIndex, manifest: Manifest, dropped: List[str]):
+    """Sources whose duplicates pointed at chunks of ``dropped`` sources.
 
-    # 2) чанкинг
-    chunks = chunk_docs(raw_docs)
+    Those duplicates were never written, so the sources are re-ingested in
+    full; that drops their own canonicals too, hence the loop.
+    -> (files to re-ingest as _check() tuples, sources whose file is gone)
+    """
+    gone, frontier = set(dropped), set(dropped)
+    again, missing = [], []
+    while frontier:
+        frontier = {s for s in dedup.delete_sources(sorted(frontier)) if s not in gone and s in manifest.files}
+        gone |= frontier
+        for source in sorted(frontier):
+            if os.path.isfile(source):
+                again.append((source, source, os.stat(source), file_sha256(source)))
+            else:
+                missing.append(source)
+    return again, missing
 
-    # 3) upsert в векторку
-    vs = build_or_load_vectorstore(chunks)
+def ingest_paths(paths: List[str], parse_workers: Optional[int] = None, team: Optional[str] = None,
+                 progress: Optional[Callable[[Dict[str, int]], None]] = None,
+                 check_cancelled: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """Index ``paths`` incrementally; every chunk is tagged with ``team`` (default: shared).
 
-    # 4) BM25 для гибридного поиска
-    bm25 = bm25_from_docs(chunks)
-    return {"indexed": len(raw_docs), "chunks": len(chunks), "bm25": bm25}
+    Changes are written into a staged copy of the live index and published
+    with one atomic swap, so /ask never sees a half-built index; on error or
+    cancellation the staged copy is dropped and the live index is untouched.
+    """
+    team = normalize_team(team) or SHARED_TEAM
+    with write_lock():
+        return _ingest(paths, parse_workers, team, progress, check_cancelled)
+
+def _ingest(paths, parse_workers, team, progress, check_cancelled) -> Dict[str, Any]:
+    manifest = Manifest.load(manifest_path(active_index_dir()))
+
+    # 1) обход (параллельно): сравниваем с манифестом (size/mtime, затем sha256)
+    roots = [os.path.relpath(p.strip()) for p in paths]
+    files = list(dict.fromkeys(discover_files(paths)))
+    with ThreadPoolExecutor(max_workers=max(1, IO_WORKERS)) as ex:
+        checked = list(ex.map(lambda f: _check(manifest, f, team), files))
+    seen = {source for _, source, _, _ in checked}
+    todo = [c for c in checked if c[3] is not None]
+    added = [source for _, source, _, _ in todo if source not in manifest.files]
+    updated = [source for _, source, _, _ in todo if source in manifest.files]
+    unchanged = len(checked) - len(todo)
+    removed = [s for s in manifest.sources_under(roots) if s not in seen]
+
+    if not todo and not removed:
+        manifest.save()  # только обновлённые stat-поля, индекс не меняется
+        return {"indexed": 0, "chunks": 0, "added": [], "updated": [], "removed": [], "unchanged": unchanged, "team": team}
+    if check_cancelled is not None:
+        check_cancelled()
+
+    # 2) пишем в копию живого индекса (новое поколение); /ask читает старое до publish()
+    pool = get_pool()
+    staging_dir = stage()
+    try:
+        manifest.path = manifest_path(staging_dir)
+        vs = make_vectorstore(pool.embeddings(), index_dir=staging_dir)
+        bm25 = load_sparse_index(staging_dir)
+        dedup = DedupIndex.load(dedup_path(staging_dir))  # loaded even with DEDUP=0: old aliases still count
+
+        # дубликаты, ссылавшиеся на уходящие чанки, переиндексируются вместе с ними
+        again, missing = _orphans(dedup, manifest, updated + removed)
+        removed += missing
+        teams = {source: manifest.files[source].get("team") or SHARED_TEAM for _, source, _, _ in again}
+        todo += again
+
+        # старые чанки изменённых/удалённых файлов удаляются по source
+        stale = updated + removed + list(teams)
+        delete_sources(vs, stale)
+        for source in stale:
+            bm25.delete_source(source)  # файл мог стать пустым: новых чанков не будет
+        for source in removed:
+            manifest.files.pop(source, None)
+
+        # 3) загрузка -> чанкинг -> эмбеддинги/upsert потоком, id чанков детерминированы
+        kwargs = {} if parse_workers is None else {"parse_workers": parse_workers}
+        source_stats: Dict[str, Dict[str, int]] = {}
+        chunk_ids, stages = run_pipeline([(path, source) for path, source, _, _ in todo], vs, bm25,
+                                         source_stats=source_stats, team=team, progress=progress,
+                                         check_cancelled=check_cancelled, dedup=dedup if DEDUP_ENABLED else None,
+                                         source_teams=teams,
+                                         **kwargs)
+        bm25.save()
+        dedup.save()
+
+        # 4) манифест хранит и статистику по файлам: /debug/index читает её, а не коллекцию
+        for path, source, st, digest in todo:
+            manifest.files[source] = {
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "sha256": digest,
+                "chunk_ids": chunk_ids.get(source, []),
+                "team": teams.get(source, team),
+                **source_stats.get(source, {"chunks": 0, "chunk_bytes": 0, "tokens": 0}),
+            }
+        manifest.embedding_model = getattr(pool.embeddings(), "model", None)
+        manifest.bump()
+        manifest.save()
+
+        # 5) read-only mmap-бандл для обслуживания /ask всеми воркерами
+        bundle = None
+        if BUNDLE_ENABLED:
+            header = write_bundle(bundle_path(staging_dir), bm25, vs, manifest.version)
+            if header is not None:
+                stages["bundle"] = {"items": header["chunks"], "busy_s": round(header["export_ms"] / 1000, 3)}
+                bundle = IndexBundle.open(bundle_path(staging_dir), pool.embeddings())
+        if check_cancelled is not None:
+            check_cancelled()  # последний шанс отменить: дальше поколение становится живым
+    except BaseException:
+        discard(staging_dir)
+        raise
+
+    # 6) атомарная подмена: CURRENT -> новое поколение, пул берёт уже прогретые хэндлы;
+    # остальные воркеры подхватят его сами (RetrieverPool.check_reload)
+    publish(staging_dir)
+    pool.swap(staging_dir, vs=vs, sparse=bm25, manifest=manifest, dedup=dedup, bundle=bundle)
+    prune()
+    return {
+        "indexed": len(todo),
+        "chunks": sum(len(v) for v in chunk_ids.values()),
+        "added": added,
+        "updated": updated,
+        "removed": removed,
+        "unchanged": unchanged,
+        "reingested": list(teams),
+        "team": team,
+        "duplicates": sum(st.get("duplicates", 0) for st in source_stats.values()),
+        "duplicate_bytes": sum(st.get("duplicate_bytes", 0) for st in source_stats.values()),
+        "index_version": manifest.version,
+        "generation": os.path.basename(staging_dir),
+        "stages": stages,
+    }
+
+def submit_ingest_job(paths: List[str], team: Optional[str] = None):
+    """Queue ingest_paths() as a background job (app.jobs); raises JobQueueFull when the queue is full."""
+    from ..jobs import get_ingest_jobs
+    params = {"paths": list(paths), "team": normalize_team(team) or SHARED_TEAM}
+    return get_ingest_jobs().submit(
+        "ingest",
+        lambda job: ingest_paths(paths, team=team, progress=job.progress.update, check_cancelled=job.check_cancelled),
+        params,
+    )
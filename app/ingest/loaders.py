@@ -1,38 +1,56 @@
 from __future__ import annotations
-import os, json
-from typing import List
-from langchain_community.document_loaders import TextLoader, PyPDFLoader
+import os
+from typing import Iterator, List
 from langchain_core.documents import Document
+from .structured import iter_csv, iter_json, iter_jsonl, iter_yaml
 
-def load_path(path: str) -> List[Document]:
+# structured formats are read record by record (app/ingest/structured.py)
+STRUCTURED_LOADERS = {
+    ".json": iter_json,
+    ".jsonl": iter_jsonl,
+    ".ndjson": iter_jsonl,
+    ".csv": iter_csv,
+    ".tsv": iter_csv,
+    ".yaml": iter_yaml,
+    ".yml": iter_yaml,
+}
+SUPPORTED_EXT = {".md", ".txt", ".pdf"} | set(STRUCTURED_LOADERS)
+
+def iter_files(path: str) -> Iterator[str]:
+    """Yield every loadable file under ``path`` (or ``path`` itself)."""
     path = path.strip()
     if os.path.isdir(path):
-        docs: List[Document] = []
         for root, _, files in os.walk(path):
-            for f in files:
-                docs += load_file(os.path.join(root, f))
-        return docs
-    return load_file(path)
+            for f in sorted(files):
+                if os.path.splitext(f)[1].lower() in SUPPORTED_EXT:
+                    yield os.path.join(root, f)
+    elif os.path.isfile(path) and os.path.splitext(path)[1].lower() in SUPPORTED_EXT:
+        yield path
+
+def load_path(path: str) -> List[Document]:
+    docs: List[Document] = []
+    for f in iter_files(path):
+        docs += load_file(f)
+    return docs
 
 def load_file(path: str) -> List[Document]:
+    return list(iter_file(path))
+
+def iter_file(path: str) -> Iterator[Document]:
+    """Documents of one file; structured files yield one per record, lazily."""
     ext = os.path.splitext(path)[1].lower()
+    if ext in STRUCTURED_LOADERS:
+        yield from STRUCTURED_LOADERS[ext](path)
+        return
+    # langchain_community is slow to import; only pay for it when a file is loaded
     if ext in [".md", ".txt"]:
+        from langchain_community.document_loaders import TextLoader
         loader = TextLoader(path, encoding="utf-8")
-        docs = loader.load()
-        for d in docs:
-            d.metadata["source"] = os.path.relpath(path)
-        return docs
-    if ext == ".pdf":
+    elif ext == ".pdf":
+        from langchain_community.document_loaders import PyPDFLoader
         loader = PyPDFLoader(path)
-        docs = loader.load()
-        for d in docs:
-            d.metadata["source"] = os.path.relpath(path)
-        return docs
-    if ext == ".json":
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        # Превратим JSON в один документ с красивым текстом
-        text = json.dumps(data, ensure_ascii=False, indent=2)
-        return [Document(page_content=text, metadata={"source": os.path.relpath(path)})]
-    # игнорим бинарные и прочее
-    return []
+    else:
+        return  # игнорим бинарные и прочее
+    for d in loader.load():
+        d.metadata["source"] = os.path.relpath(path)
+        yield d
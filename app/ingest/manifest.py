@@ -0,0 +1,120 @@
+from __future__ import annotations
+import hashlib, heapq, json, os, time
+from typing import Any, Dict, Iterable, List, Optional
+
+from ..rag import DB_DIR, active_index_dir
+
+MANIFEST_PATH = os.getenv("RAG_MANIFEST_PATH", os.path.join(DB_DIR, "manifest.json"))
+
+def manifest_path(index_dir: Optional[str] = None) -> str:
+    index_dir = index_dir or active_index_dir()
+    return MANIFEST_PATH if index_dir == DB_DIR else os.path.join(index_dir, "manifest.json")
+
+def file_sha256(path: str, bufsize: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(bufsize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def chunk_id(source: str, index: int, text: str) -> str:
+    # Same file + same position + same text -> same id, so re-ingest upserts in place
+    return hashlib.sha1(f"{source}\n{index}\n{text}".encode("utf-8")).hexdigest()
+
+TOP_SOURCES = 20
+UNTAGGED = "(untagged)"  # ingested before team tags; invisible to team-filtered searches until re-ingested
+
+class Manifest:
+    """What is indexed: source -> {size, mtime_ns, sha256, chunk_ids, team, chunks, chunk_bytes, tokens,
+    duplicates, duplicate_bytes}.
+
+    ``version`` is bumped by every ingest that changes the index; caches key on it.
+    ``stats`` (totals, top sources) is recomputed on save, so readers such as
+    /debug/index never have to walk the collection.
+    """
+    def __init__(self, path: Optional[str] = None, files: Optional[Dict[str, Dict[str, Any]]] = None, version: int = 0,
+                 embedding_model: Optional[str] = None, stats: Optional[Dict[str, Any]] = None):
+        self.path = path or manifest_path()
+        self.files: Dict[str, Dict[str, Any]] = files or {}
+        self.version = version
+        self.embedding_model = embedding_model
+        self.stats: Dict[str, Any] = stats or {}
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "Manifest":
+        path = path or manifest_path()
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        m = cls(path, data.get("files", {}), data.get("version", 0), data.get("embedding_model"), data.get("stats"))
+        if not m.stats and m.files:
+            m.stats = m.compute_stats()  # manifest written before stats existed
+        return m
+
+    def save(self) -> None:
+        self.stats = self.compute_stats()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "embedding_model": self.embedding_model,
+                       "stats": self.stats, "files": self.files}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def compute_stats(self) -> Dict[str, Any]:
+        chunks = bytes_ = chunk_bytes = tokens = missing = dups = dup_bytes = 0
+        by_name: Dict[str, int] = {}
+        by_team: Dict[str, Dict[str, int]] = {}
+        for src, e in self.files.items():
+            n = e.get("chunks", len(e.get("chunk_ids", [])))
+            chunks += n
+            t = by_team.setdefault(e.get("team") or UNTAGGED, {"sources": 0, "chunks": 0, "tokens": 0})
+            t["sources"] += 1
+            t["chunks"] += n
+            t["tokens"] += e.get("tokens", 0)
+            bytes_ += e.get("size", 0)
+            dups += e.get("duplicates", 0)
+            dup_bytes += e.get("duplicate_bytes", 0)
+            if "tokens" in e:
+                chunk_bytes += e.get("chunk_bytes", 0)
+                tokens += e["tokens"]
+            else:
+                missing += 1  # ingested before per-source stats; re-ingest to fill in
+            name = os.path.basename(src).lower()
+            by_name[name] = by_name.get(name, 0) + n
+        top = heapq.nlargest(TOP_SOURCES, self.files,
+                             key=lambda s: self.files[s].get("chunks", len(self.files[s].get("chunk_ids", []))))
+        return {
+            "sources": len(self.files),
+            "chunks": chunks,
+            "bytes": bytes_,
+            "chunk_bytes": chunk_bytes,
+            "tokens": tokens,
+            "sources_without_stats": missing,
+            # near-duplicate chunks folded into a canonical one at ingest (app/ingest/dedup.py)
+            "duplicates": dups,
+            "duplicate_bytes": dup_bytes,
+            "dedup_saved_pct": round(100.0 * dup_bytes / (chunk_bytes + dup_bytes), 2) if dup_bytes else 0.0,
+            "unique_filenames": len(by_name),
+            "by_team": by_team,
+            "top_filenames": heapq.nlargest(TOP_SOURCES, by_name.items(), key=lambda kv: kv[1]),
+            "top_sources": top,
+            "updated_at": time.time(),
+        }
+
+    def bump(self) -> int:
+        self.version += 1
+        return self.version
+
+    def is_fresh(self, source: str, st: os.stat_result) -> bool:
+        prev = self.files.get(source)
+        return bool(prev) and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns
+
+    def sources_under(self, roots: Iterable[str]) -> List[str]:
+        roots = [os.path.normpath(r) for r in roots]
+        out = []
+        for src in self.files:
+            s = os.path.normpath(src)
+            if any(s == r or s.startswith(r.rstrip(os.sep) + os.sep) or r == "." for r in roots):
+                out.append(src)
+        return out
@@ -0,0 +1,267 @@
+from __future__ import annotations
+import multiprocessing, os, queue, threading, time
+from concurrent.futures import (
+    FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait,
+)
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from .loaders import STRUCTURED_LOADERS, iter_file, iter_files, load_file
+from .manifest import chunk_id
+from ..rag import chunk_docs
+from ..context_pack import count_tokens
+
+# Tunables (env): parse processes, walk/hash threads, chunks per embedding call,
+# and how many parsed files may wait for the writer before parsing pauses.
+PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+IO_WORKERS = int(os.getenv("INGEST_IO_WORKERS", "8"))
+EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "128"))
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "16"))
+# Structured files (JSON/JSONL/CSV/YAML) above this size are not parsed whole in
+# the pool but streamed record by record, handed to chunking in batches of about
+# STREAM_BATCH_CHARS of text, so memory does not grow with the file.
+STREAM_BYTES = int(os.getenv("INGEST_STREAM_BYTES", str(8 << 20)))
+STREAM_BATCH_CHARS = int(os.getenv("INGEST_STREAM_BATCH_CHARS", str(1 << 20)))
+
+_DONE = object()
+# Parse workers start from a clean process, never fork()ed from the server: a fork
+# would inherit held locks of the event-log/job threads and open sqlite handles.
+_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy_s = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items: int, seconds: float) -> None:
+        with self._lock:
+            self.items += items
+            self.busy_s += seconds
+
+    def report(self, wall_s: float) -> Dict[str, Any]:
+        return {
+            "items": self.items,
+            "busy_s": round(self.busy_s, 3),
+            "items_per_s": round(self.items / wall_s, 1) if wall_s > 0 else None,
+        }
+
+class _InlineExecutor(Executor):
+    """Runs submissions in the calling thread (INGEST_PARSE_WORKERS=0 or tiny drops)."""
+    def submit(self, fn, *args, **kwargs):
+        f: Future = Future()
+        try:
+            f.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            f.set_exception(e)
+        return f
+
+def discover_files(paths: Iterable[str], workers: int = IO_WORKERS) -> List[str]:
+    """Walk every root (and each top-level subdirectory) on its own thread."""
+    tasks: List[str] = []
+    for p in paths:
+        p = p.strip()
+        if os.path.isdir(p):
+            tasks += list(iter_files_shallow(p))
+            tasks += [e.path for e in os.scandir(p) if e.is_dir()]
+        else:
+            tasks.append(p)
+    out: List[str] = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        for files in ex.map(lambda t: list(iter_files(t)), tasks):
+            out += files
+    return out
+
+def iter_files_shallow(path: str) -> Iterable[str]:
+    # Files directly inside ``path``; subdirectories are walked by discover_files
+    for e in sorted(os.scandir(path), key=lambda e: e.name):
+        if e.is_file():
+            yield from iter_files(e.path)
+
+def _parse(path: str) -> Tuple[List[Document], float]:
+    t0 = time.perf_counter()
+    docs = load_file(path)
+    return docs, time.perf_counter() - t0
+
+def _streamed(path: str) -> bool:
+    if os.path.splitext(path)[1].lower() not in STRUCTURED_LOADERS:
+        return False
+    try:
+        return os.path.getsize(path) > STREAM_BYTES
+    except OSError:
+        return False
+
+def chunk_file_docs(docs: List[Document], source: str, team: Optional[str] = None, start: int = 0) -> List[Document]:
+    # ``start``: index of the first chunk when a file arrives in several parts
+    chunks = chunk_docs(docs)
+    for i, c in enumerate(chunks, start):
+        c.metadata["source"] = source
+        if team is not None:
+            c.metadata["team"] = team
+        c.metadata["chunk_index"] = i
+        c.metadata["chunk_id"] = chunk_id(source, i, c.page_content)
+    return chunks
+
+def run_pipeline(
+    files: List[Tuple[str, str]],
+    vs,
+    sparse,
+    parse_workers: int = PARSE_WORKERS,
+    embed_batch: int = EMBED_BATCH,
+    queue_size: int = QUEUE_SIZE,
+    source_stats: Optional[Dict[str, Dict[str, int]]] = None,
+    team: Optional[str] = None,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    check_cancelled: Optional[Callable[[], None]] = None,
+    dedup=None,
+    source_teams: Optional[Dict[str, str]] = None,
+) -> Tuple[Dict[str, List[str]], Dict[str, Any]]:
+    """Parse -> chunk -> embed/write ``files`` ([(path, source)]) as a stream.
+
+    Parsing runs in a process pool with at most ``2 * parse_workers`` files in
+    flight; large structured files are streamed instead (see STREAM_BYTES).
+    Chunked files go through a bounded queue to one writer thread that
+    embeds and upserts in batches of ``embed_batch`` chunks. Returns
+    ({source: [chunk_id]}, per-stage stats). If ``source_stats`` is given it
+    is filled with {source: {chunks, chunk_bytes, tokens}} for the manifest.
+    Chunks are only added: the caller drops a source's old chunks from
+    ``vs`` and ``sparse`` beforehand.
+    Every chunk gets ``team`` in its metadata when one is given
+    (``source_teams`` overrides it per source). With a ``dedup`` index
+    (app/ingest/dedup.py), near-duplicates of already stored chunks are
+    recorded as aliases and not written; they count in ``duplicates``.
+    ``progress`` is called with file/chunk counts as files are chunked;
+    ``check_cancelled`` (e.g. Job.check_cancelled) is polled between files
+    and may raise to stop the run before anything else is written.
+    """
+    stages = {name: StageStats(name) for name in ("parse", "chunk", "dedup", "embed_write")}
+    q: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, queue_size))
+    chunk_ids: Dict[str, List[str]] = {}
+    errors: List[BaseException] = []
+    t_start = time.perf_counter()
+    counts = {"files_done": 0, "files_total": len(files), "chunks": 0, "duplicates": 0}
+
+    def flush(items: List[Tuple[str, List[Document]]]) -> None:
+        chunks = [c for _, cs in items for c in cs]
+        if not chunks or errors:
+            return
+        t0 = time.perf_counter()
+        for s in range(0, len(chunks), embed_batch):
+            part = chunks[s:s + embed_batch]
+            vs.add_documents(part, ids=[c.metadata["chunk_id"] for c in part])
+        # old chunks of the source were dropped by the caller; streamed files arrive in parts
+        for _, cs in items:
+            sparse.add_documents(cs, append=True)
+        stages["embed_write"].add(len(chunks), time.perf_counter() - t0)
+
+    def writer() -> None:
+        pending: List[Tuple[str, List[Document]]] = []
+        n = 0
+        while True:
+            item = q.get()
+            if item is _DONE:
+                break
+            pending.append(item)
+            n += len(item[1])
+            if n >= embed_batch:
+                try:
+                    flush(pending)
+                except BaseException as e:
+                    # keep draining so producers never block on a dead consumer
+                    errors.append(e)
+                pending, n = [], 0
+        try:
+            flush(pending)
+        except BaseException as e:
+            errors.append(e)
+
+    def emit(source: str, docs: List[Document], parse_s: float, start: int = 0, last: bool = True) -> int:
+        stages["parse"].add(1 if last else 0, parse_s)
+        t0 = time.perf_counter()
+        chunks = chunk_file_docs(docs, source, (source_teams or {}).get(source, team), start)
+        n_all = len(chunks)
+        stages["chunk"].add(n_all, time.perf_counter() - t0)
+        dups: List[Document] = []
+        if dedup is not None:
+            t0 = time.perf_counter()
+            chunks, dups = dedup.filter(chunks)
+            stages["dedup"].add(n_all, time.perf_counter() - t0)
+        if source_stats is not None:
+            st = source_stats.setdefault(source, {"chunks": 0, "chunk_bytes": 0, "tokens": 0,
+                                                  "duplicates": 0, "duplicate_bytes": 0})
+            st["chunks"] += len(chunks)
+            st["chunk_bytes"] += sum(len(c.page_content.encode("utf-8")) for c in chunks)
+            st["tokens"] += sum(count_tokens(c.page_content) for c in chunks)
+            st["duplicates"] += len(dups)
+            st["duplicate_bytes"] += sum(len(c.page_content.encode("utf-8")) for c in dups)
+        chunk_ids.setdefault(source, []).extend(c.metadata["chunk_id"] for c in chunks)
+        q.put((source, chunks))  # blocks when the writer falls behind
+        counts["files_done"] += 1 if last else 0
+        counts["chunks"] += len(chunks)
+        counts["duplicates"] += len(dups)
+        if progress is not None:
+            progress(dict(counts))
+        if check_cancelled is not None:
+            try:
+                check_cancelled()
+            except BaseException as e:
+                errors.append(e)  # stops the producers and makes the writer skip the rest
+        return n_all
+
+    def on_parsed(source: str, fut: Future) -> None:
+        docs, parse_s = fut.result()
+        emit(source, docs, parse_s)
+
+    def stream(path: str, source: str) -> None:
+        # runs in this thread; the writer queue bounds how far it gets ahead
+        start = 0
+        batch: List[Document] = []
+        size, t0 = 0, time.perf_counter()
+        for doc in iter_file(path):
+            batch.append(doc)
+            size += len(doc.page_content)
+            if size >= STREAM_BATCH_CHARS:
+                start += emit(source, batch, time.perf_counter() - t0, start, last=False)
+                if errors:
+                    return
+                batch, size, t0 = [], 0, time.perf_counter()
+        emit(source, batch, time.perf_counter() - t0, start, last=True)
+
+    w = threading.Thread(target=writer, name="ingest-writer", daemon=True)
+    w.start()
+    try:
+        use_procs = parse_workers > 0 and len(files) > 1
+        ex: Executor = (ProcessPoolExecutor(max_workers=parse_workers, mp_context=_MP_CONTEXT)
+                        if use_procs else _InlineExecutor())
+        with ex:
+            in_flight: Dict[Future, str] = {}
+            max_in_flight = max(1, 2 * parse_workers)
+            for path, source in files:
+                while len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for f in done:
+                        on_parsed(in_flight.pop(f), f)
+                    if errors:
+                        break
+                if errors:
+                    break
+                if _streamed(path):
+                    stream(path, source)
+                    continue
+                in_flight[ex.submit(_parse, path)] = source
+            for f in as_completed(list(in_flight)):
+                on_parsed(in_flight.pop(f), f)
+    finally:
+        q.put(_DONE)
+        w.join()
+    if errors:
+        raise errors[0]
+
+    wall = time.perf_counter() - t_start
+    stats = {name: st.report(wall) for name, st in stages.items()}
+    stats["wall_s"] = round(wall, 3)
+    stats["config"] = {"parse_workers": parse_workers, "embed_batch": embed_batch, "queue_size": queue_size,
+                       "stream_bytes": STREAM_BYTES}
+    return chunk_ids, stats
@@ -0,0 +1,204 @@
+from __future__ import annotations
+import fcntl, os, re, shutil, socket, time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Set, Tuple
+
+from ..rag import CURRENT_FILE, DB_DIR, SPARSE_PATH, active_index_dir
+from .manifest import MANIFEST_PATH
+
+# Published generations kept on disk: the live one plus the previous one, which
+# requests that borrowed it just before a swap may still be reading.
+KEEP_GENERATIONS = max(2, int(os.getenv("RAG_KEEP_GENERATIONS", "2")))
+
+_GEN_RE = re.compile(r"^gen-(\d+)$")
+# One writer at a time, across threads and worker processes: each ingest
+# stages from the live generation, so two concurrent ones would silently drop
+# each other's changes.
+LOCK_FILE = os.path.join(DB_DIR, "LOCK")
+# Last generation number handed out. Numbers are never reused: Chroma caches
+# its client per directory, so a recreated gen-<n> would hit a stale connection.
+LAST_GEN_FILE = os.path.join(DB_DIR, "LAST_GEN")
+# Files that writers only ever replace (tmp + os.replace) or, for the dense
+# vectors, un-share before appending: a stage hard-links them instead of
+# copying. Everything else (SQLite, Chroma segments) is changed in place.
+_LINKED = {"manifest.json", "bm25.pkl", "dedup.pkl",
+           os.path.join("dense", "header.json"), os.path.join("dense", "vectors.bin"),
+           os.path.join("dense", "scales.bin")}
+_FICLONE = 0x40049409  # linux/fs.h: reflink a whole file
+# Each serving process names the generation it has mapped in leases/<host>-<pid>,
+# refreshed on every reload check. prune() keeps leased generations, so a worker
+# that has not reloaded yet never loses its files; a lease not refreshed for
+# RAG_LEASE_TTL_S (long-idle worker, or one on another host that died) or
+# left by a dead process on this host no longer counts.
+LEASE_DIR = os.path.join(DB_DIR, "leases")
+LEASE_TTL_S = float(os.getenv("RAG_LEASE_TTL_S", "300"))
+
+@contextmanager
+def write_lock() -> Iterator[None]:
+    """Hold the index write lock (fcntl on DB_DIR/LOCK) for the block."""
+    os.makedirs(DB_DIR, exist_ok=True)
+    fd = os.open(LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # releases the lock
+
+def generations() -> List[Tuple[int, str]]:
+    """[(n, path)] of every gen-<n> directory under DB_DIR, oldest first."""
+    if not os.path.isdir(DB_DIR):
+        return []
+    out = []
+    for name in os.listdir(DB_DIR):
+        m = _GEN_RE.match(name)
+        if m and os.path.isdir(os.path.join(DB_DIR, name)):
+            out.append((int(m.group(1)), os.path.join(DB_DIR, name)))
+    return sorted(out)
+
+def _is_ours(name: str) -> bool:
+    return bool(_GEN_RE.match(name)) or name.startswith("CURRENT") or name in ("LOCK", "LAST_GEN", "leases")
+
+def _next_gen() -> int:
+    """Next generation number, persisted in LAST_GEN; call under write_lock()."""
+    try:
+        with open(LAST_GEN_FILE, "r", encoding="utf-8") as f:
+            last = int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        last = 0
+    n = max([last] + [g for g, _ in generations()]) + 1
+    tmp = f"{LAST_GEN_FILE}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(str(n))
+    os.replace(tmp, LAST_GEN_FILE)
+    return n
+
+def _clone(src: str, dst: str) -> None:
+    """Copy-on-write clone where the filesystem supports it, else a plain copy."""
+    try:
+        with open(src, "rb") as fs, open(dst, "wb") as fd:
+            fcntl.ioctl(fd.fileno(), _FICLONE, fs.fileno())
+        shutil.copystat(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def _link_or_clone(src: str, dst: str, rel: str) -> None:
+    if rel in _LINKED:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass  # e.g. a filesystem without hard links
+    _clone(src, dst)
+
+def stage() -> str:
+    """Set up the live index as a fresh, unpublished gen-<n> and return its path.
+
+    Files writers only replace are hard-linked, the rest cloned, so a stage
+    costs little more than the stores that get rewritten in place. Call under
+    write_lock(): the live generation is then consistent while /ask keeps
+    reading it.
+    """
+    dst = os.path.join(DB_DIR, f"gen-{_next_gen():06d}")
+    src = active_index_dir()
+    if src != DB_DIR:
+        # the bundle is re-exported from the staged stores before publish
+        shutil.copytree(src, dst, ignore=shutil.ignore_patterns("bundle", "bundle.tmp"),
+                        copy_function=lambda s, d: _link_or_clone(s, d, os.path.relpath(s, src)))
+        return dst
+    # flat (pre-generation) layout: everything in DB_DIR except generations
+    os.makedirs(dst)
+    if os.path.isdir(DB_DIR):
+        for name in os.listdir(DB_DIR):
+            path = os.path.join(DB_DIR, name)
+            if os.path.abspath(path) == os.path.abspath(dst) or _is_ours(name):
+                continue
+            (shutil.copytree if os.path.isdir(path) else shutil.copy2)(path, os.path.join(dst, name))
+    # the flat layout may keep these outside DB_DIR (RAG_SPARSE_PATH / RAG_MANIFEST_PATH)
+    for legacy, name in ((SPARSE_PATH, "bm25.pkl"), (MANIFEST_PATH, "manifest.json")):
+        target = os.path.join(dst, name)
+        if os.path.exists(legacy) and not os.path.exists(target):
+            shutil.copy2(legacy, target)
+    return dst
+
+def publish(index_dir: str) -> None:
+    """Make ``index_dir`` the live generation: one atomic rename of CURRENT."""
+    tmp = f"{CURRENT_FILE}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(index_dir))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, CURRENT_FILE)
+
+def discard(index_dir: str) -> None:
+    if os.path.abspath(index_dir) != os.path.abspath(active_index_dir()):
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+def _lease_path() -> str:
+    return os.path.join(LEASE_DIR, f"{socket.gethostname()}-{os.getpid()}")
+
+def hold_lease(index_dir: str) -> None:
+    """Record (or refresh) that this process serves ``index_dir``."""
+    path = _lease_path()
+    try:
+        os.makedirs(LEASE_DIR, exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(os.path.basename(index_dir))
+        os.replace(tmp, path)
+    except OSError:
+        pass  # read-only volume: prune falls back to keep-count only
+
+def release_lease() -> None:
+    try:
+        os.remove(_lease_path())
+    except OSError:
+        pass
+
+def _pid_gone(lease: str) -> bool:
+    host, _, pid = lease.rpartition("-")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False  # another host's worker: only the TTL applies
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
+    return False
+
+def leased() -> Set[str]:
+    """Generation names held by live leases; expired leases are removed."""
+    if not os.path.isdir(LEASE_DIR):
+        return set()
+    out, now = set(), time.time()
+    for name in os.listdir(LEASE_DIR):
+        path = os.path.join(LEASE_DIR, name)
+        if name.endswith(".tmp"):
+            continue
+        try:
+            if now - os.stat(path).st_mtime > LEASE_TTL_S or _pid_gone(name):
+                os.remove(path)
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                out.add(f.read().strip())
+        except OSError:
+            continue
+    return out
+
+def prune(keep: int = KEEP_GENERATIONS) -> List[str]:
+    """Delete old generations (and leftovers of failed runs); call under write_lock()."""
+    active = os.path.abspath(active_index_dir())
+    gens = generations()
+    live_n: Optional[int] = next((n for n, p in gens if os.path.abspath(p) == active), None)
+    # numbers have gaps (discarded runs), so keep the newest keep-1 that exist
+    history = {n for n, _ in gens if live_n is not None and n < live_n}
+    history = set(sorted(history)[-(keep - 1):])
+    held = leased()
+    removed = []
+    for n, path in gens:
+        if os.path.abspath(path) == active or n in history or os.path.basename(path) in held:
+            continue
+        # newer than live = a staging dir nobody published (crash); older = history
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(path)
+    return removed
@@ -0,0 +1,217 @@
+from __future__ import annotations
+import csv, io, json, os, re
+from typing import Any, Iterator, Optional, TextIO, Tuple
+from langchain_core.documents import Document
+
+# Record loaders for structured files: JSON, JSON Lines, CSV/TSV, YAML.
+# Each yields one Document per record with its location in metadata
+# ("json_path", plus "line" / "row" / "document"), reading the file
+# incrementally so memory stays bounded by the record size, not the file.
+
+# A JSON object/array whose text fits in this many chars is one record;
+# bigger ones are split into their members (scalars grouped under the parent).
+RECORD_MAX_CHARS = int(os.getenv("INGEST_RECORD_MAX_CHARS", "4000"))
+_BLOCK = 1 << 16
+
+_WS = re.compile(r"[ \t\n\r]*")
+_STRUCT = re.compile(r'["\[\]{}]')
+_STR_TAIL = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.S)  # rest of a string after its opening quote
+_SCALAR_END = re.compile(r"[\s,\]}]")
+_IDENT = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+def json_path(parent: str, key: Any) -> str:
+    if isinstance(key, int):
+        return f"{parent}[{key}]"
+    key = str(key)
+    return f"{parent}.{key}" if _IDENT.fullmatch(key) else f"{parent}[{json.dumps(key, ensure_ascii=False)}]"
+
+class _Reader:
+    """Buffered cursor over a JSON text stream; consumed text is dropped on refill."""
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        # read at least as much as is buffered, so scanning one huge value stays linear
+        block = self.f.read(max(_BLOCK, len(self.buf) - self.pos))
+        self.buf, self.pos = self.buf[self.pos:], 0
+        if not block:
+            self.eof = True
+            return False
+        self.buf += block
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace char ('' at end of input), skipping the whitespace."""
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch: str) -> None:
+        if self.peek() != ch:
+            raise ValueError(f"invalid JSON: expected {ch!r}, got {self.buf[self.pos:self.pos + 20]!r}")
+        self.pos += 1
+
+    def extent(self, limit: float) -> Optional[int]:
+        """Length of the value at the cursor, or None if it is longer than ``limit``."""
+        if self.peek() not in '{["':
+            while True:  # number / true / false / null
+                m = _SCALAR_END.search(self.buf, self.pos)
+                if m:
+                    return m.start() - self.pos
+                if not self._fill():
+                    return len(self.buf) - self.pos
+        rel, depth = 0, 0  # offsets are kept relative to pos: _fill() shifts the buffer
+        while True:
+            if rel > limit:
+                return None
+            m = _STRUCT.search(self.buf, self.pos + rel)
+            if m is None:
+                rel = len(self.buf) - self.pos
+                if not self._fill():
+                    raise ValueError("invalid JSON: unexpected end of input")
+                continue
+            if m.group() == '"':
+                t = _STR_TAIL.match(self.buf, m.end())
+                if t is None:  # string continues past the buffer: rescan it after reading more
+                    rel = m.start() - self.pos
+                    if len(self.buf) - self.pos > limit:
+                        return None
+                    if not self._fill():
+                        raise ValueError("invalid JSON: unterminated string")
+                    continue
+                rel = t.end() - self.pos
+                if depth == 0:
+                    return rel
+            else:
+                depth += 1 if m.group() in "[{" else -1
+                rel = m.end() - self.pos
+                if depth == 0:
+                    return rel
+
+    def take(self, n: Optional[int]) -> Any:
+        """Decode the next value (``n`` from extent(); None = read it whole)."""
+        if n is None:
+            n = self.extent(float("inf"))
+        value = json.loads(self.buf[self.pos:self.pos + n])
+        self.pos += n
+        return value
+
+def _descend(r: _Reader, path: str, limit: int) -> Iterator[Tuple[str, Any]]:
+    # container too big for one record: members that fit become records,
+    # scalar members are grouped into records for ``path`` itself
+    is_obj = r.peek() == "{"
+    close = "}" if is_obj else "]"
+    r.pos += 1
+    group: Any = {} if is_obj else []
+    size, i = 0, 0
+    if r.peek() == close:
+        r.pos += 1
+        return
+    while True:
+        if is_obj:
+            key = r.take(r.extent(limit))
+            r.expect(":")
+        else:
+            key = i
+        c = r.peek()
+        n = r.extent(limit)
+        if c in "{[":
+            if n is not None:
+                yield json_path(path, key), r.take(n)
+            else:
+                yield from _descend(r, json_path(path, key), limit)
+        else:
+            value = r.take(n)
+            if is_obj:
+                group[key] = value
+            else:
+                group.append(value)
+            size += n if n is not None else len(value)
+            if size >= limit:
+                yield path, group
+                group, size = ({} if is_obj else []), 0
+        i += 1
+        c = r.peek()
+        r.pos += 1
+        if c == close:
+            break
+        if c != ",":
+            raise ValueError(f"invalid JSON: expected ',' or {close!r} at {path}")
+    if group:
+        yield path, group
+
+def iter_json_records(f: TextIO, root: str = "$", limit: int = RECORD_MAX_CHARS) -> Iterator[Tuple[str, Any]]:
+    """(json_path, value) records of one JSON document, parsed incrementally."""
+    r = _Reader(f)
+    if r.peek() == "":
+        return
+    n = r.extent(limit)
+    if n is None and r.peek() in "{[":
+        yield from _descend(r, root, limit)
+    else:
+        yield root, r.take(n)
+    if r.peek() != "":
+        raise ValueError("invalid JSON: extra data after the document")
+
+def _record(source: str, path: str, value: Any, **meta: Any) -> Document:
+    # compact JSON: no indentation whitespace in chunks (and the C encoder, not the pure-Python one);
+    # the path goes into the text too, so BM25/embeddings see which part of the file this is
+    body = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    return Document(page_content=f"{path}\n{body}", metadata={"source": source, "json_path": path, **meta})
+
+def iter_json(path: str) -> Iterator[Document]:
+    source = os.path.relpath(path)
+    with open(path, "r", encoding="utf-8") as f:
+        for p, value in iter_json_records(f):
+            yield _record(source, p, value)
+
+def iter_jsonl(path: str) -> Iterator[Document]:
+    source = os.path.relpath(path)
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                for p, value in iter_json_records(io.StringIO(line)):
+                    yield _record(source, p, value, line=lineno)
+            except ValueError as e:
+                raise ValueError(f"{source}:{lineno}: {e}") from None
+
+def iter_csv(path: str) -> Iterator[Document]:
+    """One record per row, as ``column: value`` lines (header row required)."""
+    source = os.path.relpath(path)
+    delimiter = "\t" if path.lower().endswith(".tsv") else ","
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        header = next(reader, None)
+        if not header:
+            return
+        for i, row in enumerate(reader):
+            text = "\n".join(f"{h}: {v}" for h, v in zip(header, row) if v.strip())
+            if text:
+                yield Document(page_content=text, metadata={"source": source, "row": i, "line": reader.line_num})
+
+def iter_yaml(path: str) -> Iterator[Document]:
+    """Records of every document in a (multi-document) YAML file.
+
+    PyYAML builds one document at a time, so memory is bounded by the
+    largest document; records are then split out as for JSON.
+    """
+    import yaml
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    source = os.path.relpath(path)
+    with open(path, "r", encoding="utf-8") as f:
+        for n, data in enumerate(yaml.load_all(f, Loader=loader)):
+            if data is None:
+                continue
+            text = json.dumps(data, ensure_ascii=False, default=str)
+            for p, value in iter_json_records(io.StringIO(text)):
+                yield _record(source, p, value, document=n)
@@ -0,0 +1,145 @@
+from __future__ import annotations
+import os, threading, time, traceback, uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from .env import load as load_env
+load_env()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "100"))
+_FINISHED = ("done", "error", "cancelled")
+
+class JobCancelled(Exception):
+    """Raised inside a job (``job.check_cancelled()``) once cancel() was called."""
+
+class JobQueueFull(Exception):
+    pass
+
+class Job:
+    """One background task; ``fn(job)`` may update ``job.progress`` as it goes
+    and should call ``job.check_cancelled()`` at safe points."""
+    def __init__(self, kind: str, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.status = "queued"   # queued -> running -> done | error | cancelled
+        self.cancel_requested = False
+        self.progress: Dict[str, Any] = {}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._future: Optional[Future] = None
+
+    def check_cancelled(self) -> None:
+        if self.cancel_requested:
+            raise JobCancelled(f"job {self.id} cancelled")
+
+    def to_dict(self, with_result: bool = True) -> Dict[str, Any]:
+        out = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "cancel_requested": self.cancel_requested,
+            "params": self.params,
+            "progress": self.progress,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if with_result:
+            out["result"] = self.result
+        return out
+
+class JobManager:
+    """Small in-process job runner: a thread pool plus a bounded history.
+
+    ``max_queued`` caps jobs waiting for a worker; submit() raises
+    JobQueueFull beyond it.
+    """
+    def __init__(self, workers: int = JOB_WORKERS, history: int = JOB_HISTORY, max_queued: Optional[int] = None,
+                 name: str = "job"):
+        self.history = history
+        self.max_queued = max_queued
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+    def submit(self, kind: str, fn: Callable[[Job], Any], params: Optional[Dict[str, Any]] = None) -> Job:
+        job = Job(kind, dict(params or {}))
+        with self._lock:
+            if self.max_queued is not None and \
+                    sum(1 for j in self._jobs.values() if j.status == "queued") >= self.max_queued:
+                raise JobQueueFull(f"{self.max_queued} jobs already queued")
+            self._jobs[job.id] = job
+            # forget the oldest finished jobs
+            for jid in [j.id for j in self._jobs.values() if j.status in _FINISHED]:
+                if len(self._jobs) <= self.history:
+                    break
+                del self._jobs[jid]
+            job._future = self._executor.submit(self._run, job, fn)
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued job now; a running one stops at its next check_cancelled()."""
+        job = self._jobs.get(job_id)
+        if job is None or job.status in _FINISHED:
+            return job
+        job.cancel_requested = True
+        if job._future is not None and job._future.cancel():
+            job.status, job.finished_at = "cancelled", time.time()
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], Any]) -> None:
+        if job.cancel_requested:
+            job.status, job.finished_at = "cancelled", time.time()
+            return
+        job.status, job.started_at = "running", time.time()
+        try:
+            job.result = fn(job)
+            job.status = "done"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.progress["traceback"] = traceback.format_exc(limit=5)
+            job.status = "error"
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self, kind: Optional[str] = None) -> List[Job]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [j for j in reversed(jobs) if kind is None or j.kind == kind]
+
+_JOBS: Optional[JobManager] = None
+_JOBS_LOCK = threading.Lock()
+
+def get_jobs() -> JobManager:
+    global _JOBS
+    if _JOBS is None:
+        with _JOBS_LOCK:
+            if _JOBS is None:
+                _JOBS = JobManager()
+    return _JOBS
+
+# Ingest gets its own single-worker queue: ingests serialize on the index write
+# lock anyway, and a long one must not hold up eval jobs.
+INGEST_MAX_QUEUED = int(os.getenv("INGEST_MAX_QUEUED", "8"))
+
+_INGEST_JOBS: Optional[JobManager] = None
+
+def get_ingest_jobs() -> JobManager:
+    global _INGEST_JOBS
+    if _INGEST_JOBS is None:
+        with _JOBS_LOCK:
+            if _INGEST_JOBS is None:
+                _INGEST_JOBS = JobManager(workers=1, max_queued=INGEST_MAX_QUEUED, name="ingest")
+    return _INGEST_JOBS
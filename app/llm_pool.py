@@ -0,0 +1,379 @@
+from __future__ import annotations
+import asyncio, hashlib, os, threading, time
+from concurrent.futures import Future
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from .env import load as load_env
+load_env()
+
+# One chat client per model, shared by every request, on keep-alive HTTP
+# connection pools. Identical prompts already in flight (same model, same packed
+# context) are coalesced into one upstream call, and each model admits at most
+# LLM_MAX_CONCURRENCY calls; up to LLM_MAX_QUEUE more wait (LLM_QUEUE_TIMEOUT_S
+# at most), the rest are rejected with LLMOverloaded so bursts queue briefly
+# instead of piling up upstream. OPENAI_BASE_URL points it at any
+# OpenAI-compatible server (e.g. bench/fake_openai.py).
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+LLM_QUEUE_TIMEOUT_S = float(os.getenv("LLM_QUEUE_TIMEOUT_S", "10"))
+LLM_COALESCE = os.getenv("LLM_COALESCE", "1") != "0"
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "64"))
+LLM_HTTP_KEEPALIVE_S = float(os.getenv("LLM_HTTP_KEEPALIVE_S", "60"))
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.2"))
+
+class LLMOverloaded(Exception):
+    """Too many calls queued for a model; /ask answers 429 with Retry-After."""
+    def __init__(self, model: str, retry_after_s: float):
+        super().__init__(f"LLM {model} is overloaded; retry in {retry_after_s:g}s")
+        self.model = model
+        self.retry_after_s = retry_after_s
+
+def prompt_key(model: str, prompt: str) -> Tuple[str, str]:
+    return model, hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+class _Stream:
+    """One upstream stream fanned out to every request that asked for it.
+
+    Deltas are kept, so a request that joins late replays them first.
+    """
+    def __init__(self):
+        self.parts: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.cond = asyncio.Condition()
+        self.waiters = 0
+        self.task: Optional[asyncio.Task] = None
+
+    async def push(self, part: Optional[str] = None, error: Optional[BaseException] = None, done: bool = False):
+        async with self.cond:
+            if part:
+                self.parts.append(part)
+            if error is not None:
+                self.error = error
+            self.done = self.done or done or error is not None
+            self.cond.notify_all()
+
+    async def follow(self) -> AsyncIterator[str]:
+        i = 0
+        while True:
+            async with self.cond:
+                await self.cond.wait_for(lambda: len(self.parts) > i or self.done)
+                new, done, error = self.parts[i:], self.done, self.error
+            for p in new:
+                yield p
+            i += len(new)
+            if done and i >= len(self.parts):
+                if error is not None:
+                    raise error
+                return
+
+class _Call:
+    """An upstream call shared by every request with the same prompt."""
+    def __init__(self, loop, task: asyncio.Task):
+        self.loop = loop
+        self.task = task
+        self.waiters = 0
+
+class _Waiter:
+    """A caller queued for a slot; ``wake`` runs on the releasing thread."""
+    __slots__ = ("wake", "granted")
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+
+def _resolve(fut: asyncio.Future) -> None:
+    if not fut.done():  # the waiter may have timed out meanwhile
+        fut.set_result(None)
+
+class _Model:
+    """Client, admission state and counters of one model.
+
+    Async and sync callers share one admission count (``active``) and one
+    FIFO of waiters, so the process never has more than LLM_MAX_CONCURRENCY
+    calls upstream for the model, whichever path they came from.
+    """
+    def __init__(self, name: str, client: Any):
+        self.name = name
+        self.client = client
+        self.active = 0
+        self.calls = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.queue_ms = 0.0
+        self._waiting: Deque[_Waiter] = deque()
+        self.lock = threading.Lock()
+
+    def _enter(self, waiter: _Waiter) -> bool:
+        """Take a free slot (True) or queue ``waiter`` (False); LLMOverloaded when the queue is full."""
+        with self.lock:
+            if self.active < LLM_MAX_CONCURRENCY and not self._waiting:
+                self.active += 1
+                self.calls += 1
+                return True
+            if len(self._waiting) >= LLM_MAX_QUEUE:
+                self.rejected += 1
+                raise LLMOverloaded(self.name, LLM_QUEUE_TIMEOUT_S)
+            self._waiting.append(waiter)
+            return False
+
+    def _leave(self, waiter: _Waiter, t0: float) -> bool:
+        """Stop waiting; True if release() handed ``waiter`` a slot first."""
+        with self.lock:
+            if waiter.granted:
+                self.queue_ms += (time.perf_counter() - t0) * 1000
+                return True
+            self._waiting.remove(waiter)
+            return False
+
+    def _rejected(self) -> LLMOverloaded:
+        with self.lock:
+            self.rejected += 1
+        return LLMOverloaded(self.name, LLM_QUEUE_TIMEOUT_S)
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        waiter = _Waiter(lambda: loop.call_soon_threadsafe(_resolve, fut))
+        if self._enter(waiter):
+            return
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(fut, LLM_QUEUE_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            if self._leave(waiter, t0):
+                self.release()  # granted while being cancelled: pass it on
+            raise
+        if not self._leave(waiter, t0):
+            raise self._rejected()
+
+    def acquire_sync(self) -> None:
+        event = threading.Event()
+        waiter = _Waiter(event.set)
+        if self._enter(waiter):
+            return
+        t0 = time.perf_counter()
+        event.wait(LLM_QUEUE_TIMEOUT_S)
+        if not self._leave(waiter, t0):
+            raise self._rejected()
+
+    def release(self) -> None:
+        # the slot goes straight to the oldest waiter, so active never dips under a queue
+        with self.lock:
+            while self._waiting:
+                waiter = self._waiting.popleft()
+                waiter.granted = True
+                try:
+                    waiter.wake()
+                except RuntimeError:
+                    waiter.granted = False  # its event loop is closed: nobody will take the slot
+                    continue
+                self.calls += 1
+                return
+            self.active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "active": self.active,
+                "queued": len(self._waiting),
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+                "mean_queue_ms": round(self.queue_ms / self.calls, 2) if self.calls else None,
+            }
+
+class LLMPool:
+    """Process-wide chat clients with request coalescing and admission control.
+
+    Coalescing is per event loop (the server runs one); sync callers
+    (rag_ask, scripts) share the same clients and limits through threads.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[str, _Model] = {}
+        self._http: Optional[Any] = None
+        self._ahttp: Optional[Any] = None
+        self._inflight: Dict[Tuple[str, str], _Call] = {}
+        self._sync_inflight: Dict[Tuple[str, str], Future] = {}
+        self._streams: Dict[Tuple[str, str], Tuple[Any, _Stream]] = {}
+
+    def _http_clients(self):
+        # one keep-alive pool per process, shared by all models (same API host)
+        if self._http is None:
+            import httpx
+            limits = httpx.Limits(max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                                  max_keepalive_connections=LLM_HTTP_MAX_CONNECTIONS,
+                                  keepalive_expiry=LLM_HTTP_KEEPALIVE_S)
+            timeout = httpx.Timeout(float(os.getenv("ASK_LLM_TIMEOUT_S", "90")), connect=10.0)
+            self._http = httpx.Client(limits=limits, timeout=timeout)
+            self._ahttp = httpx.AsyncClient(limits=limits, timeout=timeout)
+        return self._http, self._ahttp
+
+    def _make_client(self, model: str):
+        from .rag import CHAT_PROVIDER
+        if CHAT_PROVIDER == "fake":
+            from .local_models import FakeChatModel
+            return FakeChatModel(model=model)
+        from langchain_openai import ChatOpenAI
+        http, ahttp = self._http_clients()
+        return ChatOpenAI(model=model, temperature=LLM_TEMPERATURE, http_client=http, http_async_client=ahttp)
+
+    def model(self, name: str) -> _Model:
+        m = self._models.get(name)
+        if m is None:
+            with self._lock:
+                m = self._models.get(name)
+                if m is None:
+                    m = self._models[name] = _Model(name, self._make_client(name))
+        return m
+
+    def client(self, name: str):
+        return self.model(name).client
+
+    # --- whole answers ---
+
+    async def ainvoke(self, model: str, prompt: str) -> str:
+        m = self.model(model)
+        if not LLM_COALESCE:
+            return await self._acall(m, prompt)
+        key = prompt_key(model, prompt)
+        loop = asyncio.get_running_loop()
+        call = self._inflight.get(key)
+        if call is not None and call.loop is loop:
+            with m.lock:
+                m.coalesced += 1
+        else:
+            call = self._inflight[key] = _Call(loop, loop.create_task(self._acall(m, prompt)))
+            call.task.add_done_callback(lambda _t, c=call: self._inflight.pop(key) if self._inflight.get(key) is c else None)
+        call.waiters += 1
+        try:
+            # shielded: one caller going away must not cancel the others' answer
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()  # nobody is left waiting for it
+            raise
+        finally:
+            call.waiters -= 1
+
+    async def _acall(self, m: _Model, prompt: str) -> str:
+        await m.acquire()
+        try:
+            resp = await m.client.ainvoke(prompt)
+        finally:
+            m.release()
+        return resp.content
+
+    def invoke(self, model: str, prompt: str) -> str:
+        m = self.model(model)
+        if not LLM_COALESCE:
+            return self._call(m, prompt)
+        key = prompt_key(model, prompt)
+        with self._lock:
+            fut = self._sync_inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._sync_inflight[key] = Future()
+        if not leader:
+            with m.lock:
+                m.coalesced += 1
+            return fut.result()
+        try:
+            fut.set_result(self._call(m, prompt))
+        except BaseException as e:
+            fut.set_exception(e)
+        finally:
+            with self._lock:
+                self._sync_inflight.pop(key, None)
+        return fut.result()
+
+    def _call(self, m: _Model, prompt: str) -> str:
+        m.acquire_sync()
+        try:
+            return m.client.invoke(prompt).content
+        finally:
+            m.release()
+
+    # --- streams ---
+
+    async def astream(self, model: str, prompt: str) -> AsyncIterator[str]:
+        m = self.model(model)
+        if not LLM_COALESCE:
+            async for part in self._astream(m, prompt):
+                yield part
+            return
+        key = prompt_key(model, prompt)
+        loop = asyncio.get_running_loop()
+        entry = self._streams.get(key)
+        if entry is not None and entry[0] is loop and entry[1].error is None:
+            st = entry[1]
+            with m.lock:
+                m.coalesced += 1
+        else:
+            st = _Stream()
+            self._streams[key] = (loop, st)
+            st.task = loop.create_task(self._pump(m, prompt, key, st))
+        st.waiters += 1
+        try:
+            async for part in st.follow():
+                yield part
+        finally:
+            st.waiters -= 1
+            if st.waiters == 0 and not st.task.done():
+                st.task.cancel()  # last listener left (client disconnect)
+
+    async def _pump(self, m: _Model, prompt: str, key, st: _Stream) -> None:
+        try:
+            async for part in self._astream(m, prompt):
+                await st.push(part)
+            await st.push(done=True)
+        except asyncio.CancelledError:
+            await st.push(error=asyncio.CancelledError())
+            raise
+        except BaseException as e:
+            await st.push(error=e)
+        finally:
+            # finished streams are not joined again: later identical asks hit the answer cache
+            if self._streams.get(key, (None, None))[1] is st:
+                self._streams.pop(key, None)
+
+    async def _astream(self, m: _Model, prompt: str) -> AsyncIterator[str]:
+        await m.acquire()
+        try:
+            async for chunk in m.client.astream(prompt):
+                if chunk.content:
+                    yield chunk.content
+        finally:
+            m.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limits": {"max_concurrency": LLM_MAX_CONCURRENCY, "max_queue": LLM_MAX_QUEUE,
+                       "queue_timeout_s": LLM_QUEUE_TIMEOUT_S, "coalesce": LLM_COALESCE,
+                       "http_max_connections": LLM_HTTP_MAX_CONNECTIONS},
+            "in_flight_prompts": len(self._inflight) + len(self._sync_inflight) + len(self._streams),
+            "models": {name: m.stats() for name, m in list(self._models.items())},
+        }
+
+    async def aclose(self) -> None:
+        if self._ahttp is not None:
+            await self._ahttp.aclose()
+        if self._http is not None:
+            self._http.close()
+        self._http = self._ahttp = None
+        self._models.clear()
+
+_POOL: Optional[LLMPool] = None
+_POOL_LOCK = threading.Lock()
+
+def get_llm_pool() -> LLMPool:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = LLMPool()
+    return _POOL
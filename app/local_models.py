@@ -0,0 +1,90 @@
+from __future__ import annotations
+import asyncio, hashlib, os, re, time
+from typing import Any, AsyncIterator, Iterator, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from .env import load as load_env
+load_env()
+
+# Offline stand-ins for OpenAI, selected with EMBED_PROVIDER=hash / CHAT_PROVIDER=fake.
+# Deterministic, so benchmark runs are comparable across versions.
+HASH_EMBED_DIM = int(os.getenv("HASH_EMBED_DIM", "256"))
+FAKE_LLM_TTFT_MS = float(os.getenv("FAKE_LLM_TTFT_MS", "300"))
+FAKE_LLM_TOKEN_MS = float(os.getenv("FAKE_LLM_TOKEN_MS", "15"))
+FAKE_LLM_TOKENS = int(os.getenv("FAKE_LLM_TOKENS", "60"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+class HashEmbeddings(Embeddings):
+    """Feature-hashed bag of words (+ bigrams), signed and L2-normalized.
+
+    Not semantic, but lexically similar texts land close together, which is
+    enough to exercise the dense path end to end without network calls.
+    """
+    def __init__(self, dim: int = HASH_EMBED_DIM):
+        self.dim = dim
+        self.model = f"hash-{dim}"
+
+    def _vector(self, text: str) -> List[float]:
+        toks = _TOKEN_RE.findall(text.lower())
+        v = np.zeros(self.dim, dtype=np.float32)
+        for feat in toks + [f"{a} {b}" for a, b in zip(toks, toks[1:])]:
+            h = int.from_bytes(hashlib.blake2b(feat.encode("utf-8"), digest_size=8).digest(), "little")
+            v[h % self.dim] += 1.0 if (h >> 63) else -1.0
+        n = float(np.linalg.norm(v))
+        return (v / n if n else v).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(text)
+
+class FakeChatModel:
+    """Drop-in for the slice of ChatOpenAI that app.rag uses.
+
+    Answers echo the start of the prompt's context snippets, so they are
+    deterministic; latency is ``ttft_ms`` to the first token plus ``token_ms``
+    for each one after it, for both whole and streamed responses.
+    """
+    def __init__(self, model: str = "fake", ttft_ms: float = FAKE_LLM_TTFT_MS,
+                 token_ms: float = FAKE_LLM_TOKEN_MS, tokens: int = FAKE_LLM_TOKENS, **_ignored: Any):
+        self.model_name = model
+        self.ttft_ms = ttft_ms
+        self.token_ms = token_ms
+        self.tokens = tokens
+
+    def _tokens(self, prompt: str) -> List[str]:
+        ctx = prompt.split("# Context (snippets):", 1)[-1]
+        words = _TOKEN_RE.findall(ctx)[: self.tokens - 1] or ["I", "don't", "know."]
+        return [w + " " for w in words] + ["[1]"]
+
+    def _total_ms(self, toks: List[str]) -> float:
+        return self.ttft_ms + self.token_ms * (len(toks) - 1)
+
+    def invoke(self, prompt: str, **_ignored: Any) -> AIMessage:
+        toks = self._tokens(prompt)
+        time.sleep(self._total_ms(toks) / 1000)
+        return AIMessage(content="".join(toks))
+
+    async def ainvoke(self, prompt: str, **_ignored: Any) -> AIMessage:
+        toks = self._tokens(prompt)
+        await asyncio.sleep(self._total_ms(toks) / 1000)
+        return AIMessage(content="".join(toks))
+
+    def stream(self, prompt: str, **_ignored: Any) -> Iterator[AIMessageChunk]:
+        time.sleep(self.ttft_ms / 1000)
+        for i, t in enumerate(self._tokens(prompt)):
+            if i:
+                time.sleep(self.token_ms / 1000)
+            yield AIMessageChunk(content=t)
+
+    async def astream(self, prompt: str, **_ignored: Any) -> AsyncIterator[AIMessageChunk]:
+        await asyncio.sleep(self.ttft_ms / 1000)
+        for i, t in enumerate(self._tokens(prompt)):
+            if i:
+                await asyncio.sleep(self.token_ms / 1000)
+            yield AIMessageChunk(content=t)
@@ -1,30 +1,39 @@
 from __future__ import annotations
+import time as _time
+_IMPORT_T0 = _time.perf_counter()
 
-import os
+import asyncio, os
 from typing import List, Optional, Dict, Any
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
 
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
 from .metrics import summarize
 
-from .debug_index import snapshot
-import time, uuid
+from .debug_index import iter_chunks, list_sources, snapshot
+import json, time, uuid
 from .utils import log_event
-from typing import Optional
-
-from .state import STATE
+from .event_log import close_writers
+from .embed_cache import get_embed_cache
+from .ingest.staging import release_lease
+from .metrics_rollup import get_rollup
+from .jobs import JobQueueFull, get_ingest_jobs, get_jobs
+from .llm_pool import LLMOverloaded, get_llm_pool
+from .warmup import WARMUP_ENABLED, get_warmup
+from .tracing import current as current_trace, span, trace
 
 from dotenv import load_dotenv
 from .env import load as load_env  # if you added env loader earlier
 load_env()
 
-from .ingest.index import ingest_paths
+from .ingest.index import ingest_paths, submit_ingest_job
 from .retriever.hybrid import get_hybrid_retriever
-from .rag import rag_ask
-from .rag import answer_with_llm
+from .retriever.pool import get_pool
+from .answer_cache import cache_key, get_answer_cache
+from .rag import aanswer_with_llm, astream_answer, format_citations, normalize_team, _resolve_model
 
 app = FastAPI(title="Skyro RAG Demo", version="0.1.0")
 
@@ -36,11 +45,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Keep BM25 ref after /ingest
-_STATE: Dict[str, Any] = {"bm25": None}
+# Per-stage budgets for /ask; on expiry the pending work is cancelled and we return 504
+RETRIEVAL_TIMEOUT_S = float(os.getenv("ASK_RETRIEVAL_TIMEOUT_S", "15"))
+LLM_TIMEOUT_S = float(os.getenv("ASK_LLM_TIMEOUT_S", "90"))
+ASK_BATCH_MAX = int(os.getenv("ASK_BATCH_MAX", "500"))
+ASK_BATCH_CONCURRENCY = int(os.getenv("ASK_BATCH_CONCURRENCY", "8"))
 
 class IngestRequest(BaseModel):
     paths: List[str]
+    team: Optional[str] = None
 
 class AskRequest(BaseModel):
     question: str
@@ -48,90 +61,521 @@ class AskRequest(BaseModel):
     team: Optional[str] = None
     model: Optional[str] = None 
 
+class AskBatchRequest(BaseModel):
+    questions: List[str]
+    user_id: Optional[str] = None
+    team: Optional[str] = None
+    model: Optional[str] = None
+
+class EvalJobRequest(BaseModel):
+    k: List[int] = [8]
+    fusion: List[str] = ["concat"]
+    backend: Optional[List[str]] = None
+
 class FeedbackRequest(BaseModel):
     answer_id: str
     helpful: bool
     comment: Optional[str] = None
 
+@app.on_event("startup")
+def warm_retriever_pool():
+    # Open the index, sparse index and caches in the background so the first
+    # /ask doesn't pay for it; /health answers meanwhile, /ready says when done
+    if WARMUP_ENABLED:
+        get_warmup().start(import_ms=IMPORT_MS)
+
+@app.on_event("shutdown")
+def flush_event_log():
+    # Drain the background log writer so the last events reach disk
+    close_writers()
+    get_rollup().flush()
+    cache = get_embed_cache()
+    if cache is not None:
+        cache.flush()  # buffered last_used of cache hits
+    release_lease()  # our index generation may be pruned now
+
+@app.on_event("shutdown")
+async def close_llm_pool():
+    await get_llm_pool().aclose()
+
+@app.exception_handler(LLMOverloaded)
+def llm_overloaded(request: Request, exc: LLMOverloaded):
+    # the model's admission queue is full: tell the client when to come back
+    return JSONResponse(status_code=429, content={"detail": str(exc)},
+                        headers={"Retry-After": str(max(1, int(round(exc.retry_after_s))))})
+
 @app.get("/health")
 def health():
     return {"ok": True}
 
+@app.get("/ready")
+def ready():
+    w = get_warmup()
+    if w.state == "failed":
+        w.start()  # retry; the index may have appeared since
+    status = w.status()
+    if not status["ready"] and WARMUP_ENABLED:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
 @app.post("/ingest")
 def ingest(req: IngestRequest):
-    res = ingest_paths(req.paths)
-    STATE["bm25"] = res.get("bm25")
-    return {"status": "ok", "indexed": res["indexed"], "chunks": res["chunks"]}
+    res = ingest_paths(req.paths, team=req.team)
+    return {"status": "ok", **res}
 
-@app.post("/ask")
-def ask(req: AskRequest):
-    retriever = get_hybrid_retriever(bm25=_STATE.get("bm25"))
+@app.post("/ingest/jobs", status_code=202)
+def ingest_job(req: IngestRequest):
+    try:
+        job = submit_ingest_job(req.paths, team=req.team)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return job.to_dict(with_result=False)
 
-    t0 = time.perf_counter()
-    docs = retriever.get_relevant_documents(req.question)
-    t_retrieval = int((time.perf_counter() - t0) * 1000)
+@app.get("/ingest/jobs")
+def ingest_jobs():
+    return [j.to_dict(with_result=False) for j in get_ingest_jobs().list(kind="ingest")]
 
-    if not docs:
-        resp = {
-            "answer": "I don’t have enough relevant context to answer. Please refine or add docs.",
-            "citations": "",
-            "model": req.model or os.getenv("CHAT_MODEL", "gpt-4o-mini"),
-            "latency_ms": t_retrieval,
-            "answer_id": str(uuid.uuid4()),
-        }
-        log_event({
-            "type":"ask",
-            "answer_id": resp["answer_id"],
-            "q": req.question,
-            "model": resp["model"],
-            "retrieval_ms": t_retrieval,
-            "llm_ms": 0,
-            "latency_ms": t_retrieval,
-            "retrieved": [],
-            "citations": "",
-            "tokens": None,
-            "no_docs": True,
-        })
-        return resp
+@app.get("/ingest/jobs/{job_id}")
+def ingest_job_status(job_id: str):
+    job = get_ingest_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown job")
+    return job.to_dict()
 
-    t1 = time.perf_counter()
-    out = answer_with_llm(req.question, docs, model=req.model)
-    t_llm = int((time.perf_counter() - t1) * 1000)
-    latency_ms = t_retrieval + t_llm
+@app.delete("/ingest/jobs/{job_id}")
+def ingest_job_cancel(job_id: str):
+    job = get_ingest_jobs().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown job")
+    return job.to_dict(with_result=False)
 
+async def _guarded(request: Request, coro, timeout: float, stage: str, req: Optional[AskRequest] = None,
+                   extra: Optional[Dict[str, Any]] = None):
+    """Await ``coro``; cancel it on timeout or when the client goes away.
+
+    Failures are logged as ``ask_error`` events when ``req`` is given.
+    """
+    task = asyncio.ensure_future(coro)
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    deadline = t0 + timeout
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise HTTPException(status_code=504, detail=f"{stage} timed out after {timeout:g}s")
+            done, _ = await asyncio.wait({task}, timeout=min(0.5, remaining))
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise HTTPException(status_code=499, detail="client disconnected")
+    except Exception as e:
+        if req is not None:
+            _log_ask_error(req, stage, _error_detail(e), int((loop.time() - t0) * 1000), extra=extra)
+        raise
+    finally:
+        if not task.done():
+            task.cancel()
+
+def _log_ask_error(req: AskRequest, stage: str, detail: str, elapsed_ms: int, stream: bool = False,
+                   answer_id: Optional[str] = None, extra: Optional[Dict[str, Any]] = None) -> None:
+    log_event({
+        "type": "ask_error",
+        "answer_id": answer_id,
+        "q": req.question,
+        "team": normalize_team(req.team),
+        "model": _resolve_model(req.model),
+        "stage": stage,
+        "error": detail,
+        "elapsed_ms": elapsed_ms,
+        "stream": stream or None,
+        **_trace_fields(),
+        **(extra or {}),
+    })
+
+def _error_detail(e: Exception) -> str:
+    return e.detail if isinstance(e, HTTPException) else f"{type(e).__name__}: {e}"
+
+def _cache_lookup(req: AskRequest):
+    """-> (cache, key, cached answer or None); cache is None when disabled."""
+    cache = get_answer_cache()
+    if cache is None:
+        return None, None, None
+    with span("cache"):
+        key = cache_key(req.question, _resolve_model(req.model), get_pool().index_version(), normalize_team(req.team))
+        return cache, key, cache.get(key)
+
+def _trace_fields() -> Dict[str, Any]:
+    # per-stage span durations (and a profile path, if sampled) for the logged event
+    tr = current_trace()
+    return tr.fields() if tr is not None else {}
+
+def _log_cache_hit(req: AskRequest, hit: Dict[str, Any], answer_id: str, latency_ms: int, stream: bool = False,
+                   extra: Optional[Dict[str, Any]] = None):
+    evt = {
+        "type":"ask",
+        "answer_id": answer_id,
+        "q": req.question,
+        "team": normalize_team(req.team),
+        "model": hit.get("model"),
+        "retrieval_ms": 0,
+        "llm_ms": 0,
+        "latency_ms": latency_ms,
+        "retrieved": hit.get("retrieved", []),
+        "citations": hit.get("citations",""),
+        "tokens": None,
+        "cache": "hit",
+    }
+    if stream:
+        evt["ttft_ms"] = 0
+        evt["stream"] = True
+    evt.update(_trace_fields())
+    evt.update(extra or {})
+    log_event(evt)
+
+def _no_docs_answer(req: AskRequest, t_retrieval: int, extra: Optional[Dict[str, Any]] = None,
+                    answer_id: Optional[str] = None, stream: bool = False) -> Dict[str, Any]:
+    resp = {
+        "answer": "I don’t have enough relevant context to answer. Please refine or add docs.",
+        "citations": "",
+        "model": req.model or os.getenv("CHAT_MODEL", "gpt-4o-mini"),
+        "latency_ms": t_retrieval,
+        "answer_id": answer_id or str(uuid.uuid4()),
+    }
+    if stream:
+        extra = {"ttft_ms": None, "stream": True, **(extra or {})}
+    log_event({
+        "type":"ask",
+        "answer_id": resp["answer_id"],
+        "q": req.question,
+        "team": normalize_team(req.team),
+        "model": resp["model"],
+        "retrieval_ms": t_retrieval,
+        "llm_ms": 0,
+        "latency_ms": t_retrieval,
+        "retrieved": [],
+        "citations": "",
+        "tokens": None,
+        "no_docs": True,
+        **_trace_fields(),
+        **(extra or {}),
+    })
+    return resp
+
+def _record_answer(req: AskRequest, out: Dict[str, Any], docs, t_retrieval: int, t_llm: int,
+                   cache, ckey, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    latency_ms = t_retrieval + t_llm
     answer_id = str(uuid.uuid4())
     out["answer_id"] = answer_id
     out["latency_ms"] = latency_ms
 
     usage = out.get("usage") if isinstance(out, dict) else None
+    retrieved = [d.metadata.get("source") for d in docs]
+    if cache is not None:
+        cache.put(ckey, {"answer": out["answer"], "citations": out.get("citations",""),
+                         "model": out.get("model"), "retrieved": retrieved})
 
     log_event({
         "type":"ask",
         "answer_id": answer_id,
         "q": req.question,
+        "team": normalize_team(req.team),
         "model": out.get("model"),
         "retrieval_ms": t_retrieval,
         "llm_ms": t_llm,
         "latency_ms": latency_ms,
-        "retrieved": [d.metadata.get("source") for d in docs],
+        "retrieved": retrieved,
         "citations": out.get("citations",""),
         "tokens": usage,
+        "cache": "miss" if cache is not None else None,
+        **_trace_fields(),
+        **(extra or {}),
     })
     return out
 
+@app.post("/ask")
+async def ask(req: AskRequest, request: Request):
+    with trace():
+        return await _ask(req, request)
+
+async def _ask(req: AskRequest, request: Request):
+    t0 = time.perf_counter()
+    cache, ckey, hit = _cache_lookup(req)
+    if hit is not None:
+        answer_id = str(uuid.uuid4())
+        latency_ms = int((time.perf_counter() - t0) * 1000)
+        _log_cache_hit(req, hit, answer_id, latency_ms)
+        return {"answer": hit["answer"], "citations": hit["citations"], "model": hit["model"],
+                "answer_id": answer_id, "latency_ms": latency_ms}
+
+    retriever = get_hybrid_retriever(team=req.team)
+    docs = await _guarded(request, retriever.aget_relevant_documents(req.question), RETRIEVAL_TIMEOUT_S, "retrieval", req)
+    t_retrieval = int((time.perf_counter() - t0) * 1000)
+
+    if not docs:
+        return _no_docs_answer(req, t_retrieval)
+
+    t1 = time.perf_counter()
+    out = await _guarded(request, aanswer_with_llm(req.question, docs, model=req.model), LLM_TIMEOUT_S, "llm", req)
+    t_llm = int((time.perf_counter() - t1) * 1000)
+    return _record_answer(req, out, docs, t_retrieval, t_llm, cache, ckey)
+
+@app.post("/ask/batch")
+async def ask_batch(req: AskBatchRequest, request: Request):
+    """Many questions at once, answered as NDJSON lines (one per question, in completion order).
+
+    Cache hits are answered first; the rest share one embedding request and
+    one vectorized dense + sparse retrieval, then go to the LLM with at most
+    ASK_BATCH_CONCURRENCY calls in flight. Each line carries the same fields
+    as /ask plus ``index``; failures come back as ``{"index", "error"}`` and
+    are logged as ``ask_error`` events, one per question, like /ask.
+    """
+    if not req.questions:
+        raise HTTPException(status_code=400, detail="questions is empty")
+    if len(req.questions) > ASK_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"at most {ASK_BATCH_MAX} questions per batch")
+    batch_id = str(uuid.uuid4())
+    extra = {"batch_id": batch_id}
+    items = [AskRequest(question=q, user_id=req.user_id, team=req.team, model=req.model) for q in req.questions]
+
+    async def lines():
+        t0 = time.perf_counter()
+        pending = []
+        for i, item in enumerate(items):
+            cache, ckey, hit = _cache_lookup(item)
+            if hit is not None:
+                answer_id = str(uuid.uuid4())
+                latency_ms = int((time.perf_counter() - t0) * 1000)
+                _log_cache_hit(item, hit, answer_id, latency_ms, extra=extra)
+                yield json.dumps({"index": i, "answer": hit["answer"], "citations": hit["citations"], "model": hit["model"],
+                                  "answer_id": answer_id, "latency_ms": latency_ms}, ensure_ascii=False) + "\n"
+            else:
+                pending.append((i, item, cache, ckey))
+        if not pending:
+            return
+
+        retriever = get_hybrid_retriever(team=req.team)
+        try:
+            with trace(profile=False) as shared:
+                all_docs = await _guarded(
+                    request, retriever.abatch_get_relevant_documents([item.question for _, item, _, _ in pending]),
+                    RETRIEVAL_TIMEOUT_S, "retrieval")
+        except Exception as e:
+            # one retrieval for the whole batch: every pending question failed with it
+            detail, elapsed_ms = _error_detail(e), int((time.perf_counter() - t0) * 1000)
+            for i, item, _, _ in pending:
+                _log_ask_error(item, "retrieval", detail, elapsed_ms, extra=extra)
+                yield json.dumps({"index": i, "error": detail}, ensure_ascii=False) + "\n"
+            return
+        shared_spans = shared.to_dict()  # the batch's retrieval stages, reported on every answer
+        t_retrieval = int((time.perf_counter() - t0) * 1000)
+
+        sem = asyncio.Semaphore(ASK_BATCH_CONCURRENCY)
+
+        async def one(i, item, cache, ckey, docs):
+            with trace(profile=False) as tr:
+                tr.update(shared_spans)
+                return await _one(i, item, cache, ckey, docs)
+
+        async def _one(i, item, cache, ckey, docs):
+            if not docs:
+                return {"index": i, **_no_docs_answer(item, t_retrieval, extra)}
+            async with sem:
+                t1 = time.perf_counter()
+                try:
+                    out = await _guarded(request, aanswer_with_llm(item.question, docs, model=item.model),
+                                         LLM_TIMEOUT_S, "llm", item, extra)
+                except Exception as e:
+                    return {"index": i, "error": _error_detail(e)}  # logged by _guarded
+                t_llm = int((time.perf_counter() - t1) * 1000)
+            return {"index": i, **_record_answer(item, out, docs, t_retrieval, t_llm, cache, ckey, extra)}
+
+        tasks = [asyncio.create_task(one(i, item, cache, ckey, docs))
+                 for (i, item, cache, ckey), docs in zip(pending, all_docs)]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                yield json.dumps(await fut, ensure_ascii=False) + "\n"
+        finally:
+            for t in tasks:
+                t.cancel()  # client went away: stop the remaining LLM calls
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Batch-Id": batch_id})
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/ask/stream")
+async def ask_stream(req: AskRequest):
+    """Same pipeline as /ask, as server-sent events: citations, token*, done."""
+    async def events():
+        with trace():
+            async for ev in _events():
+                yield ev
+
+    async def _events():
+        answer_id = str(uuid.uuid4())
+        t0 = time.perf_counter()
+        cache, ckey, hit = _cache_lookup(req)
+        if hit is not None:
+            latency_ms = int((time.perf_counter() - t0) * 1000)
+            yield _sse("citations", {"answer_id": answer_id, "model": hit["model"], "citations": hit["citations"], "retrieval_ms": 0, "cache": "hit"})
+            yield _sse("token", {"t": hit["answer"]})
+            yield _sse("done", {"answer_id": answer_id, "latency_ms": latency_ms, "llm_ms": 0, "ttft_ms": 0})
+            _log_cache_hit(req, hit, answer_id, latency_ms, stream=True)
+            return
+
+        retriever = get_hybrid_retriever(team=req.team)
+        try:
+            docs = await asyncio.wait_for(retriever.aget_relevant_documents(req.question), RETRIEVAL_TIMEOUT_S)
+        except Exception as e:
+            detail = f"retrieval timed out after {RETRIEVAL_TIMEOUT_S:g}s" if isinstance(e, asyncio.TimeoutError) else str(e)
+            _log_ask_error(req, "retrieval", detail, int((time.perf_counter() - t0) * 1000), stream=True,
+                           answer_id=answer_id)
+            yield _sse("error", {"detail": detail})
+            return
+        t_retrieval = int((time.perf_counter() - t0) * 1000)
+
+        if not docs:
+            resp = _no_docs_answer(req, t_retrieval, answer_id=answer_id, stream=True)
+            yield _sse("citations", {"answer_id": answer_id, "model": resp["model"], "citations": "", "retrieval_ms": t_retrieval})
+            yield _sse("token", {"t": resp["answer"]})
+            yield _sse("done", {"answer_id": answer_id, "latency_ms": t_retrieval, "llm_ms": 0, "ttft_ms": None})
+            return
+
+        model = _resolve_model(req.model)
+        citations = format_citations(docs)
+        yield _sse("citations", {"answer_id": answer_id, "model": model, "citations": citations, "retrieval_ms": t_retrieval})
+
+        t1 = time.perf_counter()
+        deadline = t1 + LLM_TIMEOUT_S
+        t_first = None
+        parts: List[str] = []
+        usage: Dict[str, Any] = {}
+        stream = astream_answer(req.question, docs, model=req.model, usage=usage).__aiter__()
+        try:
+            while True:
+                # the deadline covers the wait for every token, the first one included
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                try:
+                    delta = await asyncio.wait_for(stream.__anext__(), remaining)
+                except StopAsyncIteration:
+                    break
+                if t_first is None:
+                    t_first = time.perf_counter()
+                parts.append(delta)
+                yield _sse("token", {"t": delta})
+        except Exception as e:
+            detail = f"llm timed out after {LLM_TIMEOUT_S:g}s" if isinstance(e, asyncio.TimeoutError) else str(e)
+            _log_ask_error(req, "llm", detail, int((time.perf_counter() - t0) * 1000), stream=True,
+                           answer_id=answer_id)
+            yield _sse("error", {"detail": detail})
+            return
+        finally:
+            await stream.aclose()
+        t_llm = int((time.perf_counter() - t1) * 1000)
+        ttft_ms = int((t_first - t1) * 1000) if t_first is not None else None
+        latency_ms = t_retrieval + t_llm
+        yield _sse("done", {"answer_id": answer_id, "latency_ms": latency_ms, "llm_ms": t_llm, "ttft_ms": ttft_ms})
+
+        retrieved = [d.metadata.get("source") for d in docs]
+        if cache is not None:
+            cache.put(ckey, {"answer": "".join(parts), "citations": citations, "model": model, "retrieved": retrieved})
+        log_event({
+            "type":"ask",
+            "answer_id": answer_id,
+            "q": req.question,
+            "team": normalize_team(req.team),
+            "model": model,
+            "retrieval_ms": t_retrieval,
+            "llm_ms": t_llm,
+            "ttft_ms": ttft_ms,
+            "latency_ms": latency_ms,
+            "retrieved": retrieved,
+            "citations": citations,
+            "tokens": usage or None,
+            "stream": True,
+            "cache": "miss" if cache is not None else None,
+            **_trace_fields(),
+        })
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.get("/metrics")
-def metrics():
-    return summarize()
+def metrics(window: Optional[str] = None):
+    try:
+        return summarize(window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 
+DEBUG_PAGE_MAX = 1000
 
 @app.get("/debug/index")
-def debug_index(limit: int = 200):
-    return snapshot(limit=limit)
+def debug_index(check: bool = False, limit: Optional[int] = None):
+    out = snapshot(check=check)
+    if limit is not None:
+        # ?limit= predates the paged listing: serve the first page of /debug/index/sources as before
+        out["sample_sources"] = [r["source"] for r in list_sources(limit=max(0, min(limit, DEBUG_PAGE_MAX)))["items"]]
+    return out
+
+@app.get("/debug/index/sources")
+def debug_index_sources(offset: int = 0, limit: int = 100, prefix: str = ""):
+    if offset < 0 or not 0 < limit <= DEBUG_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"need offset >= 0 and 0 < limit <= {DEBUG_PAGE_MAX}")
+    return list_sources(offset=offset, limit=limit, prefix=prefix)
+
+@app.get("/debug/index/chunks")
+def debug_index_chunks(source: Optional[str] = None, offset: int = 0, limit: int = 100, text: bool = True):
+    if offset < 0 or not 0 < limit <= DEBUG_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"need offset >= 0 and 0 < limit <= {DEBUG_PAGE_MAX}")
+    try:
+        total, rows = iter_chunks(source=source, offset=offset, limit=limit, text=text)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"source not indexed: {source}")
+    headers = {"X-Total-Count": str(total)}
+    if offset + limit < total:
+        headers["X-Next-Offset"] = str(offset + limit)
+
+    def lines():
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers=headers)
+
+@app.get("/debug/retriever")
+def debug_retriever():
+    return get_pool().status()
+
+@app.get("/debug/llm")
+def debug_llm():
+    return get_llm_pool().stats()
 
 @app.get("/eval")
 def eval_endpoint(k: int = 8):
     from .eval_runner import run_eval 
     return run_eval(k=k, path="eval/questions.jsonl")
+
+@app.post("/eval/jobs")
+def eval_job(req: EvalJobRequest):
+    from .eval_runner import submit_eval_job
+    try:
+        job = submit_eval_job(req.k, req.fusion, req.backend, path="eval/questions.jsonl")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job.to_dict(with_result=False)
+
+@app.get("/eval/jobs")
+def eval_jobs():
+    return [j.to_dict(with_result=False) for j in get_jobs().list(kind="eval")]
+
+@app.get("/eval/jobs/{job_id}")
+def eval_job_status(job_id: str):
+    job = get_jobs().get(job_id)
+    if job is None or job.kind != "eval":
+        raise HTTPException(status_code=404, detail="unknown job")
+    return job.to_dict()
     
 @app.post("/feedback")
 def feedback(req: FeedbackRequest):
@@ -148,3 +592,5 @@ app.mount("/ui", StaticFiles(directory="ui", html=True), name="ui")
 @app.get("/")
 def root():
     return {"open": "http://localhost:8000/ui/"}
+
+IMPORT_MS = int((_time.perf_counter() - _IMPORT_T0) * 1000)
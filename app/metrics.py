@@ -1,7 +1,7 @@
 from __future__ import annotations
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional
 import math
-from .utils import read_events
+from .metrics_rollup import SPAN_PREFIX, LogHistogram, get_rollup
 
 def _percentile(values: List[float], p: float) -> float:
     if not values: return 0.0
@@ -13,48 +13,62 @@ def _percentile(values: List[float], p: float) -> float:
     d1 = values[int(c)] * (k-f)
     return float(d0+d1)
 
-def summarize() -> Dict[str, Any]:
-    evts = read_events()
-    asks = [e for e in evts if e.get("type")=="ask"]
-    fbs  = [e for e in evts if e.get("type")=="feedback"]
+def _pcts(h: LogHistogram) -> Dict[str, float]:
+    return {"p50": h.percentile(50), "p95": h.percentile(95)}
 
-    lat = [e.get("latency_ms",0) for e in asks if isinstance(e.get("latency_ms"), (int,float))]
-    llm = [e.get("llm_ms",0) for e in asks if isinstance(e.get("llm_ms"), (int,float))]
-    ret = [e.get("retrieval_ms",0) for e in asks if isinstance(e.get("retrieval_ms"), (int,float))]
+# pipeline order for /metrics "stages"; unknown span names follow alphabetically
+_STAGE_ORDER = ["cache", "embed_query", "dense_search", "bm25", "fuse", "prompt", "llm"]
 
-    # helpful rate joins by answer_id
-    helpful_map = {e.get("answer_id"): e for e in fbs}
-    helpful_marks = []
-    for a in asks:
-        fb = helpful_map.get(a.get("answer_id"))
-        if fb is not None and isinstance(fb.get("helpful"), bool):
-            helpful_marks.append(1 if fb["helpful"] else 0)
+def _stages(hist: Dict[str, LogHistogram]) -> Dict[str, Dict[str, float]]:
+    names = [k[len(SPAN_PREFIX):] for k in hist if k.startswith(SPAN_PREFIX)]
+    names.sort(key=lambda n: (_STAGE_ORDER.index(n) if n in _STAGE_ORDER else len(_STAGE_ORDER), n))
+    out = {}
+    for n in names:
+        h = hist[SPAN_PREFIX + n]
+        out[n] = {"n": h.n, **_pcts(h), "p99": h.percentile(99)}
+    return out
 
-    by_model = {}
-    for a in asks:
-        m = a.get("model") or "unknown"
-        by_model.setdefault(m, {"n":0,"lat":[]})
-        by_model[m]["n"] += 1
-        if isinstance(a.get("latency_ms"), (int,float)):
-            by_model[m]["lat"].append(a["latency_ms"])
+def _by_team(agg) -> Dict[str, Dict[str, Any]]:
+    # traffic per team, joined with that team's share of the index (manifest stats)
+    from .retriever.pool import get_pool
+    try:
+        index = get_pool().manifest().stats.get("by_team", {})
+    except Exception:
+        index = {}
+    out: Dict[str, Dict[str, Any]] = {}
+    for t in sorted(set(agg.by_team) | set(index)):
+        d = agg.by_team.get(t)
+        out[t] = {
+            "n": d["n"] if d else 0,
+            "latency_ms": _pcts(d["lat"]) if d else None,
+            "retrieval_ms": _pcts(d["ret"]) if d else None,
+            "index": index.get(t),
+        }
+    return out
+
+def summarize(window: Optional[str] = None) -> Dict[str, Any]:
+    """Summary of ask/feedback events; ``window`` is one of 5m/1h/24h or None for all time."""
+    agg = get_rollup().aggregate(window)
+    hist = lambda key: agg.hist.get(key) or LogHistogram()
+    cache_total = agg.cache_hits + agg.cache_misses
 
     return {
-        "volume": len(asks),
-        "latency_ms": {
-            "p50": _percentile(lat, 50),
-            "p95": _percentile(lat, 95),
-        },
-        "retrieval_ms": {
-            "p50": _percentile(ret, 50),
-            "p95": _percentile(ret, 95),
-        },
-        "llm_ms": {
-            "p50": _percentile(llm, 50),
-            "p95": _percentile(llm, 95),
+        "volume": agg.n,
+        "window": window or "all",
+        "latency_ms": _pcts(hist("latency_ms")),
+        "retrieval_ms": _pcts(hist("retrieval_ms")),
+        "llm_ms": _pcts(hist("llm_ms")),
+        "ttft_ms": _pcts(hist("ttft_ms")),
+        "stages": _stages(agg.hist),
+        "answer_cache": {
+            "hits": agg.cache_hits,
+            "misses": agg.cache_misses,
+            "hit_rate": (agg.cache_hits / cache_total) if cache_total else None,
         },
-        "helpful_rate": (sum(helpful_marks)/len(helpful_marks)) if helpful_marks else None,
+        "helpful_rate": (agg.helpful_sum / agg.helpful_n) if agg.helpful_n else None,
+        "by_team": _by_team(agg),
         "by_model": {
-            m: {"n": d["n"], "latency_p50": _percentile(d["lat"], 50), "latency_p95": _percentile(d["lat"], 95)}
-            for m, d in by_model.items()
+            m: {"n": d["n"], "latency_p50": d["lat"].percentile(50), "latency_p95": d["lat"].percentile(95)}
+            for m, d in agg.by_model.items()
         }
     }
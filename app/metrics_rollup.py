@@ -0,0 +1,357 @@
+from __future__ import annotations
+import json, math, os, threading, time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .event_log import find_segment, flush_writer, open_segment, rotated_segments, segment_seq
+from .utils import _LOG_PATH
+
+CHECKPOINT_PATH = Path(os.getenv("METRICS_CHECKPOINT_PATH", ".logs/metrics_rollup.json"))
+# How many recent answer_ids are remembered for joining late feedback
+ANSWER_RETENTION = int(os.getenv("METRICS_ANSWER_RETENTION", "200000"))
+CHECKPOINT_EVERY_S = float(os.getenv("METRICS_CHECKPOINT_EVERY_S", "30"))
+
+WINDOWS = {"5m": 5, "1h": 60, "24h": 24 * 60}   # window -> minutes
+_SLOT_S = 60
+_MAX_SLOTS = max(WINDOWS.values())
+
+class LogHistogram:
+    """Mergeable log-bucketed histogram (HDR-style, ~1% relative error)."""
+    GAMMA = 1.02
+    _LOG_GAMMA = math.log(GAMMA)
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.n = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    _ZERO = -1  # bucket for v <= 0; [1/GAMMA, 1) shares the bucket below instead
+
+    def _bucket(self, v: float) -> int:
+        if v <= 0:
+            return self._ZERO
+        b = int(math.floor(math.log(v) / self._LOG_GAMMA))
+        return b - 1 if b == self._ZERO else b
+
+    def add(self, v: float) -> None:
+        b = self._bucket(v)
+        self.counts[b] = self.counts.get(b, 0) + 1
+        self.n += 1
+        self.min = v if self.min is None else min(self.min, v)
+        self.max = v if self.max is None else max(self.max, v)
+
+    def merge(self, other: "LogHistogram") -> "LogHistogram":
+        for b, c in other.counts.items():
+            self.counts[b] = self.counts.get(b, 0) + c
+        self.n += other.n
+        if other.n:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def percentile(self, p: float) -> float:
+        if not self.n:
+            return 0.0
+        rank = (self.n - 1) * (p / 100.0)
+        seen = 0
+        for b in sorted(self.counts, key=lambda b: (b != self._ZERO, b)):  # zeros first
+            seen += self.counts[b]
+            if seen > rank:
+                # geometric midpoint of the bucket, clamped to what we actually saw
+                v = 0.0 if b == self._ZERO else self.GAMMA ** (b + 0.5)
+                return float(min(max(v, self.min), self.max))
+        return float(self.max)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"c": {str(b): c for b, c in self.counts.items()}, "n": self.n, "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "LogHistogram":
+        h = cls()
+        h.counts = {int(b): c for b, c in d.get("c", {}).items()}
+        h.n, h.min, h.max = d.get("n", 0), d.get("min"), d.get("max")
+        return h
+
+_TIMINGS = ("latency_ms", "retrieval_ms", "llm_ms", "ttft_ms")
+NO_TEAM = "(none)"  # asks without a team (search the whole index)
+SPAN_PREFIX = "span."  # per-stage histograms from each event's "spans" (app/tracing.py)
+
+class _Agg:
+    """Everything summarize() needs for one time slot; merge() combines slots."""
+    def __init__(self):
+        self.n = 0
+        self.hist: Dict[str, LogHistogram] = {}
+        self.by_model: Dict[str, Dict[str, Any]] = {}
+        self.by_team: Dict[str, Dict[str, Any]] = {}   # team -> {n, lat, ret}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.helpful_n = 0
+        self.helpful_sum = 0
+
+    def _h(self, key: str) -> LogHistogram:
+        h = self.hist.get(key)
+        if h is None:
+            h = self.hist[key] = LogHistogram()
+        return h
+
+    def add_ask(self, e: Dict[str, Any]) -> None:
+        self.n += 1
+        for key in _TIMINGS:
+            if isinstance(e.get(key), (int, float)):
+                self._h(key).add(e[key])
+        for name, ms in (e.get("spans") or {}).items():
+            if isinstance(ms, (int, float)):
+                self._h(SPAN_PREFIX + name).add(ms)
+        m = e.get("model") or "unknown"
+        bm = self.by_model.setdefault(m, {"n": 0, "lat": LogHistogram()})
+        bm["n"] += 1
+        if isinstance(e.get("latency_ms"), (int, float)):
+            bm["lat"].add(e["latency_ms"])
+        bt = self._team(e.get("team") or NO_TEAM)
+        bt["n"] += 1
+        for key, short in (("latency_ms", "lat"), ("retrieval_ms", "ret")):
+            if isinstance(e.get(key), (int, float)):
+                bt[short].add(e[key])
+        if e.get("cache") == "hit":
+            self.cache_hits += 1
+        elif e.get("cache") == "miss":
+            self.cache_misses += 1
+
+    def _team(self, team: str) -> Dict[str, Any]:
+        bt = self.by_team.get(team)
+        if bt is None:
+            bt = self.by_team[team] = {"n": 0, "lat": LogHistogram(), "ret": LogHistogram()}
+        return bt
+
+    def mark(self, helpful: Optional[int], sign: int) -> None:
+        if helpful is None:
+            return
+        self.helpful_n += sign
+        self.helpful_sum += sign * helpful
+
+    def merge(self, other: "_Agg") -> "_Agg":
+        self.n += other.n
+        for k, h in other.hist.items():
+            self._h(k).merge(h)
+        for m, d in other.by_model.items():
+            bm = self.by_model.setdefault(m, {"n": 0, "lat": LogHistogram()})
+            bm["n"] += d["n"]
+            bm["lat"].merge(d["lat"])
+        for t, d in other.by_team.items():
+            bt = self._team(t)
+            bt["n"] += d["n"]
+            bt["lat"].merge(d["lat"])
+            bt["ret"].merge(d["ret"])
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+        self.helpful_n += other.helpful_n
+        self.helpful_sum += other.helpful_sum
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "n": self.n,
+            "hist": {k: h.to_dict() for k, h in self.hist.items()},
+            "by_model": {m: {"n": d["n"], "lat": d["lat"].to_dict()} for m, d in self.by_model.items()},
+            "by_team": {t: {"n": d["n"], "lat": d["lat"].to_dict(), "ret": d["ret"].to_dict()}
+                        for t, d in self.by_team.items()},
+            "cache": [self.cache_hits, self.cache_misses],
+            "helpful": [self.helpful_n, self.helpful_sum],
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "_Agg":
+        a = cls()
+        a.n = d.get("n", 0)
+        a.hist = {k: LogHistogram.from_dict(h) for k, h in d.get("hist", {}).items()}
+        a.by_model = {m: {"n": x["n"], "lat": LogHistogram.from_dict(x["lat"])} for m, x in d.get("by_model", {}).items()}
+        a.by_team = {t: {"n": x["n"], "lat": LogHistogram.from_dict(x["lat"]), "ret": LogHistogram.from_dict(x["ret"])}
+                     for t, x in d.get("by_team", {}).items()}
+        a.cache_hits, a.cache_misses = d.get("cache", [0, 0])
+        a.helpful_n, a.helpful_sum = d.get("helpful", [0, 0])
+        return a
+
+class MetricsRollup:
+    """Incremental aggregation over the event log.
+
+    ``refresh()`` reads only the bytes appended since the last call, following
+    the log across rotated segments (app/event_log.py), and folds them into an
+    all-time aggregate plus per-minute slots (kept for 24h, so 5m/1h/24h
+    windows are a merge of a few slots). State and the read position are
+    checkpointed, so a restart resumes where it stopped instead of re-reading
+    the whole log.
+    """
+    def __init__(self, log_path: Path = _LOG_PATH, checkpoint_path: Path = CHECKPOINT_PATH):
+        self.log_path = Path(log_path)
+        self.checkpoint_path = Path(checkpoint_path)
+        self._lock = threading.Lock()
+        self._reset()
+        self._last_checkpoint = 0.0
+        self._load_checkpoint()
+
+    def _reset(self) -> None:
+        # read position: seq the active file will get when rotated, byte offset, inode
+        self.seq = 1
+        self.offset = 0
+        self.inode: Optional[int] = None
+        self.total = _Agg()
+        self.slots: Dict[int, _Agg] = {}
+        # answer_id -> [slot, helpful mark or None]
+        self.answers: "OrderedDict[str, List[Any]]" = OrderedDict()
+
+    # --- ingestion ---
+
+    def observe(self, e: Dict[str, Any]) -> None:
+        t = e.get("type")
+        if t == "ask":
+            slot = int(e.get("ts", time.time()) // _SLOT_S)
+            self.total.add_ask(e)
+            self.slots.setdefault(slot, _Agg()).add_ask(e)
+            aid = e.get("answer_id")
+            if aid:
+                self.answers[aid] = [slot, None]
+                while len(self.answers) > ANSWER_RETENTION:
+                    self.answers.popitem(last=False)
+        elif t == "feedback":
+            entry = self.answers.get(e.get("answer_id"))
+            if entry is None or not isinstance(e.get("helpful"), bool):
+                return
+            slot, prev = entry
+            new = 1 if e["helpful"] else 0
+            # last feedback for an answer wins, as in the full-scan version
+            for agg in (self.total, self.slots.get(slot)):
+                if agg is not None:
+                    agg.mark(prev, -1)
+                    agg.mark(new, +1)
+            entry[1] = new
+
+    def _prune(self, now: float) -> None:
+        oldest = int(now // _SLOT_S) - _MAX_SLOTS
+        for s in [s for s in self.slots if s < oldest]:
+            del self.slots[s]
+
+    def _consume(self, f) -> int:
+        """Observe every complete line from ``f``; returns the bytes consumed."""
+        used = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # half-written last line; picked up next time
+            used += len(line)
+            if line.strip():
+                try:
+                    self.observe(json.loads(line))
+                except ValueError:
+                    continue
+        return used
+
+    def _drain_segments(self) -> None:
+        # Segments rotated since the last refresh: the one we were tailing is
+        # finished from the saved offset, later ones are read whole.
+        while True:
+            seg = find_segment(self.log_path, self.seq)
+            if seg is None:
+                later = [s for s in rotated_segments(self.log_path) if segment_seq(self.log_path, s) > self.seq]
+                if not later:
+                    return
+                self.seq, self.offset, self.inode = segment_seq(self.log_path, later[0]), 0, None
+                continue
+            try:
+                with open_segment(seg) as f:
+                    f.seek(self.offset)
+                    self._consume(f)
+            except FileNotFoundError:
+                continue  # compressed under us; find_segment now returns the .gz
+            self.seq, self.offset, self.inode = self.seq + 1, 0, None
+
+    def refresh(self) -> None:
+        flush_writer(self.log_path)
+        with self._lock:
+            for attempt in (0, 1):
+                self._drain_segments()
+                try:
+                    f = self.log_path.open("rb")
+                except FileNotFoundError:
+                    break
+                with f:
+                    ino = os.fstat(f.fileno()).st_ino
+                    if self.inode is not None and ino != self.inode:
+                        if attempt == 0 and self.offset:
+                            continue  # rotated since we listed segments; drain it first
+                        self.offset = 0
+                    if os.fstat(f.fileno()).st_size < self.offset:
+                        self.offset = 0  # truncated in place
+                    f.seek(self.offset)
+                    self.offset += self._consume(f)
+                    self.inode = ino
+                break
+            now = time.time()
+            self._prune(now)
+            if now - self._last_checkpoint >= CHECKPOINT_EVERY_S:
+                self._save_checkpoint()
+                self._last_checkpoint = now
+
+    # --- checkpoints ---
+
+    def _save_checkpoint(self) -> None:
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "log_path": str(self.log_path),
+            "seq": self.seq,
+            "offset": self.offset,
+            "inode": self.inode,
+            "total": self.total.to_dict(),
+            "slots": {str(s): a.to_dict() for s, a in self.slots.items()},
+            "answers": list(self.answers.items()),
+        }
+        tmp = self.checkpoint_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(payload), encoding="utf-8")
+        os.replace(tmp, self.checkpoint_path)
+
+    def _load_checkpoint(self) -> None:
+        if not self.checkpoint_path.exists():
+            return
+        try:
+            d = json.loads(self.checkpoint_path.read_text(encoding="utf-8"))
+        except ValueError:
+            return
+        if d.get("log_path") != str(self.log_path):
+            return
+        self.seq = d.get("seq", 1)
+        self.offset = d.get("offset", 0)
+        self.inode = d.get("inode")
+        self.total = _Agg.from_dict(d.get("total", {}))
+        self.slots = {int(s): _Agg.from_dict(a) for s, a in d.get("slots", {}).items()}
+        self.answers = OrderedDict((k, v) for k, v in d.get("answers", []))
+
+    def flush(self) -> None:
+        with self._lock:
+            self._save_checkpoint()
+
+    # --- queries ---
+
+    def aggregate(self, window: Optional[str] = None) -> _Agg:
+        self.refresh()
+        with self._lock:
+            if window is None:
+                return _Agg().merge(self.total)
+            if window not in WINDOWS:
+                raise ValueError(f"unknown window {window!r}; use one of {sorted(WINDOWS)}")
+            since = int(time.time() // _SLOT_S) - WINDOWS[window] + 1
+            out = _Agg()
+            for s, a in self.slots.items():
+                if s >= since:
+                    out.merge(a)
+            return out
+
+_ROLLUP: Optional[MetricsRollup] = None
+_ROLLUP_LOCK = threading.Lock()
+
+def get_rollup() -> MetricsRollup:
+    global _ROLLUP
+    if _ROLLUP is None:
+        with _ROLLUP_LOCK:
+            if _ROLLUP is None:
+                _ROLLUP = MetricsRollup()
+    return _ROLLUP
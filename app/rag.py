@@ -1,75 +1,220 @@
 from __future__ import annotations
 
-import os
+import asyncio, os
 from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
-from langchain_community.retrievers import BM25Retriever
+
+from .retriever.sparse import SparseIndex
+from .retriever.dense_mmap import MmapVectorStore
+from .embed_cache import CachedEmbeddings, get_embed_cache
+from .local_models import HashEmbeddings
+from .llm_pool import get_llm_pool
+from .context_pack import count_tokens, pack_context
+from .tracing import span
 
 from .env import load as load_env
 load_env()
 
 
 DB_DIR = os.getenv("RAG_DB_DIR", ".chroma")
+# Dense backend: "chroma" (default) or "mmap" (exact search over a memory-mapped
+# vector file in DB_DIR/dense; RAG_DENSE_DTYPE = float32 | float16 | int8)
+DENSE_BACKEND = os.getenv("RAG_DENSE_BACKEND", "chroma").lower()
+DENSE_DTYPE = os.getenv("RAG_DENSE_DTYPE", "float32").lower()
+COLLECTION_NAME = "skyro_rag"
+SPARSE_PATH = os.getenv("RAG_SPARSE_PATH", os.path.join(DB_DIR, "bm25.pkl"))
+# Index generations: every ingest that changes something builds DB_DIR/gen-<n>
+# (Chroma files, dense/, bm25.pkl, manifest.json) and publishes it by rewriting
+# DB_DIR/CURRENT (app/ingest/staging.py). Without CURRENT the flat layout in
+# DB_DIR itself is used, honouring RAG_SPARSE_PATH / RAG_MANIFEST_PATH.
+CURRENT_FILE = os.path.join(DB_DIR, "CURRENT")
+# Each published generation also gets a read-only mmap bundle (gen-<n>/bundle,
+# app/retriever/bundle.py) that /ask serves from; every worker re-reads CURRENT
+# at most every RAG_RELOAD_CHECK_S and maps the new bundle when it moved.
+BUNDLE_ENABLED = os.getenv("RAG_BUNDLE", "1") != "0"
+RELOAD_CHECK_S = float(os.getenv("RAG_RELOAD_CHECK_S", "1"))
+
+def active_index_dir() -> str:
+    try:
+        with open(CURRENT_FILE, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        name = ""
+    return os.path.join(DB_DIR, name) if name else DB_DIR
+
+def sparse_path(index_dir: Optional[str] = None) -> str:
+    index_dir = index_dir or active_index_dir()
+    return SPARSE_PATH if index_dir == DB_DIR else os.path.join(index_dir, "bm25.pkl")
+
+def bundle_path(index_dir: Optional[str] = None) -> str:
+    return os.path.join(index_dir or active_index_dir(), "bundle")
 EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
 CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
-
-def make_embeddings() -> OpenAIEmbeddings:
-    return OpenAIEmbeddings(model=EMBED_MODEL)
+# "openai" (default) or local stand-ins for offline runs and benchmarks:
+# EMBED_PROVIDER=hash, CHAT_PROVIDER=fake (see app/local_models.py)
+EMBED_PROVIDER = os.getenv("EMBED_PROVIDER", "openai").lower()
+CHAT_PROVIDER = os.getenv("CHAT_PROVIDER", "openai").lower()
+# Team partitions: ingest tags every chunk with metadata["team"] (SHARED_TEAM by
+# default); a caller with a team searches that team's chunks, plus shared ones
+# unless TEAM_INCLUDE_SHARED=0. No team = search everything.
+SHARED_TEAM = os.getenv("SHARED_TEAM", "shared")
+TEAM_INCLUDE_SHARED = os.getenv("TEAM_INCLUDE_SHARED", "1") not in ("0", "false", "no")
+
+def normalize_team(team: Optional[str]) -> Optional[str]:
+    team = (team or "").strip().lower()
+    return team or None
+
+def allowed_teams(team: Optional[str]) -> Optional[List[str]]:
+    """Team partitions a caller may search; None = no filter."""
+    team = normalize_team(team)
+    if team is None:
+        return None
+    return [team, SHARED_TEAM] if TEAM_INCLUDE_SHARED and team != SHARED_TEAM else [team]
+
+def make_embeddings():
+    if EMBED_PROVIDER == "hash":
+        return HashEmbeddings()  # cheaper than a cache lookup
+    # Heavy SDK imports stay out of module import so the app starts fast (see app/warmup.py)
+    from langchain_openai import OpenAIEmbeddings
+    emb = OpenAIEmbeddings(model=EMBED_MODEL)
+    cache = get_embed_cache()
+    # Content-addressed cache: unchanged chunks and repeated queries skip the API
+    return CachedEmbeddings(emb, model=EMBED_MODEL, cache=cache) if cache else emb
 
 def chunk_docs(docs: List[Document]) -> List[Document]:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=800, chunk_overlap=150, length_function=len, is_separator_regex=False
     )
     return splitter.split_documents(docs)
 
-def build_or_load_vectorstore(chunks: List[Document]) -> Chroma:
-    vs = Chroma(
-        collection_name="skyro_rag",
-        embedding_function=make_embeddings(),
-        persist_directory=DB_DIR,  # using a persistent client under the hood
+def make_vectorstore(embeddings=None, backend: Optional[str] = None, index_dir: Optional[str] = None):
+    embeddings = embeddings or make_embeddings()
+    index_dir = index_dir or active_index_dir()
+    if (backend or DENSE_BACKEND) == "mmap":
+        return MmapVectorStore(os.path.join(index_dir, "dense"), embeddings, dtype=DENSE_DTYPE)
+    from langchain_chroma import Chroma
+    return Chroma(
+        collection_name=COLLECTION_NAME,
+        embedding_function=embeddings,
+        persist_directory=index_dir,  # using a persistent client under the hood
     )
+
+def build_or_load_vectorstore(
+    chunks: List[Document], vs=None, ids: Optional[List[str]] = None
+):
+    if vs is None:
+        vs = make_vectorstore()
     if chunks:
-        vs.add_documents(chunks)
+        # With ids Chroma upserts, so re-ingesting a chunk never duplicates it
+        vs.add_documents(chunks, ids=ids)
         try:
             vs.persist()  
         except AttributeError:
             pass
     return vs
 
+def delete_sources(vs, sources: List[str]) -> None:
+    if not sources:
+        return
+    if hasattr(vs, "delete_sources"):
+        vs.delete_sources(list(sources))
+    else:
+        vs._collection.delete(where={"source": {"$in": list(sources)}})
+
 
-def bm25_from_docs(docs: List[Document]) -> BM25Retriever:
-    return BM25Retriever.from_documents(docs, k=8)
+def bm25_from_docs(docs: List[Document]) -> SparseIndex:
+    idx = SparseIndex(k=8)
+    idx.add_documents(docs)
+    return idx
+
+def load_sparse_index(index_dir: Optional[str] = None) -> SparseIndex:
+    return SparseIndex.load(sparse_path(index_dir), k=8)
 
 class SimpleHybridRetriever:
-    """Version-agnostic hybrid retriever: interleave BM25 + dense."""
-    def __init__(self, vs, bm25=None, top_k: int = 8):
+    """Version-agnostic hybrid retriever: interleave BM25 + dense.
+
+    ``teams`` pre-filters both searches to chunks with that ``team`` metadata
+    (Chroma ``where``, mmap/BM25 partitions), so candidates are scored only
+    within the caller's partition.
+    """
+    def __init__(self, vs, bm25=None, top_k: int = 8, teams: Optional[List[str]] = None, dedup=None):
         self.vs = vs
+        self.dedup = dedup
         self.bm25 = bm25
         self.top_k = top_k
+        self.teams = teams
+
+    def _embedder(self):
+        return getattr(self.vs, "embedding_function", None) or getattr(self.vs, "embeddings", None)
+
+    def _dense_filter(self) -> Dict[str, Any]:
+        if self.teams is None:
+            return {}
+        if hasattr(self.vs, "search_by_vectors"):  # mmap backend
+            return {"teams": self.teams}
+        return {"filter": {"team": {"$in": list(self.teams)}}}
 
     def _dense_docs(self, query: str):
-        return self.vs.similarity_search(query, k=self.top_k) or []
+        emb = self._embedder()
+        if emb is None or not hasattr(self.vs, "similarity_search_by_vector"):
+            with span("dense_search"):
+                return self.vs.similarity_search(query, k=self.top_k, **self._dense_filter()) or []
+        # embed and search separately so each shows up as its own span
+        with span("embed_query"):
+            vec = emb.embed_query(query)
+        with span("dense_search"):
+            return self.vs.similarity_search_by_vector(vec, k=self.top_k, **self._dense_filter()) or []
 
     def _bm25_docs(self, query: str):
-        if not self.bm25:
+        if self.bm25 is None:
             return []
-        # LC<=0.1: get_relevant_documents ; LC>=0.2: invoke
-        try:
-            return self.bm25.get_relevant_documents(query)
-        except AttributeError:
-            return self.bm25.invoke(query)
+        with span("bm25"):
+            if hasattr(self.bm25, "search"):
+                return self.bm25.search(query, k=self.top_k, teams=self.teams)
+            # LC<=0.1: get_relevant_documents ; LC>=0.2: invoke
+            try:
+                docs = self.bm25.get_relevant_documents(query)
+            except AttributeError:
+                docs = self.bm25.invoke(query)
+            if self.teams is not None:  # langchain's BM25Retriever can't pre-filter
+                docs = [d for d in docs if d.metadata.get("team") in self.teams]
+            return docs
 
     def get_relevant_documents(self, query: str):
         dense_docs = self._dense_docs(query)
         bm25_docs = self._bm25_docs(query)
-
+        return self._fuse(dense_docs, bm25_docs)
+
+    async def aget_relevant_documents(self, query: str):
+        # Dense and BM25 are independent: run them side by side off the event loop
+        dense_docs, bm25_docs = await asyncio.gather(
+            asyncio.to_thread(self._dense_docs, query),
+            asyncio.to_thread(self._bm25_docs, query),
+        )
+        return self._fuse(dense_docs, bm25_docs)
+
+    def _fuse(self, dense_docs, bm25_docs):
+        with span("fuse"):
+            return self._with_aliases(self._fuse_docs(dense_docs, bm25_docs))
+
+    def _with_aliases(self, docs):
+        # near-duplicates were folded into one chunk at ingest; cite every source that had it
+        if self.dedup is None:
+            return docs
+        for d in docs:
+            aliases = self.dedup.alias_sources(d.metadata.get("chunk_id", ""))
+            if aliases:
+                d.metadata["aliases"] = aliases
+        return docs
+
+    def _fuse_docs(self, dense_docs, bm25_docs):
         seen = set()
         def _key(d):
+            if d.metadata.get("chunk_id"):
+                return d.metadata["chunk_id"]
             return (
                 d.metadata.get("source"),
                 d.metadata.get("page"),
@@ -98,9 +243,48 @@ class SimpleHybridRetriever:
         return combined
 
 
-def make_retriever(vs: Chroma, bm25: Optional[BM25Retriever] = None):
+    # --- batches: one embedding request and vectorized search for N questions ---
+
+    def _dense_docs_batch(self, queries: List[str]) -> List[List[Document]]:
+        emb = self._embedder()
+        if emb is None:
+            return [self._dense_docs(q) for q in queries]
+        with span("embed_query"):
+            vecs = emb.embed_documents(list(queries))  # one request (and one cache lookup) for the batch
+        with span("dense_search"):
+            if hasattr(self.vs, "search_by_vectors"):
+                return self.vs.search_by_vectors(vecs, k=self.top_k, teams=self.teams)
+            collection = getattr(self.vs, "_collection", None)
+            if collection is not None:
+                where = self._dense_filter().get("filter")
+                res = collection.query(query_embeddings=vecs, n_results=self.top_k, where=where,
+                                       include=["documents", "metadatas"])
+                return [
+                    [Document(page_content=t or "", metadata=m or {}) for t, m in zip(texts, metas)]
+                    for texts, metas in zip(res["documents"], res["metadatas"])
+                ]
+            return [self.vs.similarity_search_by_vector(v, k=self.top_k, **self._dense_filter()) for v in vecs]
+
+    def _bm25_docs_batch(self, queries: List[str]) -> List[List[Document]]:
+        if self.bm25 is not None and hasattr(self.bm25, "search_batch"):
+            with span("bm25"):
+                return self.bm25.search_batch(list(queries), k=self.top_k, teams=self.teams)
+        return [self._bm25_docs(q) for q in queries]
+
+    def batch_get_relevant_documents(self, queries: List[str]) -> List[List[Document]]:
+        dense, sparse = self._dense_docs_batch(queries), self._bm25_docs_batch(queries)
+        return [self._fuse(d, b) for d, b in zip(dense, sparse)]
+
+    async def abatch_get_relevant_documents(self, queries: List[str]) -> List[List[Document]]:
+        dense, sparse = await asyncio.gather(
+            asyncio.to_thread(self._dense_docs_batch, queries),
+            asyncio.to_thread(self._bm25_docs_batch, queries),
+        )
+        return [self._fuse(d, b) for d, b in zip(dense, sparse)]
+
+def make_retriever(vs, bm25: Optional[SparseIndex] = None, teams: Optional[List[str]] = None, dedup=None):
     # No .as_retriever(); we use vs.similarity_search inside SimpleHybridRetriever
-    return SimpleHybridRetriever(vs=vs, bm25=bm25, top_k=8)
+    return SimpleHybridRetriever(vs=vs, bm25=bm25, top_k=8, teams=teams, dedup=dedup)
 
 
 def format_citations(docs: List[Document]) -> str:
@@ -116,7 +300,9 @@ def format_citations(docs: List[Document]) -> str:
         preview = d.page_content.strip().replace("\n", " ")
         if len(preview) > 280:
             preview = preview[:280] + "..."
-        lines.append(f"[{i}] {src} {f'— {sect}' if sect else ''}\n    “{preview}”")
+        also = d.metadata.get("aliases") or []
+        also = f" (also in: {', '.join(also)})" if also else ""
+        lines.append(f"[{i}] {src}{also} {f'— {sect}' if sect else ''}\n    “{preview}”")
     return "\n".join(lines)
 
 SYSTEM_PROMPT = (
@@ -137,14 +323,16 @@ def _normalize_model(name: str | None) -> str | None:
         return None
     return name if name in ALLOWED_MODELS else None
 
-def answer_with_llm(question: str, docs: list[Document], model: str | None = None) -> dict:
-    chat_model = _normalize_model(model) or os.getenv("CHAT_MODEL", "gpt-4o-mini")
-    llm = ChatOpenAI(model=chat_model, temperature=0.2)
+def _resolve_model(model: str | None) -> str:
+    return _normalize_model(model) or os.getenv("CHAT_MODEL", "gpt-4o-mini")
 
-    context_blocks = []
-    for i, d in enumerate(docs[:5], start=1):
-        context_blocks.append(f"[{i}] SOURCE={d.metadata.get('source','unknown')}\n{d.page_content}")
-    context = "\n\n".join(context_blocks)
+def prepare_prompt(question: str, docs: list[Document], model: str | None = None) -> tuple[str, dict]:
+    """Prompt plus token stats; the context is packed to the model's budget."""
+    with span("prompt"):
+        return _prepare_prompt(question, docs, model)
+
+def _prepare_prompt(question: str, docs: list[Document], model: str | None) -> tuple[str, dict]:
+    context, usage = pack_context(docs, model=model)
 
     prompt = (
         f"{SYSTEM_PROMPT}\n\n"
@@ -155,8 +343,41 @@ def answer_with_llm(question: str, docs: list[Document], model: str | None = Non
         f"- Cite snippets as [1], [2], etc.\n"
         f"- Do not invent facts outside the context.\n"
     )
-    resp = llm.invoke(prompt)
-    return {"answer": resp.content, "citations": format_citations(docs), "model": chat_model}
+    usage["prompt_tokens"] = count_tokens(prompt, model)
+    return prompt, usage
+
+def build_prompt(question: str, docs: list[Document], model: str | None = None) -> str:
+    return prepare_prompt(question, docs, model)[0]
+
+def make_chat(chat_model: str):
+    """The shared, pooled client for ``chat_model`` (app/llm_pool.py)."""
+    return get_llm_pool().client(chat_model)
+
+def answer_with_llm(question: str, docs: list[Document], model: str | None = None) -> dict:
+    chat_model = _resolve_model(model)
+    prompt, usage = prepare_prompt(question, docs, chat_model)
+    with span("llm"):
+        answer = get_llm_pool().invoke(chat_model, prompt)
+    return {"answer": answer, "citations": format_citations(docs), "model": chat_model, "usage": usage}
+
+async def aanswer_with_llm(question: str, docs: list[Document], model: str | None = None) -> dict:
+    chat_model = _resolve_model(model)
+    prompt, usage = prepare_prompt(question, docs, chat_model)
+    with span("llm"):
+        # identical prompts in flight share one call; raises LLMOverloaded when the model's queue is full
+        answer = await get_llm_pool().ainvoke(chat_model, prompt)
+    return {"answer": answer, "citations": format_citations(docs), "model": chat_model, "usage": usage}
+
+async def astream_answer(question: str, docs: list[Document], model: str | None = None,
+                         usage: dict | None = None):
+    """Yield answer text deltas as the model produces them; fills ``usage`` with prompt token stats."""
+    chat_model = _resolve_model(model)
+    prompt, stats = prepare_prompt(question, docs, chat_model)
+    if usage is not None:
+        usage.update(stats)
+    with span("llm"):
+        async for delta in get_llm_pool().astream(chat_model, prompt):
+            yield delta
 
 def rag_ask(question: str, retriever, model: str | None = None, **_ignored) -> dict:
     model = _normalize_model(model)
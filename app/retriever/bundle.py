@@ -0,0 +1,361 @@
+from __future__ import annotations
+import hashlib, json, os, shutil, time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from langchain_core.documents import Document
+
+from .sparse import SparseIndex, tokenize
+
+# Read-only snapshot of one index generation for serving: every file is a flat
+# array that np.load(mmap_mode="r") maps without parsing, so all workers (and
+# replicas on a shared volume) read the same pages from the OS cache instead of
+# each unpickling bm25.pkl / opening Chroma. Rows are chunks, in one order
+# shared by all columns:
+#
+#   header.json                    format, index version, counts, dim, teams, BM25 params
+#   vectors.npy  dense_ok.npy      (n, dim) float16 unit vectors; False = no vector
+#   team.npy                       int32 code into header["teams"]
+#   ids / text / meta .bin+.off.npy  utf-8 strings (meta = metadata JSON), offsets int64
+#   id_hash.npy  id_row.npy        sorted 64-bit hashes of chunk ids -> row
+#   term_hash.npy                  sorted 64-bit hashes of terms; row t of the postings
+#   post_ptr.npy post_doc.npy post_w.npy  CSR term -> (chunk row, BM25 weight)
+FORMAT = 1
+_BATCH_ROWS = 65536
+_EXPORT_BATCH = 4096
+
+def _hash64(strings: Iterable[str]) -> np.ndarray:
+    # 64-bit keys instead of a term dict: a collision needs ~4e9 distinct terms to get likely
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in strings),
+        dtype=np.uint64)
+
+def _write_strings(directory: str, name: str, values: Iterable[str]) -> None:
+    offsets = [0]
+    with open(os.path.join(directory, f"{name}.bin"), "wb") as f:
+        for v in values:
+            b = v.encode("utf-8")
+            f.write(b)
+            offsets.append(offsets[-1] + len(b))
+    np.save(os.path.join(directory, f"{name}.off.npy"), np.asarray(offsets, dtype=np.int64))
+
+class _Strings:
+    """Column of utf-8 strings in one mapped blob."""
+    def __init__(self, directory: str, name: str):
+        self.off = np.load(os.path.join(directory, f"{name}.off.npy"), mmap_mode="r")
+        path = os.path.join(directory, f"{name}.bin")
+        # a zero-length file can't be mapped
+        self.buf = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.zeros(0, np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.off) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.buf[int(self.off[i]):int(self.off[i + 1])].tobytes().decode("utf-8")
+
+# --- export ---
+
+def dense_vectors(vs, ids: List[str]) -> Iterable[Tuple[np.ndarray, np.ndarray]]:
+    """Batches of (float32 vectors, found mask) for ``ids`` from a Chroma or mmap store."""
+    for s in range(0, len(ids), _EXPORT_BATCH):
+        part = ids[s:s + _EXPORT_BATCH]
+        if hasattr(vs, "vectors_for"):
+            yield vs.vectors_for(part)
+            continue
+        got = vs._collection.get(ids=part, include=["embeddings"])
+        by_id = dict(zip(got["ids"], got["embeddings"]))
+        dim = len(next(iter(by_id.values()))) if by_id else 0
+        found = np.array([c in by_id for c in part], dtype=bool)
+        vecs = np.zeros((len(part), dim), dtype=np.float32)
+        for i, c in enumerate(part):
+            if found[i]:
+                vecs[i] = by_id[c]
+        yield vecs, found
+
+def write_bundle(directory: str, sparse: SparseIndex, vs, version: int) -> Optional[Dict[str, Any]]:
+    """Export ``sparse`` (chunks, BM25 postings) and ``vs`` (vectors) into ``directory``.
+
+    Written into a temp dir and renamed, so a reader maps a complete bundle or
+    none. Returns the header, or None for an empty index (no bundle).
+    """
+    t0 = time.perf_counter()
+    ids, weights = sparse._compiled()
+    shutil.rmtree(directory, ignore_errors=True)
+    if not ids or weights is None:
+        return None
+    tmp = f"{directory}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    save = lambda name, arr: np.save(os.path.join(tmp, f"{name}.npy"), arr)
+    n = len(ids)
+
+    # chunk columns
+    _write_strings(tmp, "ids", ids)
+    _write_strings(tmp, "text", (sparse.docs[c]["text"] for c in ids))
+    _write_strings(tmp, "meta", (json.dumps(sparse.docs[c]["metadata"], ensure_ascii=False, default=str) for c in ids))
+    team_of = [str(sparse.docs[c]["metadata"].get("team", "")) for c in ids]
+    teams = sorted(set(team_of))
+    code = {t: i for i, t in enumerate(teams)}
+    save("team", np.fromiter((code[t] for t in team_of), dtype=np.int32, count=n))
+    h = _hash64(ids)
+    order = np.argsort(h, kind="stable")
+    save("id_hash", h[order])
+    save("id_row", order.astype(np.int32))
+
+    # BM25 postings: one CSR row per term that still has chunks, rows in hash order
+    terms = [""] * weights.shape[0]
+    for t, i in sparse.vocab.items():
+        if i < len(terms):
+            terms[i] = t
+    live = np.flatnonzero(np.diff(weights.indptr) > 0)
+    th = _hash64(terms[i] for i in live)
+    order = np.argsort(th, kind="stable")
+    w = weights[live[order]]
+    save("term_hash", th[order])
+    save("post_ptr", w.indptr.astype(np.int64))
+    save("post_doc", w.indices.astype(np.int32))
+    save("post_w", w.data.astype(np.float32))
+
+    # dense: unit float16 rows in the same order, streamed in batches
+    vec, ok, dim = None, np.zeros(n, dtype=bool), 0
+    for s, (part, found) in zip(range(0, n, _EXPORT_BATCH), dense_vectors(vs, ids)):
+        if vec is None and part.shape[1]:
+            dim = int(part.shape[1])
+            vec = np.lib.format.open_memmap(os.path.join(tmp, "vectors.npy"), mode="w+", dtype=np.float16, shape=(n, dim))
+        if vec is None:
+            continue
+        norms = np.linalg.norm(part, axis=1, keepdims=True)
+        vec[s:s + len(part)] = (part / np.where(norms == 0, 1.0, norms)).astype(np.float16)
+        ok[s:s + len(part)] = found
+    if vec is None:
+        save("vectors", np.zeros((n, 0), dtype=np.float16))
+    else:
+        vec.flush()
+        del vec
+    save("dense_ok", ok)
+
+    header = {
+        "format": FORMAT, "version": version, "chunks": n, "dim": dim, "dtype": "float16",
+        "teams": teams, "terms": int(len(live)), "postings": int(w.nnz), "dense_missing": int(n - ok.sum()),
+        "k1": sparse.k1, "b": sparse.b, "created_at": time.time(),
+        "export_ms": int((time.perf_counter() - t0) * 1000),
+    }
+    with open(os.path.join(tmp, "header.json"), "w", encoding="utf-8") as f:
+        json.dump(header, f)
+    os.replace(tmp, directory)
+    return header
+
+# --- serving ---
+
+def _top_k_cols(cols: np.ndarray, vals: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the top ``k`` positive ``vals``, ties broken by lower column.
+
+    The entries of a sparse product row come unsorted; this avoids sorting them all.
+    """
+    sel = np.flatnonzero(vals > 0)
+    if len(sel) > k:
+        kth = np.partition(vals[sel], len(sel) - k)[len(sel) - k]
+        sel = sel[vals[sel] >= kth]
+    sel = sel[np.lexsort((cols[sel], -vals[sel]))]
+    return sel[:k]
+
+class IndexBundle:
+    """Memory-mapped, read-only index generation for /ask.
+
+    Fills both retriever slots of SimpleHybridRetriever: exact dense search
+    over the float16 vectors (``search_by_vectors`` / ``similarity_search``,
+    like MmapVectorStore) and BM25 over the postings (``search`` /
+    ``search_batch``, like SparseIndex). Nothing is copied into the process
+    beyond per-team row masks; ``teams`` filters both searches, BM25 by
+    masking the query terms' mapped postings.
+    """
+    def __init__(self, directory: str, embedding_function=None):
+        self.directory = directory
+        self.embedding_function = embedding_function
+        with open(os.path.join(directory, "header.json"), "r", encoding="utf-8") as f:
+            self.header: Dict[str, Any] = json.load(f)
+        self.version = self.header["version"]
+        self.k = 8
+        load = lambda name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        self._vec = load("vectors")
+        self._dense_ok = np.asarray(load("dense_ok"))
+        self._team = load("team")
+        self._id_hash, self._id_row = load("id_hash"), load("id_row")
+        self._term_hash = load("term_hash")
+        self._post_ptr, self._post_doc, self._post_w = load("post_ptr"), load("post_doc"), load("post_w")
+        self._ids, self._text, self._meta = (_Strings(directory, s) for s in ("ids", "text", "meta"))
+        self._masks: Dict[Tuple[str, ...], np.ndarray] = {}
+
+    @classmethod
+    def open(cls, directory: str, embedding_function=None) -> Optional["IndexBundle"]:
+        """The bundle in ``directory``, or None if there is none (or in another format)."""
+        try:
+            b = cls(directory, embedding_function)
+        except FileNotFoundError:
+            return None
+        return b if b.header.get("format") == FORMAT else None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def count(self) -> int:
+        return int(self._dense_ok.sum())
+
+    def _mask(self, teams: Optional[Iterable[str]]) -> Optional[np.ndarray]:
+        if teams is None:
+            return None
+        key = tuple(sorted(set(teams)))
+        m = self._masks.get(key)
+        if m is None:
+            codes = [i for i, t in enumerate(self.header["teams"]) if t in key]
+            m = self._masks[key] = np.isin(self._team, codes)
+        return m
+
+    def _doc(self, row: int) -> Document:
+        return Document(page_content=self._text[row], metadata=json.loads(self._meta[row]))
+
+    def row_of(self, chunk_id: str) -> Optional[int]:
+        h = _hash64([chunk_id])[0]
+        i = int(np.searchsorted(self._id_hash, h))
+        if i < len(self._id_hash) and self._id_hash[i] == h:
+            row = int(self._id_row[i])
+            return row if self._ids[row] == chunk_id else None
+        return None
+
+    def get(self, chunk_id: str) -> Optional[Document]:
+        row = self.row_of(chunk_id)
+        return None if row is None else self._doc(row)
+
+    # --- dense ---
+
+    def search_by_vectors(self, vectors: np.ndarray, k: int = 4,
+                          teams: Optional[List[str]] = None) -> List[List[Document]]:
+        queries = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        n = self._vec.shape[0]
+        if not n or not self._vec.shape[1]:
+            return [[] for _ in queries]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        qn = queries / np.where(norms == 0, 1.0, norms)
+        mask = self._mask(teams)
+        ok = self._dense_ok if mask is None else self._dense_ok & mask
+        rows = np.flatnonzero(ok) if mask is not None else None
+        m = n if rows is None else len(rows)
+        scores = np.empty((len(qn), m), dtype=np.float32)
+        for s in range(0, m, _BATCH_ROWS):
+            sel = slice(s, s + _BATCH_ROWS) if rows is None else rows[s:s + _BATCH_ROWS]
+            scores[:, s:s + _BATCH_ROWS] = qn @ np.asarray(self._vec[sel], dtype=np.float32).T
+        if rows is None:
+            scores[:, ~ok] = -np.inf
+        out = []
+        for row_scores in scores:
+            live = np.flatnonzero(np.isfinite(row_scores))
+            if len(live) > k:
+                live = live[np.argpartition(-row_scores[live], k - 1)[:k]]
+            top = live[np.argsort(-row_scores[live], kind="stable")]
+            out.append([self._doc(int(r)) for r in (top if rows is None else rows[top])])
+        return out
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    teams: Optional[List[str]] = None, **_ignored) -> List[Document]:
+        return self.search_by_vectors(np.asarray([embedding], dtype=np.float32), k=k, teams=teams)[0]
+
+    def similarity_search(self, query: str, k: int = 4, teams: Optional[List[str]] = None, **_ignored) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k=k, teams=teams)
+
+    # --- sparse ---
+
+    def _term_rows(self, query: str) -> np.ndarray:
+        h = np.unique(_hash64(tokenize(query)))
+        i = np.searchsorted(self._term_hash, h)
+        hit = i < len(self._term_hash)
+        i, h = i[hit], h[hit]
+        return i[self._term_hash[i] == h]
+
+    def _postings(self, term_rows: np.ndarray, teams: Optional[List[str]]) -> sp.csr_matrix:
+        """term_rows x chunk rows BM25 weights, gathered from the mapped postings.
+
+        Only these terms' postings are read; ``teams`` drops the other teams'
+        entries with the cached row mask, so nothing per team is materialized.
+        """
+        lo, hi = self._post_ptr[term_rows], self._post_ptr[term_rows + 1]
+        docs = np.concatenate([self._post_doc[a:b] for a, b in zip(lo, hi)])
+        w = np.concatenate([self._post_w[a:b] for a, b in zip(lo, hi)])
+        counts = hi - lo
+        if teams is not None:
+            keep = self._mask(teams)[docs]
+            docs, w = docs[keep], w[keep]
+            counts = np.bincount(np.repeat(np.arange(len(term_rows)), counts)[keep], minlength=len(term_rows))
+        ptr = np.concatenate([[0], np.cumsum(counts)])
+        return sp.csr_matrix((w, docs, ptr), shape=(len(term_rows), len(self)))
+
+    def _sparse_top(self, query: str, k: Optional[int], teams: Optional[List[str]]) -> List[Tuple[int, float]]:
+        term_rows = self._term_rows(query)
+        if not len(term_rows):
+            return []
+        weights = self._postings(term_rows, teams)
+        if not weights.nnz:
+            return []
+        scores = np.bincount(weights.indices, weights=weights.data, minlength=weights.shape[1]).astype(np.float32)
+        top = SparseIndex._top_k(scores, k or self.k)
+        return [(int(r), float(scores[r])) for r in top]
+
+    def _sparse_top_batch(self, queries: List[str], k: Optional[int],
+                          teams: Optional[List[str]]) -> List[List[Tuple[int, float]]]:
+        """Score all queries in one sparse product: (n_queries x terms) @ postings."""
+        k = k or self.k
+        per_q = [self._term_rows(q) for q in queries]
+        terms, col = np.unique(np.concatenate(per_q) if per_q else np.zeros(0, np.int64), return_inverse=True)
+        if not len(terms):
+            return [[] for _ in queries]
+        weights = self._postings(terms, teams)
+        if not weights.nnz:
+            return [[] for _ in queries]
+        qi = np.repeat(np.arange(len(queries)), [len(t) for t in per_q])
+        qmat = sp.csr_matrix((np.ones(len(qi), dtype=np.float32), (qi, col)), shape=(len(queries), len(terms)))
+        scores = (qmat @ weights).tocsr()
+        out = []
+        for i in range(len(queries)):
+            lo, hi = scores.indptr[i], scores.indptr[i + 1]
+            cols, vals = scores.indices[lo:hi], scores.data[lo:hi]
+            out.append([(int(cols[j]), float(vals[j])) for j in _top_k_cols(cols, vals, k)])
+        return out
+
+    def search_scores(self, query: str, k: Optional[int] = None,
+                      teams: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        return [(self._ids[r], score) for r, score in self._sparse_top(query, k, teams)]
+
+    def search_scores_batch(self, queries: List[str], k: Optional[int] = None,
+                            teams: Optional[List[str]] = None) -> List[List[Tuple[str, float]]]:
+        return [[(self._ids[r], score) for r, score in hits] for hits in self._sparse_top_batch(queries, k, teams)]
+
+    def search(self, query: str, k: Optional[int] = None, teams: Optional[List[str]] = None) -> List[Document]:
+        return [self._doc(r) for r, _ in self._sparse_top(query, k, teams)]
+
+    def search_batch(self, queries: List[str], k: Optional[int] = None,
+                     teams: Optional[List[str]] = None) -> List[List[Document]]:
+        return [[self._doc(r) for r, _ in hits] for hits in self._sparse_top_batch(queries, k, teams)]
+
+    def invoke(self, query: str) -> List[Document]:
+        return self.search(query)
+
+    def get_relevant_documents(self, query: str) -> List[Document]:
+        return self.search(query)
+
+    def stats(self) -> Dict[str, Any]:
+        h = self.header
+        try:
+            size = sum(os.path.getsize(os.path.join(self.directory, f)) for f in os.listdir(self.directory))
+        except FileNotFoundError:
+            size = None  # pruned while still mapped (or mid-listing)
+        return {
+            "dir": self.directory,
+            "version": self.version,
+            "chunks": h["chunks"],
+            "dim": h["dim"],
+            "terms": h["terms"],
+            "postings": h["postings"],
+            "dense_missing": h["dense_missing"],
+            "bytes": size,
+            "export_ms": h.get("export_ms"),
+        }
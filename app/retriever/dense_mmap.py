@@ -0,0 +1,296 @@
+from __future__ import annotations
+import json, os, shutil, sqlite3, threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+_BATCH_ROWS = 65536
+
+def _unshare(path: str) -> None:
+    """Give ``path`` its own inode before appending to it: a staged index
+    generation hard-links the vector files of the live one."""
+    if os.path.exists(path) and os.stat(path).st_nlink > 1:
+        tmp = f"{path}.tmp"
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, path)
+
+def _append(path: str, offset: int, data: bytes) -> None:
+    """Write ``data`` at ``offset``: the row count committed in meta.sqlite.
+
+    A run that died between writing vectors and committing their rows left
+    extra bytes at the end; they are cut so new rows line up with the sidecar.
+    """
+    _unshare(path)
+    with open(path, "ab") as f:
+        if f.tell() != offset:
+            f.truncate(offset)
+        f.write(data)
+
+class MmapVectorStore:
+    """Exact dense index: normalized vectors in one memory-mapped file.
+
+    Vectors are appended to ``vectors.bin`` (float32, float16, or int8 with a
+    per-row scale in ``scales.bin``); ids, text and metadata live in a SQLite
+    sidecar. Search is a batched matmul over the mapped rows plus argpartition
+    top-k. Upserts and deletes tombstone rows; ``compact()`` rewrites the file
+    once too many rows are dead.
+
+    Each row's ``team`` metadata is also kept in memory, so a search with
+    ``teams`` scores only that partition's rows.
+
+    Exposes the subset of the Chroma API this app uses: add_documents,
+    similarity_search(_by_vector), delete.
+    """
+    def __init__(self, directory: str, embedding_function, dtype: str = "float32"):
+        self.directory = directory
+        self.embedding_function = embedding_function
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._header_path = os.path.join(directory, "header.json")
+        self._vec_path = os.path.join(directory, "vectors.bin")
+        self._scale_path = os.path.join(directory, "scales.bin")
+        header = self._read_header()
+        self.dtype = header.get("dtype", dtype)
+        if self.dtype not in _DTYPES:
+            raise ValueError(f"unsupported dense dtype: {self.dtype}")
+        self.dim: Optional[int] = header.get("dim")
+        self._conn = sqlite3.connect(os.path.join(directory, "meta.sqlite"), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            " row INTEGER PRIMARY KEY, id TEXT NOT NULL, source TEXT, text TEXT NOT NULL,"
+            " metadata TEXT NOT NULL, alive INTEGER NOT NULL DEFAULT 1, team TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS rows_id ON rows(id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS rows_source ON rows(source)")
+        cols = {r[1] for r in self._conn.execute("PRAGMA table_info(rows)")}
+        if "team" not in cols:
+            # index built before team partitions: backfill from the stored metadata
+            self._conn.execute("ALTER TABLE rows ADD COLUMN team TEXT")
+            self._conn.execute("UPDATE rows SET team = COALESCE(json_extract(metadata, '$.team'), '')")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+        self._alive = np.zeros(self._count, dtype=bool)
+        self._team = np.empty(self._count, dtype=object)
+        for row, alive, team in self._conn.execute("SELECT row, alive, team FROM rows"):
+            self._alive[row] = bool(alive)
+            self._team[row] = team or ""
+        self._mat: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._mapped_rows = -1
+
+    # --- header / mapping ---
+
+    def _read_header(self) -> Dict[str, Any]:
+        if not os.path.exists(self._header_path):
+            return {}
+        with open(self._header_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_header(self) -> None:
+        tmp = f"{self._header_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype, "rows": self._count}, f)
+        os.replace(tmp, self._header_path)
+
+    def _matrix(self) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        with self._lock:
+            if self._mapped_rows != self._count:
+                if self._count and self.dim:
+                    self._mat = np.memmap(self._vec_path, dtype=_DTYPES[self.dtype], mode="r",
+                                          shape=(self._count, self.dim))
+                    self._scales = (np.memmap(self._scale_path, dtype=np.float32, mode="r", shape=(self._count,))
+                                    if self.dtype == "int8" else None)
+                else:
+                    self._mat, self._scales = None, None
+                self._mapped_rows = self._count
+            return self._mat, self._scales
+
+    # --- writes ---
+
+    def _encode(self, vecs: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs = vecs / np.where(norms == 0, 1.0, norms)
+        if self.dtype == "int8":
+            scale = np.abs(vecs).max(axis=1)
+            scale = np.where(scale == 0, 1.0, scale).astype(np.float32)
+            q = np.round(vecs / scale[:, None] * 127).astype(np.int8)
+            return q, scale / 127.0
+        return vecs.astype(_DTYPES[self.dtype]), None
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None, **_ignored) -> List[str]:
+        if not documents:
+            return []
+        ids = list(ids) if ids else [d.metadata.get("chunk_id") or f"row-{self._count + i}" for i, d in enumerate(documents)]
+        vecs = np.asarray(self.embedding_function.embed_documents([d.page_content for d in documents]), dtype=np.float32)
+        return self._add_vectors(documents, ids, vecs)
+
+    def _add_vectors(self, documents: List[Document], ids: List[str], vecs: np.ndarray) -> List[str]:
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vecs.shape[1])
+            elif vecs.shape[1] != self.dim:
+                raise ValueError(f"embedding dim {vecs.shape[1]} != index dim {self.dim}")
+            self._tombstone("id", ids)  # upsert: older rows with these ids die
+            enc, scales = self._encode(vecs)
+            start = self._count
+            _append(self._vec_path, start * self.dim * enc.itemsize, enc.tobytes())
+            if scales is not None:
+                _append(self._scale_path, start * 4, scales.astype(np.float32).tobytes())
+            self._conn.executemany(
+                "INSERT INTO rows (row, id, source, text, metadata, alive, team) VALUES (?, ?, ?, ?, ?, 1, ?)",
+                [
+                    (start + i, cid, str((d.metadata or {}).get("source", "")), d.page_content,
+                     json.dumps(d.metadata or {}, ensure_ascii=False), str((d.metadata or {}).get("team", "")))
+                    for i, (cid, d) in enumerate(zip(ids, documents))
+                ],
+            )
+            self._conn.commit()
+            self._count += len(ids)
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            self._team = np.concatenate([self._team, np.array(
+                [str((d.metadata or {}).get("team", "")) for d in documents], dtype=object)])
+            self._write_header()
+        return ids
+
+    def _tombstone(self, column: str, values: Iterable[str]) -> int:
+        values = list(values)
+        dead: List[int] = []
+        for s in range(0, len(values), 500):
+            part = values[s:s + 500]
+            marks = ",".join("?" * len(part))
+            dead += [r for (r,) in self._conn.execute(
+                f"SELECT row FROM rows WHERE alive = 1 AND {column} IN ({marks})", part)]
+        if dead:
+            self._conn.executemany("UPDATE rows SET alive = 0 WHERE row = ?", [(r,) for r in dead])
+            self._conn.commit()
+            self._alive[dead] = False
+        return len(dead)
+
+    def delete(self, ids: Optional[List[str]] = None, **_ignored) -> None:
+        with self._lock:
+            self._tombstone("id", ids or [])
+            self._maybe_compact()
+
+    def delete_sources(self, sources: List[str]) -> None:
+        with self._lock:
+            self._tombstone("source", sources)
+            self._maybe_compact()
+
+    def _maybe_compact(self, max_dead_ratio: float = 0.3) -> None:
+        if self._count and (1 - self._alive.mean()) > max_dead_ratio:
+            self.compact()
+
+    def compact(self) -> None:
+        """Rewrite vectors and sidecar keeping only live rows."""
+        with self._lock:
+            mat, scales = self._matrix()
+            keep = np.flatnonzero(self._alive)
+            tmp = f"{self._vec_path}.tmp"
+            with open(tmp, "wb") as f:
+                for s in range(0, len(keep), _BATCH_ROWS):
+                    f.write(np.ascontiguousarray(mat[keep[s:s + _BATCH_ROWS]]).tobytes() if mat is not None else b"")
+            if scales is not None:
+                with open(f"{self._scale_path}.tmp", "wb") as f:
+                    f.write(np.ascontiguousarray(scales[keep]).tobytes())
+            self._mat = self._scales = None
+            self._mapped_rows = -1
+            os.replace(tmp, self._vec_path)
+            if scales is not None:
+                os.replace(f"{self._scale_path}.tmp", self._scale_path)
+            self._conn.execute("DELETE FROM rows WHERE alive = 0")
+            self._conn.execute("CREATE TEMP TABLE remap AS SELECT row AS old, ROW_NUMBER() OVER (ORDER BY row) - 1 AS new FROM rows")
+            self._conn.execute("UPDATE rows SET row = -1 - (SELECT new FROM remap WHERE old = rows.row)")
+            self._conn.execute("UPDATE rows SET row = -1 - row")
+            self._conn.execute("DROP TABLE remap")
+            self._conn.commit()
+            self._count = len(keep)
+            self._alive = np.ones(self._count, dtype=bool)
+            self._team = self._team[keep]
+            self._write_header()
+
+    # --- reads ---
+
+    def count(self) -> int:
+        return int(self._alive.sum())
+
+    def _scores(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine scores (n_queries, n_rows), or (n_queries, len(rows)) for a subset; dead rows get -inf."""
+        mat, scales = self._matrix()
+        n = 0 if mat is None else mat.shape[0]
+        m = n if rows is None else len(rows)
+        out = np.empty((queries.shape[0], m), dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        qn = (queries / np.where(norms == 0, 1.0, norms)).astype(np.float32)
+        for s in range(0, m, _BATCH_ROWS):
+            sel = slice(s, s + _BATCH_ROWS) if rows is None else rows[s:s + _BATCH_ROWS]
+            block = np.asarray(mat[sel], dtype=np.float32)
+            out[:, s:s + _BATCH_ROWS] = qn @ block.T
+            if scales is not None:
+                out[:, s:s + _BATCH_ROWS] *= scales[sel]
+        if rows is None:
+            out[:, ~self._alive[:n]] = -np.inf
+        return out
+
+    def _rows_to_docs(self, rows: List[int]) -> List[Document]:
+        if not rows:
+            return []
+        marks = ",".join("?" * len(rows))
+        with self._lock:
+            got = {r: (t, m) for r, t, m in self._conn.execute(
+                f"SELECT row, text, metadata FROM rows WHERE row IN ({marks})", [int(r) for r in rows])}
+        return [Document(page_content=got[r][0], metadata=json.loads(got[r][1])) for r in rows if r in got]
+
+    def search_by_vectors(self, vectors: np.ndarray, k: int = 4,
+                          teams: Optional[List[str]] = None) -> List[List[Document]]:
+        """Batched exact top-k for several query vectors at once, optionally within ``teams``."""
+        # Held for the whole search so compaction can't renumber rows under us
+        with self._lock:
+            queries = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+            rows = None
+            if teams is not None:
+                n = len(self._alive)
+                rows = np.flatnonzero(self._alive & np.isin(self._team[:n], list(teams)))
+            scores = self._scores(queries, rows)
+            out = []
+            for row_scores in scores:
+                live = np.flatnonzero(np.isfinite(row_scores))
+                if len(live) > k:
+                    live = live[np.argpartition(-row_scores[live], k - 1)[:k]]
+                top = live[np.argsort(-row_scores[live], kind="stable")]
+                out.append(self._rows_to_docs([int(r) for r in (top if rows is None else rows[top])]))
+            return out
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    teams: Optional[List[str]] = None, **_ignored) -> List[Document]:
+        return self.search_by_vectors(np.asarray([embedding], dtype=np.float32), k=k, teams=teams)[0]
+
+    def similarity_search(self, query: str, k: int = 4, teams: Optional[List[str]] = None, **_ignored) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k=k, teams=teams)
+
+    def vectors_for(self, ids: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """(unit float32 vectors, found mask) for ``ids``, in that order (bundle export)."""
+        with self._lock:
+            mat, scales = self._matrix()
+            rows: Dict[str, int] = {}
+            for s in range(0, len(ids), 500):
+                part = ids[s:s + 500]
+                marks = ",".join("?" * len(part))
+                rows.update(self._conn.execute(
+                    f"SELECT id, row FROM rows WHERE alive = 1 AND id IN ({marks})", part).fetchall())
+            found = np.array([c in rows for c in ids], dtype=bool)
+            out = np.zeros((len(ids), self.dim or 0), dtype=np.float32)
+            if mat is not None and found.any():
+                sel = np.array([rows[c] for c in ids if c in rows])
+                block = np.asarray(mat[sel], dtype=np.float32)
+                if scales is not None:
+                    block *= scales[sel][:, None]
+                out[found] = block
+            return out, found
+
+    def list_records(self, limit: int = 200) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, source FROM rows WHERE alive = 1 ORDER BY row LIMIT ?", (limit,)).fetchall()
+        return [{"id": cid, "source": src or ""} for cid, src in rows]
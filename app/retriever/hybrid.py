@@ -1,11 +1,7 @@
 from __future__ import annotations
-from langchain_chroma import Chroma
-from ..rag import make_retriever, make_embeddings  # <-- add make_embeddings
+from typing import Optional
+from .pool import get_pool
 
-def get_hybrid_retriever(bm25=None):
-    vs = Chroma(
-        collection_name="skyro_rag",
-        persist_directory=".chroma",
-        embedding_function=make_embeddings(),   # <-- important
-    )
-    return make_retriever(vs, bm25=bm25)
+def get_hybrid_retriever(bm25=None, top_k: int = 8, team: Optional[str] = None):
+    # Reuses the process-wide Chroma client instead of opening a new one per call
+    return get_pool().retriever(bm25=bm25, top_k=top_k, team=team)
@@ -0,0 +1,254 @@
+from __future__ import annotations
+import threading, time
+from typing import Any, Dict, Optional
+
+from ..rag import (
+    active_index_dir, allowed_teams, bundle_path, make_embeddings, make_retriever, make_vectorstore,
+    load_sparse_index, sparse_path, BUNDLE_ENABLED, DENSE_BACKEND, DENSE_DTYPE, RELOAD_CHECK_S,
+)
+from ..embed_cache import get_embed_cache
+from ..ingest.dedup import DedupIndex, dedup_path
+from ..ingest.manifest import Manifest, manifest_path
+from ..ingest.staging import hold_lease
+from .bundle import IndexBundle
+from .sparse import SparseIndex
+from ..state import STATE
+
+class RetrieverPool:
+    """Process-wide dense vectorstore (Chroma or mmap), embeddings and sparse index, built once and
+    shared by all handlers.
+
+    /ask, /eval and /debug/index borrow the same vectorstore. Ingest builds a
+    new index generation off to the side and hands it over with swap(): the
+    handles are replaced in one step, so a request sees either the old
+    generation or the new one, never a mix. Borrowers that already hold the
+    old handles finish on them.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._vs = None
+        self._embeddings = None
+        self._sparse: Optional[SparseIndex] = None
+        self._manifest: Optional[Manifest] = None
+        self._dedup: Optional[DedupIndex] = None
+        self._bundle: Optional[IndexBundle] = None
+        self._bundle_checked = False
+        self._index_dir: Optional[str] = None  # generation the handles belong to
+        self._checked_at = time.monotonic()
+        self._reloading = False
+        self.reloads = 0
+        self.reload_error: Optional[str] = None
+        self.version = 0          # bumped on every invalidate() / swap()
+        self.built_at: Optional[float] = None
+        self.build_ms: Optional[int] = None
+        self.builds = 0
+        self.borrows = 0
+        self.last_error: Optional[str] = None
+
+    def _build(self):
+        t0 = time.perf_counter()
+        if self._embeddings is None:
+            self._embeddings = make_embeddings()
+        vs = make_vectorstore(self._embeddings, index_dir=self.index_dir())
+        self.build_ms = int((time.perf_counter() - t0) * 1000)
+        self.built_at = time.time()
+        self.builds += 1
+        return vs
+
+    def index_dir(self) -> str:
+        if self._index_dir is None:
+            with self._lock:
+                if self._index_dir is None:
+                    self._index_dir = active_index_dir()
+                    hold_lease(self._index_dir)
+        return self._index_dir
+
+    def vectorstore(self):
+        vs = self._vs
+        if vs is None:
+            with self._lock:
+                if self._vs is None:
+                    self._vs = self._build()
+                vs = self._vs
+        self.borrows += 1
+        return vs
+
+    def embeddings(self):
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = make_embeddings()
+        return self._embeddings
+
+    def sparse(self) -> SparseIndex:
+        if self._sparse is None:
+            with self._lock:
+                if self._sparse is None:
+                    self._sparse = load_sparse_index(self.index_dir())
+        return self._sparse
+
+    def dedup(self) -> DedupIndex:
+        """Near-duplicate clusters of the live generation (alias sources for citations)."""
+        if self._dedup is None:
+            with self._lock:
+                if self._dedup is None:
+                    self._dedup = DedupIndex.load(dedup_path(self.index_dir()))
+        return self._dedup
+
+    def bundle(self) -> Optional[IndexBundle]:
+        """The live generation's mmap bundle, or None (RAG_BUNDLE=0, or built before bundles)."""
+        if not self._bundle_checked:
+            with self._lock:
+                if not self._bundle_checked:
+                    self._bundle = IndexBundle.open(bundle_path(self.index_dir()), self.embeddings()) \
+                        if BUNDLE_ENABLED else None
+                    self._bundle_checked = True
+        return self._bundle
+
+    def manifest(self) -> Manifest:
+        """Ingest manifest as of the last /ingest (read-only: ingest works on its own copy)."""
+        m = self._manifest
+        if m is None:
+            with self._lock:
+                if self._manifest is None:
+                    self._manifest = Manifest.load(manifest_path(self.index_dir()))
+                m = self._manifest
+        return m
+
+    def index_version(self) -> int:
+        """Persistent index version from the ingest manifest (changes on every /ingest)."""
+        self.check_reload()
+        return self.manifest().version
+
+    def serving_backend(self) -> str:
+        """What /ask retrieves from: "bundle" while the live generation has one, else RAG_DENSE_BACKEND."""
+        return "bundle" if self.bundle() is not None else DENSE_BACKEND
+
+    def retriever(self, bm25=None, top_k: int = 8, team: Optional[str] = None):
+        # The retriever itself is a thin wrapper; only the vectorstore is expensive.
+        self.check_reload()
+        bundle = self.bundle() if bm25 is None else None
+        if bundle is not None:
+            vs, bm25 = bundle, bundle
+        else:
+            vs, bm25 = self.vectorstore(), bm25 if bm25 is not None else self.sparse()
+        r = make_retriever(vs, bm25=bm25, teams=allowed_teams(team), dedup=self.dedup())
+        r.top_k = top_k
+        return r
+
+    def check_reload(self) -> None:
+        """Start a background reload if another process published a new generation."""
+        now = time.monotonic()
+        if now - self._checked_at < RELOAD_CHECK_S or self._index_dir is None or self._reloading:
+            return
+        self._checked_at = now
+        hold_lease(self._index_dir)  # keeps prune() off the generation we still map
+        live = active_index_dir()
+        if live == self._index_dir:
+            return
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, args=(live,), name="index-reload", daemon=True).start()
+
+    def _reload(self, index_dir: str) -> None:
+        # requests keep using the old handles until the new ones are open
+        try:
+            bundle = IndexBundle.open(bundle_path(index_dir), self.embeddings()) if BUNDLE_ENABLED else None
+            vs = sparse = None
+            if bundle is None:  # no bundle: open the stores themselves, as warmup would
+                vs = make_vectorstore(self.embeddings(), index_dir=index_dir)
+                sparse = load_sparse_index(index_dir)
+            if self._index_dir != index_dir:  # not already swapped in by our own ingest
+                self.swap(index_dir, vs=vs, sparse=sparse, manifest=Manifest.load(manifest_path(index_dir)),
+                          dedup=DedupIndex.load(dedup_path(index_dir)), bundle=bundle)
+                self.reloads += 1
+            self.reload_error = None
+        except Exception as e:
+            self.reload_error = f"{type(e).__name__}: {e}"
+        finally:
+            self._reloading = False
+
+    def warmup(self) -> Dict[str, Any]:
+        try:
+            if self.bundle() is None:
+                self.vectorstore()
+                self.sparse()
+            self.last_error = None
+        except Exception as e:
+            # Stay cold; the first borrower retries the build
+            self.last_error = str(e)
+        return self.status()
+
+    def swap(self, index_dir: str, vs=None, sparse: Optional[SparseIndex] = None,
+             manifest: Optional[Manifest] = None, dedup: Optional[DedupIndex] = None,
+             bundle: Optional[IndexBundle] = None) -> None:
+        """Serve ``index_dir`` from now on, reusing the handles ingest already built.
+
+        Handles left as None are opened lazily from ``index_dir``.
+        """
+        t0 = time.perf_counter()
+        # warm before the swap so the first request on the new generation pays nothing
+        if vs is not None and hasattr(vs, "_collection"):
+            vs._collection.count()
+        if sparse is not None:
+            sparse._compiled()
+        with self._lock:
+            self._index_dir = index_dir
+            hold_lease(index_dir)
+            self._vs = vs
+            self._sparse = sparse
+            self._manifest = manifest
+            self._dedup = dedup
+            self._bundle, self._bundle_checked = bundle, bundle is not None
+            if vs is not None:
+                self.build_ms = int((time.perf_counter() - t0) * 1000)
+                self.built_at = time.time()
+                self.builds += 1
+            self.version += 1
+
+    def invalidate(self) -> None:
+        # Drop the index handles but keep the embeddings client: its config
+        # does not depend on index contents. The next borrower re-reads CURRENT.
+        with self._lock:
+            self._index_dir = None
+            self._vs = None
+            self._sparse = None
+            self._manifest = None
+            self._dedup = None
+            self._bundle, self._bundle_checked = None, False
+            self.version += 1
+
+    def status(self) -> Dict[str, Any]:
+        cache = get_embed_cache()
+        manifest = self._manifest
+        bundle = self._bundle
+        return {
+            "state": "warm" if self._vs is not None or bundle is not None else "cold",
+            "version": self.version,
+            "index_version": manifest.version if manifest is not None else None,
+            "dense_backend": DENSE_BACKEND if DENSE_BACKEND != "mmap" else f"mmap/{DENSE_DTYPE}",
+            "serving": "bundle" if bundle is not None else DENSE_BACKEND,
+            "collection": STATE.get("collection_name", "skyro_rag"),
+            "persist_dir": STATE.get("persist_dir", ".chroma"),
+            "index_dir": self._index_dir,
+            "sparse_path": sparse_path(self._index_dir) if self._index_dir else None,
+            "sparse_chunks": len(self._sparse) if self._sparse is not None else None,
+            "dedup": self._dedup.stats() if self._dedup is not None else None,
+            "bundle": bundle.stats() if bundle is not None else None,
+            "store_open": self._vs is not None,
+            "reloads": self.reloads,
+            "reload_error": self.reload_error,
+            "built_at": self.built_at,
+            "build_ms": self.build_ms,
+            "builds": self.builds,
+            "borrows": self.borrows,
+            "last_error": self.last_error,
+            "embed_cache": cache.stats() if cache else None,
+        }
+
+POOL = RetrieverPool()
+
+def get_pool() -> RetrieverPool:
+    return POOL
@@ -0,0 +1,240 @@
+from __future__ import annotations
+import os, pickle, re, threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse as sp
+from langchain_core.documents import Document
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+class SparseIndex:
+    """Persistent BM25 index over every ingested chunk, scored with NumPy/SciPy.
+
+    Each chunk keeps its term ids and term frequencies as small arrays, grouped
+    by ``source``; re-adding a source replaces its chunks and ``delete_source``
+    drops them, so ingest never re-tokenizes the whole corpus. Queries run
+    against a compiled term x chunk CSR matrix of precomputed BM25 weights
+    (IDF and length norms folded in), rebuilt lazily after a mutation.
+    ``teams`` restricts a search to chunks whose ``team`` metadata is in the
+    list; each team set gets its own column slice of the matrix (corpus-wide
+    IDF kept), so filtered queries only touch that partition's postings.
+    Drop-in for the ``bm25`` slot of SimpleHybridRetriever
+    (``invoke`` / ``get_relevant_documents``).
+    """
+    FORMAT = 2
+
+    def __init__(self, path: Optional[str] = None, k: int = 8, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k = k
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.vocab: Dict[str, int] = {}                  # term -> term id (append-only)
+        self.docs: Dict[str, Dict[str, Any]] = {}        # chunk_id -> {text, metadata, terms, tfs}
+        self.by_source: Dict[str, List[str]] = {}        # source -> [chunk_id]
+        # compiled scoring state
+        self._dirty = True
+        self._row_ids: List[str] = []
+        self._weights: Optional[sp.csr_matrix] = None    # (n_terms, n_docs)
+        self._row_teams: Optional[np.ndarray] = None     # team of each compiled row
+        self._partitions: Dict[Tuple[str, ...], Tuple[List[str], Optional[sp.csr_matrix]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    # --- mutation ---
+
+    def _add_one(self, chunk_id: str, doc: Document) -> None:
+        tf = Counter(tokenize(doc.page_content))
+        terms = np.fromiter((self.vocab.setdefault(t, len(self.vocab)) for t in tf), dtype=np.int32, count=len(tf))
+        tfs = np.fromiter(tf.values(), dtype=np.float32, count=len(tf))
+        self.docs[chunk_id] = {"text": doc.page_content, "metadata": dict(doc.metadata or {}), "terms": terms, "tfs": tfs}
+
+    def delete_source(self, source: str) -> int:
+        with self._lock:
+            ids = self.by_source.pop(source, [])
+            for cid in ids:
+                self.docs.pop(cid, None)
+            if ids:
+                self._dirty = True
+            return len(ids)
+
+    def add_documents(self, docs: Iterable[Document], append: bool = False) -> int:
+        """Upsert chunks; every source present in ``docs`` is replaced wholesale
+        unless ``append`` (a source streamed in several parts)."""
+        grouped: Dict[str, List[Document]] = {}
+        for d in docs:
+            grouped.setdefault(str((d.metadata or {}).get("source", "")), []).append(d)
+        with self._lock:
+            for source, group in grouped.items():
+                if not append:
+                    self.delete_source(source)
+                ids = self.by_source.get(source, [])
+                for d in group:
+                    cid = (d.metadata or {}).get("chunk_id") or f"{source}#{len(ids)}"
+                    if cid not in self.docs:
+                        ids.append(cid)
+                    self._add_one(cid, d)
+                self.by_source[source] = ids
+            if grouped:
+                self._dirty = True
+        return sum(len(g) for g in grouped.values())
+
+    # --- scoring ---
+
+    def _compile(self) -> None:
+        """Rebuild the BM25 weight matrix from the per-chunk term arrays."""
+        ids = list(self.docs)
+        n_docs, n_terms = len(ids), len(self.vocab)
+        self._partitions = {}
+        if not n_docs:
+            self._row_ids, self._weights, self._row_teams, self._dirty = [], None, None, False
+            return
+        terms = [self.docs[c]["terms"] for c in ids]
+        tfs = [self.docs[c]["tfs"] for c in ids]
+        nnz_per_doc = np.fromiter((len(t) for t in terms), dtype=np.int64, count=n_docs)
+        term_idx = np.concatenate(terms)
+        tf = np.concatenate(tfs).astype(np.float32)
+        doc_idx = np.repeat(np.arange(n_docs, dtype=np.int32), nnz_per_doc)
+
+        doc_len = np.bincount(doc_idx, weights=tf, minlength=n_docs).astype(np.float32)
+        avgdl = float(doc_len.mean()) or 1.0
+        df = np.bincount(term_idx, minlength=n_terms).astype(np.float32)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = self.k1 * (1.0 - self.b + self.b * doc_len / avgdl)
+
+        w = idf[term_idx] * tf * (self.k1 + 1.0) / (tf + norm[doc_idx])
+        self._weights = sp.csr_matrix((w, (term_idx, doc_idx)), shape=(n_terms, n_docs), dtype=np.float32)
+        self._row_ids = ids
+        self._row_teams = np.array([str(self.docs[c]["metadata"].get("team", "")) for c in ids], dtype=object)
+        self._dirty = False
+
+    def _compiled(self, teams: Optional[Iterable[str]] = None) -> Tuple[List[str], Optional[sp.csr_matrix]]:
+        with self._lock:
+            if self._dirty:
+                self._compile()
+            if teams is None or self._weights is None:
+                return self._row_ids, self._weights
+            key = tuple(sorted(set(teams)))
+            part = self._partitions.get(key)
+            if part is None:
+                cols = np.flatnonzero(np.isin(self._row_teams, list(key)))
+                part = ([self._row_ids[i] for i in cols], self._weights[:, cols].tocsr() if len(cols) else None)
+                self._partitions[key] = part
+            return part
+
+    def _query_terms(self, query: str) -> np.ndarray:
+        tids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        return np.fromiter(tids, dtype=np.int32, count=len(tids))
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        cand = np.flatnonzero(scores > 0)
+        if len(cand) > k:
+            cand = cand[np.argpartition(-scores[cand], k - 1)[:k]]
+        return cand[np.argsort(-scores[cand], kind="stable")]
+
+    def search_scores(self, query: str, k: Optional[int] = None,
+                      teams: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        k = k or self.k
+        ids, weights = self._compiled(teams)
+        if weights is None:
+            return []
+        tids = self._query_terms(query)
+        tids = tids[tids < weights.shape[0]]  # terms added after this compile
+        if not len(tids):
+            return []
+        sub = weights[tids]
+        scores = np.bincount(sub.indices, weights=sub.data, minlength=len(ids))
+        return [(ids[i], float(scores[i])) for i in self._top_k(scores, k)]
+
+    def search_scores_batch(self, queries: List[str], k: Optional[int] = None,
+                            teams: Optional[List[str]] = None) -> List[List[Tuple[str, float]]]:
+        """Score many queries in one sparse product: (n_queries x n_terms) @ weights."""
+        k = k or self.k
+        ids, weights = self._compiled(teams)
+        if weights is None or not queries:
+            return [[] for _ in queries]
+        rows, cols = [], []
+        for qi, q in enumerate(queries):
+            tids = self._query_terms(q)
+            tids = tids[tids < weights.shape[0]]
+            rows.append(np.full(len(tids), qi, dtype=np.int32))
+            cols.append(tids)
+        r, c = np.concatenate(rows), np.concatenate(cols)
+        qmat = sp.csr_matrix((np.ones(len(r), dtype=np.float32), (r, c)), shape=(len(queries), weights.shape[0]))
+        scores = (qmat @ weights).tocsr()
+        out = []
+        for qi in range(len(queries)):
+            lo, hi = scores.indptr[qi], scores.indptr[qi + 1]
+            cols_q, vals = scores.indices[lo:hi], scores.data[lo:hi]
+            top = self._top_k(vals, k)
+            out.append([(ids[cols_q[i]], float(vals[i])) for i in top])
+        return out
+
+    def _to_document(self, chunk_id: str) -> Document:
+        d = self.docs[chunk_id]
+        return Document(page_content=d["text"], metadata=dict(d["metadata"]))
+
+    def search(self, query: str, k: Optional[int] = None, teams: Optional[List[str]] = None) -> List[Document]:
+        hits = self.search_scores(query, k, teams)  # scoring runs outside the lock
+        with self._lock:
+            return [self._to_document(cid) for cid, _ in hits if cid in self.docs]
+
+    def search_batch(self, queries: List[str], k: Optional[int] = None,
+                     teams: Optional[List[str]] = None) -> List[List[Document]]:
+        hits = self.search_scores_batch(queries, k, teams)
+        with self._lock:
+            return [[self._to_document(cid) for cid, _ in row if cid in self.docs] for row in hits]
+
+    def invoke(self, query: str) -> List[Document]:
+        return self.search(query)
+
+    def get_relevant_documents(self, query: str) -> List[Document]:
+        return self.search(query)
+
+    # --- persistence ---
+
+    def save(self, path: Optional[str] = None) -> None:
+        path = path or self.path
+        if not path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            payload = {
+                "format": self.FORMAT,
+                "k1": self.k1, "b": self.b,
+                "vocab": self.vocab, "docs": self.docs, "by_source": self.by_source,
+            }
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)  # readers never see a half-written file
+
+    @classmethod
+    def load(cls, path: str, k: int = 8) -> "SparseIndex":
+        idx = cls(path=path, k=k)
+        if not os.path.exists(path):
+            return idx
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+        idx.k1, idx.b = payload["k1"], payload["b"]
+        if payload.get("format") == 1:
+            # v1 stored dict postings; re-tokenize once from the saved chunk text
+            for source, ids in payload["by_source"].items():
+                for cid in ids:
+                    d = payload["docs"][cid]
+                    idx._add_one(cid, Document(page_content=d["text"], metadata=d["metadata"]))
+                idx.by_source[source] = list(ids)
+            return idx
+        if payload.get("format") != cls.FORMAT:
+            return idx
+        idx.vocab = payload["vocab"]
+        idx.docs = payload["docs"]
+        idx.by_source = payload["by_source"]
+        return idx
@@ -1,8 +1,11 @@
 from __future__ import annotations
+import os
+
+from .env import load as load_env
+load_env()
 
 # Single shared state dict for the app
 STATE = {
-    "bm25": None,          # set after /ingest
     "collection_name": "skyro_rag",
-    "persist_dir": ".chroma",
-}
\ No newline at end of file
+    "persist_dir": os.getenv("RAG_DB_DIR", ".chroma"),
+}
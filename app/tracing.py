@@ -0,0 +1,141 @@
+from __future__ import annotations
+import contextvars, os, random, threading, time, uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from .env import load as load_env
+load_env()
+
+# Opt-in profiling of a fraction of requests (0 = off). pyinstrument is used
+# when installed (samples, follows await); otherwise cProfile, which only sees
+# the event loop thread.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", ".logs/profiles"))
+PROFILER = os.getenv("PROFILER", "auto")  # auto | pyinstrument | cprofile
+PROFILE_INTERVAL_S = float(os.getenv("PROFILE_INTERVAL_S", "0.001"))
+
+class Trace:
+    """Per-request span durations (ms), summed per name.
+
+    Spans recorded from worker threads (asyncio.to_thread copies the
+    context) land in the same trace, so one request's dense and sparse
+    retrieval both show up.
+    """
+    def __init__(self):
+        self.spans: Dict[str, float] = {}
+        self.profile: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def add(self, name: str, ms: float) -> None:
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + ms
+
+    def update(self, spans: Dict[str, float]) -> None:
+        for name, ms in spans.items():
+            self.add(name, ms)
+
+    def fields(self) -> Dict[str, Any]:
+        """What goes into the logged event."""
+        out: Dict[str, Any] = {"spans": self.to_dict()}
+        if self.profile:
+            out["profile"] = self.profile
+        return out
+
+    def to_dict(self) -> Dict[str, float]:
+        with self._lock:
+            return {k: round(v, 3) for k, v in self.spans.items()}
+
+_CURRENT: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+def current() -> Optional[Trace]:
+    return _CURRENT.get()
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the block into the current trace; a no-op outside one."""
+    tr = _CURRENT.get()
+    if tr is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        tr.add(name, (time.perf_counter() - t0) * 1000)
+
+@contextmanager
+def trace(profile: Optional[bool] = None) -> Iterator[Trace]:
+    """Start a trace for one request; ``profile=None`` samples at PROFILE_SAMPLE_RATE."""
+    tr = Trace()
+    token = _CURRENT.set(tr)
+    if profile is None:
+        profile = PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+    prof = _Profile.start() if profile else None
+    if prof is not None:
+        tr.profile = str(prof.path)  # known up front, so the event can point at it
+    try:
+        yield tr
+    finally:
+        if prof is not None:
+            prof.stop()
+        try:
+            _CURRENT.reset(token)
+        except ValueError:
+            _CURRENT.set(None)  # exited from another context (e.g. a closed stream generator)
+
+# --- profiler hook ---
+
+_PROFILE_LOCK = threading.Lock()  # one profile at a time: cProfile can't nest, and overlapping ones mix requests
+
+def _backend() -> str:
+    if PROFILER != "auto":
+        return PROFILER
+    try:
+        import pyinstrument  # noqa: F401
+        return "pyinstrument"
+    except ImportError:
+        return "cprofile"
+
+class _Profile:
+    def __init__(self, kind: str, prof: Any):
+        self.kind = kind
+        self.prof = prof
+        stem = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        # pyinstrument: HTML flame view; cProfile: python -m pstats <file>, or snakeviz
+        self.path = PROFILE_DIR / (stem + (".html" if kind == "pyinstrument" else ".prof"))
+
+    @classmethod
+    def start(cls) -> Optional["_Profile"]:
+        if not _PROFILE_LOCK.acquire(blocking=False):
+            return None  # another request is being profiled; skip this one
+        try:
+            kind = _backend()
+            if kind == "pyinstrument":
+                from pyinstrument import Profiler
+                prof = Profiler(interval=PROFILE_INTERVAL_S, async_mode="enabled")
+                prof.start()
+            else:
+                import cProfile
+                prof = cProfile.Profile()
+                prof.enable()
+            return cls(kind, prof)
+        except Exception:
+            _PROFILE_LOCK.release()
+            return None
+
+    def stop(self) -> None:
+        try:
+            if self.kind == "pyinstrument":
+                self.prof.stop()
+            else:
+                self.prof.disable()
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            if self.kind == "pyinstrument":
+                self.path.write_text(self.prof.output_html(), encoding="utf-8")
+            else:
+                self.prof.dump_stats(str(self.path))
+        except Exception:
+            pass  # profiling must never fail the request
+        finally:
+            _PROFILE_LOCK.release()
@@ -1,22 +1,19 @@
 from __future__ import annotations
-import os, json, time, threading
+import os, json, time
 from pathlib import Path
-from typing import Dict, Any, Iterable, List
+from typing import Dict, Any, List
 
-_LOG_PATH = Path(".logs/events.jsonl")
-_LOCK = threading.Lock()
+from .event_log import flush_writer, get_writer, iter_lines
+
+_LOG_PATH = Path(os.getenv("EVENT_LOG_PATH", ".logs/events.jsonl"))
 
 def log_event(evt: Dict[str, Any], path: Path = _LOG_PATH) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
+    # Serialized here, written by the background writer (see app/event_log.py)
     evt = dict(evt)
     evt["ts"] = time.time()
     line = json.dumps(evt, ensure_ascii=False)
-    with _LOCK:
-        with path.open("a", encoding="utf-8") as f:
-            f.write(line + "\n")
+    get_writer(path).write(line + "\n")
 
 def read_events(path: Path = _LOG_PATH) -> List[Dict[str, Any]]:
-    if not path.exists():
-        return []
-    with path.open("r", encoding="utf-8") as f:
-        return [json.loads(x) for x in f if x.strip()]
+    flush_writer(path)
+    return [json.loads(x) for x in iter_lines(path) if x.strip()]
@@ -0,0 +1,127 @@
+from __future__ import annotations
+import importlib, os, threading, time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .env import load as load_env
+load_env()
+
+WARMUP_ENABLED = os.getenv("WARMUP", "1") not in ("0", "false", "no")
+# One real embedding call at startup also warms the HTTP connection pool (costs an API call)
+WARMUP_EMBED_QUERY = os.getenv("WARMUP_EMBED_QUERY", "0") not in ("0", "false", "no")
+
+class Warmup:
+    """Startup warmup in a background thread, so /health answers immediately.
+
+    Each stage is timed; /ready reports ``ready`` once the index and the
+    sparse index are open. A failed warmup can be retried with start().
+    """
+    REQUIRED = ("vectorstore", "sparse")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.state = "pending"        # pending -> running -> done | failed
+        self.import_ms: Optional[int] = None
+        self.started_at: Optional[float] = None
+        self.total_ms: Optional[int] = None
+        self.stages: Dict[str, Dict[str, Any]] = {}
+
+    def _stages(self) -> List[Tuple[str, Callable[[], Any]]]:
+        from .rag import CHAT_MODEL, CHAT_PROVIDER, DENSE_BACKEND, EMBED_PROVIDER
+        from .retriever.pool import get_pool
+        pool = get_pool()
+
+        def imports():
+            mods = ["langchain_text_splitters", "langchain_community.document_loaders"]
+            if DENSE_BACKEND != "mmap":
+                mods.append("langchain_chroma")
+            if EMBED_PROVIDER != "hash" or CHAT_PROVIDER != "fake":
+                mods.append("langchain_openai")
+            for m in mods:
+                importlib.import_module(m)
+
+        def vectorstore():
+            bundle = pool.bundle()
+            if bundle is not None:  # /ask reads the mmap bundle; the store opens on first eval/debug use
+                return bundle.count()
+            vs = pool.vectorstore()
+            # Chroma opens the collection lazily; touch it now
+            coll = getattr(vs, "_collection", None)
+            return coll.count() if coll is not None else vs.count()
+
+        def sparse():
+            if pool.bundle() is not None:
+                return len(pool.bundle())
+            idx = pool.sparse()
+            idx._compiled()
+            return len(idx)
+
+        def embeddings():
+            emb = pool.embeddings()
+            if WARMUP_EMBED_QUERY:
+                emb.embed_query("warmup")
+
+        def caches():
+            from .answer_cache import get_answer_cache
+            from .context_pack import TOKENIZER
+            get_answer_cache()
+            pool.index_version()
+            TOKENIZER.count("warmup", CHAT_MODEL)  # loads (or gives up on) the tiktoken encoding
+
+        def metrics():
+            from .metrics_rollup import get_rollup
+            get_rollup().refresh()
+
+        return [("imports", imports), ("embeddings", embeddings), ("vectorstore", vectorstore),
+                ("sparse", sparse), ("caches", caches), ("metrics", metrics)]
+
+    def _run(self) -> None:
+        t0 = time.perf_counter()
+        for name, fn in self._stages():
+            ts = time.perf_counter()
+            try:
+                res = fn()
+                self.stages[name] = {"ok": True, "ms": int((time.perf_counter() - ts) * 1000)}
+                if isinstance(res, int):
+                    self.stages[name]["items"] = res
+            except Exception as e:
+                self.stages[name] = {"ok": False, "ms": int((time.perf_counter() - ts) * 1000), "error": str(e)}
+        self.total_ms = int((time.perf_counter() - t0) * 1000)
+        self.state = "done" if all(self.stages.get(s, {}).get("ok") for s in self.REQUIRED) else "failed"
+        from .utils import log_event
+        log_event({"type": "warmup", "state": self.state, "import_ms": self.import_ms,
+                   "warmup_ms": self.total_ms, "stages": self.stages})
+
+    def start(self, import_ms: Optional[int] = None) -> None:
+        with self._lock:
+            if import_ms is not None:
+                self.import_ms = import_ms
+            if self.state in ("running", "done"):
+                return
+            self.state, self.started_at, self.stages = "running", time.time(), {}
+            self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        t = self._thread
+        if t is not None:
+            t.join(timeout)
+        return self.state == "done"
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "done"
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "state": self.state,
+            "import_ms": self.import_ms,
+            "warmup_ms": self.total_ms,
+            "stages": self.stages,
+        }
+
+WARMUP = Warmup()
+
+def get_warmup() -> Warmup:
+    return WARMUP
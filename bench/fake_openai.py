@@ -0,0 +1,96 @@
+"""Local OpenAI-compatible chat server for load tests, backed by FakeChatModel.
+
+Answers /v1/chat/completions (whole and ``stream: true`` SSE) with the fake
+model's latency, and counts what it served at /stats, so the LLM pool's
+coalescing and admission limits can be checked against a real HTTP upstream:
+
+    python -m bench.fake_openai --port 8081
+    OPENAI_BASE_URL=http://127.0.0.1:8081/v1 OPENAI_API_KEY=x CHAT_PROVIDER=openai uvicorn app.main:app
+"""
+from __future__ import annotations
+import argparse, json, threading, time, uuid
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from app.local_models import FakeChatModel
+
+app = FastAPI(title="fake-openai")
+_lock = threading.Lock()
+_stats = {"requests": 0, "streams": 0, "active": 0, "max_active": 0}
+
+class Message(BaseModel):
+    role: str
+    content: Any = ""
+
+class ChatRequest(BaseModel):
+    model: str
+    messages: List[Message]
+    stream: bool = False
+    temperature: Optional[float] = None
+
+def _prompt(req: ChatRequest) -> str:
+    return "\n".join(m.content if isinstance(m.content, str) else json.dumps(m.content) for m in req.messages)
+
+def _track(delta: int) -> None:
+    with _lock:
+        _stats["active"] += delta
+        _stats["max_active"] = max(_stats["max_active"], _stats["active"])
+
+def _chunk(cid: str, model: str, delta: Dict[str, Any], finish: Optional[str] = None) -> str:
+    body = {"id": cid, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+    return f"data: {json.dumps(body)}\n\n"
+
+@app.post("/v1/chat/completions")
+async def chat_completions(req: ChatRequest):
+    llm = FakeChatModel(model=req.model)
+    prompt = _prompt(req)
+    cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    with _lock:
+        _stats["requests"] += 1
+        _stats["streams"] += int(req.stream)
+    _track(1)
+    if req.stream:
+        async def events():
+            try:
+                yield _chunk(cid, req.model, {"role": "assistant", "content": ""})
+                async for part in llm.astream(prompt):
+                    yield _chunk(cid, req.model, {"content": part.content})
+                yield _chunk(cid, req.model, {}, finish="stop")
+                yield "data: [DONE]\n\n"
+            finally:
+                _track(-1)
+        return StreamingResponse(events(), media_type="text/event-stream")
+    try:
+        msg = await llm.ainvoke(prompt)
+    finally:
+        _track(-1)
+    n_in, n_out = len(prompt.split()), len(msg.content.split())
+    return {"id": cid, "object": "chat.completion", "created": int(time.time()), "model": req.model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": msg.content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": n_in, "completion_tokens": n_out, "total_tokens": n_in + n_out}}
+
+@app.get("/stats")
+def stats():
+    with _lock:
+        return dict(_stats)
+
+@app.post("/stats/reset")
+def reset():
+    with _lock:
+        _stats.update(requests=0, streams=0, max_active=_stats["active"])
+    return stats()
+
+def main() -> None:
+    import uvicorn
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8081)
+    args = ap.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
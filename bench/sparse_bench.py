@@ -0,0 +1,108 @@
+"""Sparse retrieval benchmark: SparseIndex (CSR) vs langchain BM25Retriever.
+
+Synthesizes corpora of N chunks by sampling words from data/ with the
+corpus' own frequency distribution, then times build and per-query latency.
+
+    python -m bench.sparse_bench --sizes 10000 100000 1000000 --out bench/sparse_results.json
+
+The baseline needs ``rank_bm25`` and is skipped above --baseline-max (it
+scores every chunk in Python and takes minutes at 1M).
+"""
+from __future__ import annotations
+import argparse, json, os, platform, random, statistics, sys, time
+from collections import Counter
+from typing import Any, Dict, List
+
+from langchain_core.documents import Document
+
+from app.ingest.loaders import load_path
+from app.retriever.sparse import SparseIndex, tokenize
+
+QUERIES = [
+    "payout limits per tier",
+    "who is on call for payments",
+    "ledger desync root cause unique index",
+    "escalate payout delays status page",
+    "merchant risk tier T3 notes",
+    "provider SLO failover AlphaPay BetaWire",
+    "refund policy chargeback window",
+    "webhook failures retry",
+]
+
+def synth_corpus(n: int, words_per_chunk: int = 120, seed: int = 7) -> List[Document]:
+    counts = Counter(t for d in load_path("data") for t in tokenize(d.page_content))
+    vocab, weights = zip(*counts.items())
+    rnd = random.Random(seed)
+    docs = []
+    for i in range(n):
+        words = rnd.choices(vocab, weights=weights, k=words_per_chunk)
+        docs.append(Document(page_content=" ".join(words), metadata={"source": f"synth/{i // 50}.md", "chunk_id": f"c{i}"}))
+    return docs
+
+def _pct(xs: List[float], p: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round((len(xs) - 1) * p / 100)))]
+
+def time_queries(fn, repeats: int) -> Dict[str, float]:
+    lat = []
+    for _ in range(repeats):
+        for q in QUERIES:
+            t0 = time.perf_counter()
+            fn(q)
+            lat.append((time.perf_counter() - t0) * 1000)
+    return {"p50_ms": round(_pct(lat, 50), 3), "p95_ms": round(_pct(lat, 95), 3), "mean_ms": round(statistics.mean(lat), 3)}
+
+def bench_size(n: int, k: int, repeats: int, baseline_max: int) -> Dict[str, Any]:
+    docs = synth_corpus(n)
+    out: Dict[str, Any] = {"chunks": n}
+
+    t0 = time.perf_counter()
+    idx = SparseIndex(k=k)
+    idx.add_documents(docs)
+    t_add = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    idx._compiled()
+    t_compile = time.perf_counter() - t0
+    out["sparse_index"] = {"build_s": round(t_add, 3), "compile_s": round(t_compile, 3),
+                           **time_queries(lambda q: idx.search(q, k=k), repeats)}
+
+    if n > baseline_max:
+        out["bm25_retriever"] = {"skipped": f"n > --baseline-max ({baseline_max})"}
+        return out
+    try:
+        from langchain_community.retrievers import BM25Retriever
+        t0 = time.perf_counter()
+        bm25 = BM25Retriever.from_documents(docs, k=k)
+        t_build = time.perf_counter() - t0
+        out["bm25_retriever"] = {"build_s": round(t_build, 3), **time_queries(bm25.invoke, repeats)}
+    except ImportError as e:
+        out["bm25_retriever"] = {"skipped": str(e)}
+    return out
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--k", type=int, default=8)
+    ap.add_argument("--repeats", type=int, default=5)
+    ap.add_argument("--baseline-max", type=int, default=100_000)
+    ap.add_argument("--out", default="")
+    args = ap.parse_args(argv)
+
+    results = {
+        "bench": "sparse",
+        "python": sys.version.split()[0],
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "runs": [],
+    }
+    for n in args.sizes:
+        r = bench_size(n, args.k, args.repeats, args.baseline_max)
+        results["runs"].append(r)
+        print(json.dumps(r), flush=True)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
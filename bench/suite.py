@@ -0,0 +1,241 @@
+"""Offline end-to-end benchmark: ingest, chunking, hybrid retrieval and /ask.
+
+Runs against the local stand-ins (EMBED_PROVIDER=hash, CHAT_PROVIDER=fake),
+so no API key is needed and results are comparable across versions. Each
+corpus size is synthesized from data/ and measured in a fresh subprocess
+with its own index directory.
+
+    python -m bench.suite --sizes 50 500 2000 --concurrency 1 8 32 --out bench/suite_results.json
+    python -m bench.suite --sizes 500 --baseline bench/suite_results.json   # flag regressions
+
+Fake LLM latency is set with FAKE_LLM_TTFT_MS / FAKE_LLM_TOKEN_MS / FAKE_LLM_TOKENS.
+"""
+from __future__ import annotations
+import argparse, asyncio, json, os, platform, random, shutil, statistics, subprocess, sys, tempfile, time
+from typing import Any, Dict, List, Optional
+
+QUERIES = [
+    "payout limits per tier",
+    "who is on call for payments",
+    "ledger desync root cause unique index",
+    "escalate payout delays status page",
+    "merchant risk tier T3 notes",
+    "provider SLO failover AlphaPay BetaWire",
+    "refund policy chargeback window",
+    "webhook failures retry",
+]
+
+def _pcts(xs: List[float]) -> Dict[str, float]:
+    xs = sorted(xs)
+    if not xs:
+        return {}
+    at = lambda p: xs[min(len(xs) - 1, int(round((len(xs) - 1) * p / 100)))]
+    return {"p50_ms": round(at(50), 3), "p95_ms": round(at(95), 3), "p99_ms": round(at(99), 3),
+            "mean_ms": round(statistics.mean(xs), 3)}
+
+def synth_corpus(out_dir: str, n_files: int, paras_per_file: int = 12, seed: int = 7) -> None:
+    """Write n_files markdown files made of paragraphs sampled from data/."""
+    from app.ingest.loaders import load_path
+    paras = [p.strip() for d in load_path("data") for p in d.page_content.split("\n\n") if len(p.strip()) > 40]
+    rnd = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    for i in range(n_files):
+        body = "\n\n".join(rnd.choice(paras) for _ in range(paras_per_file))
+        with open(os.path.join(out_dir, f"doc_{i:06d}.md"), "w", encoding="utf-8") as f:
+            f.write(f"# Synthetic doc {i}\n\n{body}\n")
+
+# --- one size, inside a fresh process ---
+
+def _bench_ask(app, concurrency: int, requests: int, stream: bool) -> Dict[str, Any]:
+    import httpx
+    from app.utils import read_events
+
+    tag = f"{'s' if stream else 'a'}{concurrency}"
+    questions = [f"{QUERIES[i % len(QUERIES)]} #{tag}-{i}" for i in range(requests)]  # unique: no cache hits
+
+    async def run() -> Dict[str, Any]:
+        transport = httpx.ASGITransport(app=app)
+        lat: List[float] = []
+        errors = 0
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            sem = asyncio.Semaphore(concurrency)
+
+            async def one(q: str) -> None:
+                nonlocal errors
+                async with sem:
+                    t0 = time.perf_counter()
+                    r = await client.post("/ask/stream" if stream else "/ask", json={"question": q})
+                    lat.append((time.perf_counter() - t0) * 1000)
+                    errors += 0 if r.status_code == 200 else 1
+
+            t0 = time.perf_counter()
+            await asyncio.gather(*(one(q) for q in questions))
+            wall = time.perf_counter() - t0
+        return {"concurrency": concurrency, "requests": requests, "errors": errors,
+                "rps": round(requests / wall, 2), **_pcts(lat)}
+
+    out = asyncio.run(run())
+    if stream:
+        # ASGITransport hands back the body in one piece, so TTFT comes from the server's own log
+        wanted = set(questions)
+        ttft = [e["ttft_ms"] for e in read_events()
+                if e.get("q") in wanted and isinstance(e.get("ttft_ms"), (int, float))]
+        out["ttft"] = _pcts(ttft)
+    return out
+
+def run_one(size: int, workdir: str, concurrency: List[int], requests: int) -> Dict[str, Any]:
+    from app.ingest.loaders import load_path
+    from app.ingest.index import ingest_paths
+    from app.rag import chunk_docs
+    from app.retriever.pool import get_pool
+
+    corpus = os.path.join(workdir, "corpus")
+    synth_corpus(corpus, size)
+    out: Dict[str, Any] = {"files": size}
+
+    docs = load_path(corpus)
+    t0 = time.perf_counter()
+    chunks = chunk_docs(docs)
+    dt = time.perf_counter() - t0
+    out["chunk_docs"] = {"docs": len(docs), "chunks": len(chunks), "s": round(dt, 3),
+                         "chunks_per_s": round(len(chunks) / dt, 1) if dt else None}
+
+    t0 = time.perf_counter()
+    res = ingest_paths([corpus])
+    dt = time.perf_counter() - t0
+    out["ingest_cold"] = {"chunks": res["chunks"], "s": round(dt, 3),
+                          "chunks_per_s": round(res["chunks"] / dt, 1) if dt else None, "stages": res.get("stages")}
+    t0 = time.perf_counter()
+    ingest_paths([corpus])
+    out["ingest_unchanged"] = {"s": round(time.perf_counter() - t0, 3)}
+
+    retriever = get_pool().retriever()
+    retriever.get_relevant_documents(QUERIES[0])  # warm
+    lat = []
+    for _ in range(5):
+        for q in QUERIES:
+            t0 = time.perf_counter()
+            retriever.get_relevant_documents(q)
+            lat.append((time.perf_counter() - t0) * 1000)
+    out["hybrid_retrieval"] = _pcts(lat)
+
+    from app.main import app
+    out["ask"] = [_bench_ask(app, c, max(requests, c), stream=False) for c in concurrency]
+    out["ask_stream"] = [_bench_ask(app, c, max(requests, c), stream=True) for c in concurrency]
+    return out
+
+def _child_env(workdir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("EMBED_PROVIDER", "hash")
+    env.setdefault("CHAT_PROVIDER", "fake")
+    env.update({
+        "RAG_DB_DIR": os.path.join(workdir, "index"),
+        "EMBED_CACHE": "0",
+        "ANSWER_CACHE": "0",
+        "EVENT_LOG_PATH": os.path.join(workdir, "events.jsonl"),
+        "METRICS_CHECKPOINT_PATH": os.path.join(workdir, "metrics_rollup.json"),
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY") or "offline",
+    })
+    env.pop("RAG_SPARSE_PATH", None)
+    env.pop("RAG_MANIFEST_PATH", None)
+    return env
+
+# --- regression check ---
+
+def _walk(prefix: str, node: Any, out: Dict[str, float]) -> None:
+    if isinstance(node, dict):
+        for k, v in node.items():
+            _walk(f"{prefix}.{k}" if prefix else k, v, out)
+    elif isinstance(node, list):
+        for item in node:
+            if isinstance(item, dict) and "concurrency" in item:
+                _walk(f"{prefix}[c={item['concurrency']}]", item, out)
+    elif isinstance(node, (int, float)) and (prefix.endswith("_ms") or prefix.endswith("_per_s") or prefix.endswith(".rps")):
+        out[prefix] = float(node)
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Metrics that got worse by more than ``tolerance`` (ratio), keyed by corpus size."""
+    base_by_size = {r["files"]: r for r in baseline.get("runs", [])}
+    worse = []
+    for run in current.get("runs", []):
+        base = base_by_size.get(run["files"])
+        if base is None:
+            continue
+        cur_m, base_m = {}, {}
+        _walk("", run, cur_m)
+        _walk("", base, base_m)
+        for key, v in cur_m.items():
+            b = base_m.get(key)
+            if not b or not v:
+                continue
+            if key.endswith("_ms") and abs(v - b) < 1.0:
+                continue  # sub-millisecond jitter
+            higher_is_better = key.endswith("_per_s") or key.endswith(".rps")
+            ratio = (b / v) if higher_is_better else (v / b)
+            if ratio > 1 + tolerance:
+                worse.append(f"files={run['files']} {key}: {b:g} -> {v:g} ({ratio:.2f}x worse)")
+    return worse
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 2000], help="synthetic corpus sizes, in files")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    ap.add_argument("--requests", type=int, default=64, help="/ask requests per concurrency level")
+    ap.add_argument("--out", default="")
+    ap.add_argument("--baseline", default="", help="previous results JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown ratio before flagging")
+    ap.add_argument("--keep", action="store_true", help="keep the per-size work directories")
+    ap.add_argument("--child", nargs=2, metavar=("SIZE", "WORKDIR"), help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.child:
+        size, workdir = int(args.child[0]), args.child[1]
+        print(json.dumps(run_one(size, workdir, args.concurrency, args.requests)))
+        return 0
+
+    results: Dict[str, Any] = {
+        "bench": "suite",
+        "git": _git_rev(),
+        "python": sys.version.split()[0],
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "config": {k: os.getenv(k) for k in ("EMBED_PROVIDER", "CHAT_PROVIDER", "HASH_EMBED_DIM", "RAG_DENSE_BACKEND",
+                                              "RAG_DENSE_DTYPE", "FAKE_LLM_TTFT_MS", "FAKE_LLM_TOKEN_MS", "FAKE_LLM_TOKENS")},
+        "runs": [],
+    }
+    for n in args.sizes:
+        workdir = tempfile.mkdtemp(prefix=f"rag-bench-{n}-")
+        try:
+            cmd = [sys.executable, "-m", "bench.suite", "--child", str(n), workdir,
+                   "--concurrency", *map(str, args.concurrency), "--requests", str(args.requests)]
+            proc = subprocess.run(cmd, env=_child_env(workdir), capture_output=True, text=True)
+            if proc.returncode != 0:
+                sys.stderr.write(proc.stderr)
+                return proc.returncode
+            run = json.loads(proc.stdout.strip().splitlines()[-1])
+        finally:
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+        results["runs"].append(run)
+        print(json.dumps(run), flush=True)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            worse = compare(results, json.load(f), args.tolerance)
+        for line in worse:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if worse else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+"""Offline test setup: hash embeddings, fake chat model, no embedding cache.
+
+Set before anything imports ``app`` (config is read at import time). Index
+paths are relative (``.chroma``, ``.logs``), so tests that touch the index
+run in their own directory via the ``workdir`` fixture.
+"""
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.update(
+    EMBED_PROVIDER="hash",
+    CHAT_PROVIDER="fake",
+    EMBED_CACHE="0",
+    ANSWER_CACHE="0",
+    RAG_DENSE_BACKEND="mmap",
+    WARMUP="0",
+)
+
+import pytest
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    from app.retriever.pool import get_pool
+    monkeypatch.chdir(tmp_path)
+    get_pool().invalidate()
+    yield tmp_path
+    get_pool().invalidate()
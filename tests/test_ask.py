@@ -0,0 +1,82 @@
+import asyncio
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.ingest.index import ingest_paths
+
+@pytest.fixture
+def events(monkeypatch):
+    got = []
+    monkeypatch.setattr(main, "log_event", got.append)
+    return got
+
+@pytest.fixture
+def client(workdir):
+    os.makedirs("docs")
+    for name in ("payouts", "ledger"):
+        with open(f"docs/{name}.md", "w", encoding="utf-8") as f:
+            f.write(f"# {name}\n\n" + f"{name} runbook step. " * 40)
+    ingest_paths(["docs"], parse_workers=0)
+    return TestClient(main.app)
+
+def _batch(client, questions):
+    r = client.post("/ask/batch", json={"questions": questions, "team": None})
+    assert r.status_code == 200
+    lines = [json.loads(x) for x in r.text.splitlines()]
+    return sorted(lines, key=lambda x: x["index"]), r.headers["X-Batch-Id"]
+
+def test_batch_llm_failures_are_logged_per_question(client, events, monkeypatch):
+    async def boom(question, docs, model=None):
+        raise RuntimeError("upstream 500")
+    monkeypatch.setattr(main, "aanswer_with_llm", boom)
+    lines, batch_id = _batch(client, ["payouts runbook", "ledger runbook"])
+    assert [x["error"] for x in lines] == ["RuntimeError: upstream 500"] * 2
+    errors = [e for e in events if e["type"] == "ask_error"]
+    assert sorted(e["q"] for e in errors) == ["ledger runbook", "payouts runbook"]
+    assert {(e["stage"], e["batch_id"]) for e in errors} == {("llm", batch_id)}
+    assert all(e["elapsed_ms"] >= 0 for e in errors)
+
+def test_batch_llm_timeout_is_logged(client, events, monkeypatch):
+    async def slow(question, docs, model=None):
+        await asyncio.sleep(5)
+    monkeypatch.setattr(main, "aanswer_with_llm", slow)
+    monkeypatch.setattr(main, "LLM_TIMEOUT_S", 0.1)
+    lines, _ = _batch(client, ["payouts runbook"])
+    assert lines == [{"index": 0, "error": "llm timed out after 0.1s"}]
+    (err,) = [e for e in events if e["type"] == "ask_error"]
+    assert err["stage"] == "llm" and err["error"] == "llm timed out after 0.1s"
+
+def test_batch_retrieval_failure_is_logged_for_every_question(client, events, monkeypatch):
+    class Broken:
+        async def abatch_get_relevant_documents(self, questions):
+            raise OSError("index gone")
+    monkeypatch.setattr(main, "get_hybrid_retriever", lambda team=None: Broken())
+    lines, batch_id = _batch(client, ["a", "b", "c"])
+    assert [x["error"] for x in lines] == ["OSError: index gone"] * 3
+    errors = [e for e in events if e["type"] == "ask_error"]
+    assert [e["q"] for e in errors] == ["a", "b", "c"]
+    assert {(e["stage"], e["batch_id"]) for e in errors} == {("retrieval", batch_id)}
+
+def test_batch_answers_are_logged_like_ask(client, events):
+    lines, batch_id = _batch(client, ["payouts runbook", "ledger runbook"])
+    assert all("answer" in x for x in lines)
+    asks = [e for e in events if e["type"] == "ask"]
+    assert sorted(e["answer_id"] for e in asks) == sorted(x["answer_id"] for x in lines)
+    assert {e["batch_id"] for e in asks} == {batch_id}
+
+def test_no_docs_event_is_the_same_for_stream_and_ask(workdir, events):
+    client = TestClient(main.app)  # empty index: nothing is retrieved
+    plain = client.post("/ask", json={"question": "anything"}).json()
+    r = client.post("/ask/stream", json={"question": "anything"})
+    assert "event: done" in r.text and plain["answer"] in r.text
+    a, s = [e for e in events if e["type"] == "ask"]
+    assert a["no_docs"] and s["no_docs"]
+    assert (s["stream"], s["ttft_ms"]) == (True, None)
+    assert a["answer_id"] == plain["answer_id"] and s["answer_id"] in r.text
+    drop = {"answer_id", "stream", "ttft_ms", "latency_ms", "retrieval_ms", "spans"}
+    assert {k: v for k, v in a.items() if k not in drop} == {k: v for k, v in s.items() if k not in drop}
+    assert set(s) - set(a) == {"stream", "ttft_ms"}
@@ -0,0 +1,101 @@
+import os
+import time
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from app.ingest.index import ingest_paths
+from app.rag import bundle_path
+from app.retriever.bundle import IndexBundle, write_bundle
+from app.retriever.pool import RetrieverPool, get_pool
+from app.retriever.sparse import SparseIndex
+
+TEXTS = [
+    ("", "Payout limits per tier: T1 payouts are capped daily, T2 weekly."),
+    ("", "Escalate payout delays to the payments on-call and update the status page."),
+    ("risk", "Ledger desync root cause: a missing unique index on transfer ids."),
+    ("risk", "Risk tier T3 merchants need manual review of every payout."),
+    ("platform", "Webhook failures retry with backoff; payouts webhooks retry longer."),
+    ("platform", "Refund policy: chargeback window is 120 days, payout reversal after review."),
+    ("payments", "Payments on-call rotates weekly; payout incidents page the primary."),
+]
+QUERIES = ["payout", "payouts retry review", "on-call weekly", "ledger unique index", "nothing matches this"]
+
+class _NoVectors:
+    def vectors_for(self, ids):
+        return np.zeros((len(ids), 4), dtype=np.float32), np.zeros(len(ids), dtype=bool)
+
+@pytest.fixture
+def indexes(tmp_path):
+    sparse = SparseIndex()
+    sparse.add_documents([Document(page_content=text, metadata={"source": f"d{i}.md", "team": team, "chunk_id": f"c{i}"})
+                          for i, (team, text) in enumerate(TEXTS)])
+    write_bundle(str(tmp_path / "bundle"), sparse, _NoVectors(), 1)
+    return sparse, IndexBundle.open(str(tmp_path / "bundle"))
+
+def _same(got, want):
+    # full rankings (k covers every chunk), so no ties are cut; the bundle stores float32 weights
+    assert dict(got).keys() == dict(want).keys()
+    for cid, score in want:
+        assert dict(got)[cid] == pytest.approx(score, rel=1e-5)
+
+@pytest.mark.parametrize("teams", [None, ["risk"], ["", "platform"], ["payments", ""], ["nobody"]])
+def test_scores_match_sparse_index(indexes, teams):
+    sparse, bundle = indexes
+    k = len(TEXTS)
+    for query in QUERIES:
+        _same(bundle.search_scores(query, k=k, teams=teams), sparse.search_scores(query, k=k, teams=teams))
+    for got, want in zip(bundle.search_scores_batch(QUERIES, k=k, teams=teams),
+                         sparse.search_scores_batch(QUERIES, k=k, teams=teams)):
+        _same(got, want)
+
+def test_batch_matches_single_queries(indexes):
+    _, bundle = indexes
+    for teams in (None, ["risk", ""]):
+        batch = bundle.search_scores_batch(QUERIES, k=2, teams=teams)
+        assert batch == [bundle.search_scores(q, k=2, teams=teams) for q in QUERIES]
+
+def test_team_filter_only_returns_allowed_teams(indexes):
+    _, bundle = indexes
+    docs = bundle.search("payout payouts", k=len(TEXTS), teams=["risk", ""])
+    assert {d.metadata["team"] for d in docs} == {"risk", ""}
+    assert bundle.search("payout", teams=["nobody"]) == []
+
+def test_chunks_round_trip(indexes):
+    sparse, bundle = indexes
+    assert len(bundle) == len(sparse)
+    doc = bundle.get("c2")
+    assert doc.page_content == TEXTS[2][1]
+    assert doc.metadata == {"source": "d2.md", "team": "risk", "chunk_id": "c2"}
+    assert bundle.get("missing") is None
+
+def test_empty_index_has_no_bundle(tmp_path):
+    assert write_bundle(str(tmp_path / "bundle"), SparseIndex(), _NoVectors(), 1) is None
+    assert IndexBundle.open(str(tmp_path / "bundle")) is None
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+def test_other_worker_hot_reloads_new_generation(workdir):
+    _write("docs/a.md", "# Payouts\n\n" + "Payout limits per tier. " * 30)
+    first = ingest_paths(["docs"], parse_workers=0)
+    worker = RetrieverPool()  # another process's pool: only sees CURRENT on disk
+    assert os.path.basename(worker.index_dir()) == first["generation"]
+    assert worker.serving_backend() == "bundle"
+    assert worker.bundle().version == first["index_version"]
+
+    _write("docs/b.md", "# Ledger\n\n" + "Ledger desync root cause. " * 30)
+    second = ingest_paths(["docs"], parse_workers=0)
+    worker._checked_at -= 60  # past RAG_RELOAD_CHECK_S
+    worker.check_reload()
+    deadline = time.monotonic() + 10
+    while worker._reloading and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert worker.reload_error is None and worker.reloads == 1
+    assert os.path.basename(worker.index_dir()) == second["generation"]
+    assert worker.bundle().directory == bundle_path(get_pool().index_dir())
+    assert worker.index_version() == second["index_version"]
+    assert "docs/b.md" in {d.metadata["source"] for d in worker.retriever(top_k=3).get_relevant_documents("ledger desync")}
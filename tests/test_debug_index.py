@@ -0,0 +1,51 @@
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.ingest.index import ingest_paths
+from app.main import app
+
+NAMES = ["alpha", "bravo", "charlie"]
+
+@pytest.fixture
+def client(workdir):
+    os.makedirs("docs")
+    for name in NAMES:
+        with open(f"docs/{name}.md", "w", encoding="utf-8") as f:
+            f.write(f"# {name}\n\n" + f"{name} runbook step. " * 200)
+    ingest_paths(["docs"], parse_workers=0)
+    return TestClient(app)
+
+def test_stats_come_from_the_manifest(client):
+    body = client.get("/debug/index", params={"check": "true"}).json()
+    assert body["sources"] == len(NAMES)
+    assert body["count"] == body["dense_count"] == body["sparse_count"] > 0
+    assert "sample_sources" not in body
+
+def test_legacy_limit_returns_a_source_sample(client):
+    body = client.get("/debug/index", params={"limit": 2}).json()
+    assert body["sample_sources"] == ["docs/alpha.md", "docs/bravo.md"]
+    assert body["sources"] == len(NAMES)
+    assert client.get("/debug/index", params={"limit": 5000}).json()["sample_sources"] == [f"docs/{n}.md" for n in NAMES]
+
+def test_sources_are_paged(client):
+    first = client.get("/debug/index/sources", params={"limit": 2}).json()
+    assert (first["total"], first["next_offset"]) == (3, 2)
+    rest = client.get("/debug/index/sources", params={"offset": 2, "limit": 2}).json()
+    assert [r["source"] for r in first["items"] + rest["items"]] == [f"docs/{n}.md" for n in NAMES]
+    assert rest["next_offset"] is None
+    assert client.get("/debug/index/sources", params={"limit": 0}).status_code == 400
+
+def test_chunks_are_paged_across_sources(client):
+    total = int(client.get("/debug/index/chunks", params={"limit": 1}).headers["X-Total-Count"])
+    rows, offset = [], 0
+    while offset is not None:
+        r = client.get("/debug/index/chunks", params={"offset": offset, "limit": 2, "text": "false"})
+        rows += [json.loads(x) for x in r.text.splitlines()]
+        offset = r.headers.get("X-Next-Offset")
+    assert len(rows) == total
+    assert len({r["id"] for r in rows}) == total
+    assert all("text" not in r and r["chars"] > 0 for r in rows)
+    assert client.get("/debug/index/chunks", params={"source": "docs/nope.md"}).status_code == 404
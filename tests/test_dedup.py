@@ -0,0 +1,97 @@
+import os
+
+import pytest
+from langchain_core.documents import Document
+
+from app.ingest.dedup import DedupIndex
+from app.ingest.index import ingest_paths
+from app.retriever.pool import get_pool
+
+RUNBOOK = "# Payout escalation\n\n" + " ".join(
+    f"Step {i}: check the payout batch {i} status in the ledger console and page the on-call if it is stuck."
+    for i in range(30))
+
+def _chunk(cid, source, text, team=""):
+    return Document(page_content=text, metadata={"chunk_id": cid, "source": source, "team": team})
+
+def test_filter_keeps_first_and_aliases_near_copies():
+    idx = DedupIndex(threshold=0.8)
+    text = " ".join(f"word{i}" for i in range(80))
+    kept, dups = idx.filter([_chunk("a0", "a.md", text), _chunk("b0", "b.md", text + " extra"),
+                             _chunk("c0", "c.md", "something else entirely with other words")])
+    assert [c.metadata["chunk_id"] for c in kept] == ["a0", "c0"]
+    assert [(c.metadata["chunk_id"], c.metadata["duplicate_of"]) for c in dups] == [("b0", "a0")]
+    assert idx.alias_sources("a0") == ["b.md"]
+
+def test_clusters_never_span_teams():
+    idx = DedupIndex()
+    text = " ".join(f"word{i}" for i in range(80))
+    kept, dups = idx.filter([_chunk("a0", "a.md", text, "risk"), _chunk("b0", "b.md", text, "payments")])
+    assert len(kept) == 2 and dups == []
+
+def test_delete_reports_orphaned_alias_sources():
+    idx = DedupIndex()
+    text = " ".join(f"word{i}" for i in range(80))
+    idx.filter([_chunk("a0", "a.md", text), _chunk("b0", "b.md", text), _chunk("c0", "c.md", text)])
+    assert idx.delete_sources(["a.md"]) == {"b.md", "c.md"}
+    assert len(idx) == 0 and idx.aliases == {}
+
+def test_save_and_load_keep_buckets(tmp_path):
+    idx = DedupIndex(path=str(tmp_path / "dedup.pkl"))
+    text = " ".join(f"word{i}" for i in range(80))
+    idx.filter([_chunk("a0", "a.md", text)])
+    idx.save()
+    loaded = DedupIndex.load(str(tmp_path / "dedup.pkl"))
+    _, dups = loaded.filter([_chunk("b0", "b.md", text)])
+    assert [c.metadata["duplicate_of"] for c in dups] == ["a0"]
+
+def _write(name, text):
+    os.makedirs("docs", exist_ok=True)
+    with open(f"docs/{name}", "w", encoding="utf-8") as f:
+        f.write(text)
+
+def _sources(query):
+    docs = get_pool().retriever(top_k=3).get_relevant_documents(query)
+    return [(d.metadata["source"], d.metadata.get("aliases", [])) for d in docs]
+
+@pytest.fixture
+def copies(workdir):
+    for name in ("a.md", "b.md", "c.md"):
+        _write(name, RUNBOOK)
+    return ingest_paths(["docs"], parse_workers=0)
+
+def test_copies_are_stored_once_and_cited_as_aliases(copies):
+    stats = get_pool().manifest().files
+    assert stats["docs/a.md"]["chunks"] > 0
+    assert stats["docs/b.md"]["chunks"] == stats["docs/c.md"]["chunks"] == 0
+    assert stats["docs/a.md"]["duplicates"] == 0
+    assert copies["duplicates"] == 2 * stats["docs/a.md"]["chunks"]
+    assert set(get_pool().sparse().by_source) == {"docs/a.md"}
+    source, aliases = _sources("payout escalation ledger console")[0]
+    assert source == "docs/a.md" and sorted(aliases) == ["docs/b.md", "docs/c.md"]
+
+def test_deleting_the_canonical_source_reingests_its_aliases(copies):
+    os.remove("docs/a.md")
+    r = ingest_paths(["docs"], parse_workers=0)
+    assert r["removed"] == ["docs/a.md"]
+    assert sorted(r["reingested"]) == ["docs/b.md", "docs/c.md"]
+    # b now holds the canonical chunks and c aliases them
+    files = get_pool().manifest().files
+    assert files["docs/b.md"]["chunks"] > 0 and files["docs/c.md"]["chunks"] == 0
+    assert set(get_pool().sparse().by_source) == {"docs/b.md"}
+    assert _sources("payout escalation ledger console")[0] == ("docs/b.md", ["docs/c.md"])
+
+    os.remove("docs/b.md")
+    r = ingest_paths(["docs"], parse_workers=0)
+    assert r["reingested"] == ["docs/c.md"]
+    assert set(get_pool().sparse().by_source) == {"docs/c.md"}
+    assert _sources("payout escalation ledger console")[0] == ("docs/c.md", [])
+
+def test_updating_the_canonical_source_reingests_its_aliases(copies):
+    _write("a.md", "# Refunds\n\n" + "Refund disputes go to the risk queue. " * 40)
+    r = ingest_paths(["docs"], parse_workers=0)
+    assert r["updated"] == ["docs/a.md"]
+    assert sorted(r["reingested"]) == ["docs/b.md", "docs/c.md"]
+    assert set(get_pool().sparse().by_source) == {"docs/a.md", "docs/b.md"}
+    assert _sources("payout escalation ledger console")[0] == ("docs/b.md", ["docs/c.md"])
+    assert _sources("refund disputes risk queue")[0][0] == "docs/a.md"
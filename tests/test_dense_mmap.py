@@ -0,0 +1,50 @@
+import os
+
+import pytest
+from langchain_core.documents import Document
+
+from app.local_models import HashEmbeddings
+from app.retriever.dense_mmap import MmapVectorStore
+
+TOPICS = ["payout limits per tier", "ledger desync root cause", "webhook retry backoff",
+          "refund chargeback window", "on-call rotation weekly", "merchant risk review"]
+
+def _doc(i):
+    return Document(page_content=TOPICS[i], metadata={"source": f"d{i}.md", "chunk_id": f"c{i}"})
+
+def _store(path, dtype):
+    return MmapVectorStore(str(path), HashEmbeddings(dim=64), dtype=dtype)
+
+def _top(vs, text):
+    return vs.similarity_search(text, k=1)[0].metadata["chunk_id"]
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_search_finds_each_chunk(tmp_path, dtype):
+    vs = _store(tmp_path, dtype)
+    vs.add_documents([_doc(i) for i in range(len(TOPICS))])
+    assert [_top(vs, t) for t in TOPICS] == [f"c{i}" for i in range(len(TOPICS))]
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+def test_uncommitted_rows_are_dropped_on_next_append(tmp_path, dtype):
+    vs = _store(tmp_path, dtype)
+    vs.add_documents([_doc(0), _doc(1)])
+    # a run that died after appending vectors but before committing their rows
+    for name, size in (("vectors.bin", 64 * (1 if dtype == "int8" else 4)), ("scales.bin", 4)):
+        path = tmp_path / name
+        if path.exists():
+            with open(path, "ab") as f:
+                f.write(b"\x01" * size * 3)
+    vs = _store(tmp_path, dtype)
+    assert vs.count() == 2
+    vs.add_documents([_doc(i) for i in range(2, len(TOPICS))])
+    assert [_top(vs, t) for t in TOPICS] == [f"c{i}" for i in range(len(TOPICS))]
+    assert os.path.getsize(tmp_path / "vectors.bin") == len(TOPICS) * 64 * (1 if dtype == "int8" else 4)
+
+def test_upsert_and_delete_sources(tmp_path):
+    vs = _store(tmp_path, "float32")
+    vs.add_documents([_doc(i) for i in range(3)])
+    vs.add_documents([Document(page_content=TOPICS[3], metadata={"source": "d0.md", "chunk_id": "c0"})], ids=["c0"])
+    assert vs.count() == 3
+    assert vs.similarity_search(TOPICS[3], k=1)[0].metadata["source"] == "d0.md"
+    vs.delete_sources(["d0.md", "d1.md"])
+    assert [r["id"] for r in vs.list_records()] == ["c2"]
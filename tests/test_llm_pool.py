@@ -0,0 +1,150 @@
+"""LLM pool against a real HTTP upstream: bench/fake_openai.py served on a local port."""
+import asyncio
+import functools
+import os
+import socket
+import threading
+import time
+
+import httpx
+import pytest
+import uvicorn
+from fastapi.testclient import TestClient
+
+import app.llm_pool as llm_pool
+import app.rag as rag
+from app.ingest.index import ingest_paths
+from app.llm_pool import LLMOverloaded, LLMPool
+from app.main import app  # mounts ui/ relative to the cwd, so import before any chdir
+from bench import fake_openai
+
+UPSTREAM_MS = 200
+
+@pytest.fixture(scope="module")
+def upstream():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(fake_openai.app, host="127.0.0.1", port=port, log_level="warning"))
+    t = threading.Thread(target=server.run, daemon=True)
+    t.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        assert time.monotonic() < deadline, "fake upstream did not start"
+        time.sleep(0.02)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    t.join(5)
+
+@pytest.fixture
+def pool(upstream, monkeypatch):
+    # fixed upstream latency, short answers
+    monkeypatch.setattr(fake_openai, "FakeChatModel",
+                        functools.partial(fake_openai.FakeChatModel, ttft_ms=UPSTREAM_MS, token_ms=0, tokens=4))
+    monkeypatch.setattr(rag, "CHAT_PROVIDER", "openai")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"{upstream}/v1")
+    httpx.post(f"{upstream}/stats/reset")
+    p = LLMPool()
+    yield p
+    if p._http is not None:
+        p._http.close()
+
+def _run(pool, coro):
+    """-> (result of ``coro``, pool stats); the async client is closed on the same loop (its connections belong to it)."""
+    async def main():
+        try:
+            return await coro, pool.stats()["models"]
+        finally:
+            await pool.aclose()
+    return asyncio.run(main())
+
+def _served(upstream):
+    return httpx.get(f"{upstream}/stats").json()
+
+def _limits(monkeypatch, concurrency, queue=64, timeout_s=10.0):
+    monkeypatch.setattr(llm_pool, "LLM_MAX_CONCURRENCY", concurrency)
+    monkeypatch.setattr(llm_pool, "LLM_MAX_QUEUE", queue)
+    monkeypatch.setattr(llm_pool, "LLM_QUEUE_TIMEOUT_S", timeout_s)
+
+def test_identical_prompts_share_one_call(pool, upstream):
+    async def burst():
+        return await asyncio.gather(*(pool.ainvoke("m", "same prompt") for _ in range(8)))
+    answers, stats = _run(pool, burst())
+    assert len(set(answers)) == 1 and answers[0]
+    assert _served(upstream)["requests"] == 1
+    assert stats["m"]["coalesced"] == 7
+
+def test_identical_streams_share_one_call(pool, upstream):
+    async def burst():
+        async def one():
+            return "".join([part async for part in pool.astream("m", "same prompt")])
+        return await asyncio.gather(*(one() for _ in range(5)))
+    answers, stats = _run(pool, burst())
+    assert len(set(answers)) == 1 and answers[0]
+    assert _served(upstream)["streams"] == 1
+    assert stats["m"]["coalesced"] == 4
+
+def test_sync_and_async_callers_share_the_limit(pool, upstream, monkeypatch):
+    _limits(monkeypatch, concurrency=2)
+    m = pool.model("m")
+    threads = [threading.Thread(target=pool.invoke, args=("m", f"sync {i}")) for i in range(3)]
+    for t in threads:
+        t.start()
+
+    async def burst():
+        await asyncio.gather(*(pool.ainvoke("m", f"async {i}") for i in range(3)))
+    _run(pool, burst())
+    for t in threads:
+        t.join()
+    served = _served(upstream)
+    assert served["requests"] == 6
+    assert served["max_active"] == 2
+    assert m.stats()["calls"] == 6 and m.stats()["active"] == 0
+
+def test_full_queue_is_rejected(pool, monkeypatch):
+    _limits(monkeypatch, concurrency=1, queue=1)
+
+    async def burst():
+        return await asyncio.gather(*(pool.ainvoke("m", f"prompt {i}") for i in range(3)), return_exceptions=True)
+    results, stats = _run(pool, burst())
+    assert sum(isinstance(r, LLMOverloaded) for r in results) == 1
+    assert sum(isinstance(r, str) for r in results) == 2
+    assert stats["m"]["rejected"] == 1
+
+def test_queue_timeout_rejects_the_waiter(pool, monkeypatch):
+    _limits(monkeypatch, concurrency=1, timeout_s=UPSTREAM_MS / 4000)
+
+    async def burst():
+        first, second = await asyncio.gather(pool.ainvoke("m", "first"), pool.ainvoke("m", "second"),
+                                             return_exceptions=True)
+        assert isinstance(first, str)
+        assert isinstance(second, LLMOverloaded)
+        # a sync waiter times out the same way while an async call holds the slot
+        task = asyncio.ensure_future(pool.ainvoke("m", "third"))
+        await asyncio.sleep(0.01)
+        try:
+            with pytest.raises(LLMOverloaded):
+                await asyncio.to_thread(pool.invoke, "m", "fourth")
+        finally:
+            await task
+    _, stats = _run(pool, burst())
+    assert (stats["m"]["rejected"], stats["m"]["active"], stats["m"]["queued"]) == (2, 0, 0)
+
+def test_ask_answers_429_when_overloaded(pool, workdir, monkeypatch):
+    os.makedirs("docs")
+    with open("docs/a.md", "w", encoding="utf-8") as f:
+        f.write("# Payouts\n\n" + "Payout limits per tier. " * 30)
+    ingest_paths(["docs"], parse_workers=0)
+    _limits(monkeypatch, concurrency=1, queue=0)
+    monkeypatch.setattr(llm_pool, "_POOL", pool)
+    m = pool.model(rag._resolve_model(None))
+    with TestClient(app) as client:  # one event loop for both requests; shutdown closes the pool
+        m.acquire_sync()  # another request holds the only slot
+        try:
+            r = client.post("/ask", json={"question": "payout limits"})
+        finally:
+            m.release()
+        assert r.status_code == 429
+        assert r.headers["Retry-After"] == "10"
+        ok = client.post("/ask", json={"question": "payout limits"})
+        assert ok.status_code == 200 and ok.json()["answer"]
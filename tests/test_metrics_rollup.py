@@ -0,0 +1,112 @@
+import json
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app  # mounts ui/ relative to the cwd, so import before any chdir
+from app.metrics_rollup import MetricsRollup
+
+def _ask(answer_id, ago_s, latency_ms=100, team=None, now=None):
+    ts = (now or time.time()) - ago_s
+    return {"type": "ask", "answer_id": answer_id, "ts": ts, "model": "m", "team": team,
+            "latency_ms": latency_ms, "retrieval_ms": 10, "llm_ms": latency_ms - 10}
+
+def _append(path, *events):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a", encoding="utf-8") as f:
+        for e in events:
+            f.write(json.dumps(e) + "\n")
+
+@pytest.fixture
+def log(tmp_path):
+    return tmp_path / "logs" / "events.jsonl"
+
+def _rollup(log):
+    return MetricsRollup(log_path=log, checkpoint_path=log.with_name("rollup.json"))
+
+def test_windows_only_merge_recent_slots(log):
+    now = time.time()
+    _append(log,
+            _ask("a", 60, 100, now=now),
+            _ask("b", 30 * 60, 200, now=now),
+            _ask("c", 3 * 3600, 300, now=now),
+            _ask("d", 2 * 86400, 400, now=now))
+    r = _rollup(log)
+    assert r.aggregate("5m").n == 1
+    assert r.aggregate("1h").n == 2
+    assert r.aggregate("24h").n == 3
+    assert r.aggregate().n == 4  # all time keeps what fell out of the 24h slots
+    h = r.aggregate("1h").hist["latency_ms"]
+    assert (h.min, h.max) == (100, 200)
+
+def test_unknown_window_raises(log):
+    with pytest.raises(ValueError):
+        _rollup(log).aggregate("7d")
+
+def test_late_feedback_joins_its_answer(log):
+    _append(log, _ask("a", 60), _ask("b", 60))
+    r = _rollup(log)
+    assert r.aggregate().helpful_n == 0
+    _append(log,
+            {"type": "feedback", "answer_id": "a", "helpful": True, "ts": time.time()},
+            {"type": "feedback", "answer_id": "b", "helpful": True, "ts": time.time()},
+            {"type": "feedback", "answer_id": "b", "helpful": False, "ts": time.time()},  # last one wins
+            {"type": "feedback", "answer_id": "unknown", "helpful": True, "ts": time.time()})
+    agg = r.aggregate("5m")
+    assert (agg.helpful_n, agg.helpful_sum) == (2, 1)
+
+def test_refresh_reads_only_appended_lines(log):
+    _append(log, _ask("a", 60))
+    r = _rollup(log)
+    assert r.aggregate().n == 1
+    with log.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(_ask("b", 60))[:20])  # half-written line
+    assert r.aggregate().n == 1
+    with log.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(_ask("b", 60))[20:] + "\n")
+    assert r.aggregate().n == 2
+
+def test_checkpoint_resume_does_not_recount(log):
+    _append(log, _ask("a", 60), _ask("b", 600))
+    first = _rollup(log)
+    assert first.aggregate().n == 2
+    first.flush()
+    offset = first.offset
+
+    _append(log, _ask("c", 60))
+    resumed = _rollup(log)
+    assert resumed.offset == offset  # starts where the checkpoint left off
+    assert resumed.aggregate().n == 3
+    assert resumed.aggregate("5m").n == 2
+    _append(log, {"type": "feedback", "answer_id": "a", "helpful": True, "ts": time.time()})
+    assert resumed.aggregate().helpful_n == 1  # answer ids survive the checkpoint
+
+def test_checkpoint_of_another_log_is_ignored(log, tmp_path):
+    _append(log, _ask("a", 60))
+    r = _rollup(log)
+    r.aggregate()
+    r.flush()
+    other = tmp_path / "other" / "events.jsonl"
+    _append(other, _ask("x", 60))
+    resumed = MetricsRollup(log_path=other, checkpoint_path=log.with_name("rollup.json"))
+    assert resumed.aggregate().n == 1
+
+def test_follows_rotation(log):
+    _append(log, _ask("a", 60), _ask("b", 60))
+    r = _rollup(log)
+    assert r.aggregate().n == 2
+    _append(log, _ask("c", 60))
+    os.replace(log, log.with_name(log.name + ".1"))  # rotated before we read "c"
+    _append(log, _ask("d", 60))
+    assert r.aggregate().n == 4
+
+def test_metrics_endpoint_rejects_bad_window(workdir):
+    client = TestClient(app)
+    r = client.get("/metrics", params={"window": "7d"})
+    assert r.status_code == 400
+    assert "unknown window" in r.json()["detail"]
+    ok = client.get("/metrics", params={"window": "1h"})
+    assert ok.status_code == 200
+    assert ok.json()["window"] == "1h"
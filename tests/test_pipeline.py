@@ -0,0 +1,96 @@
+import json
+import os
+import threading
+
+import pytest
+
+from app.ingest import pipeline
+from app.ingest.pipeline import discover_files, run_pipeline
+from app.retriever.sparse import SparseIndex
+
+class _Store:
+    """Records writes like a vectorstore; optionally fails on the n-th call."""
+    def __init__(self, fail_at=None):
+        self.ids = []
+        self.calls = 0
+        self.fail_at = fail_at
+        self.lock = threading.Lock()
+
+    def add_documents(self, docs, ids):
+        with self.lock:
+            self.calls += 1
+            if self.calls == self.fail_at:
+                raise OSError("disk full")
+            self.ids += ids
+
+@pytest.fixture
+def drop(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # sources are relative paths
+    for d in range(3):
+        os.makedirs(f"drop/d{d}")
+        for i in range(4):
+            with open(f"drop/d{d}/n{i}.md", "w", encoding="utf-8") as f:
+                f.write(f"# Note {d}-{i}\n\n" + f"Runbook {d} step {i} details. " * 80)
+    with open("drop/top.txt", "w", encoding="utf-8") as f:
+        f.write("top level file " * 50)
+    return sorted((p, p) for p in discover_files(["drop"]))
+
+def test_discovery_walks_every_level(drop):
+    assert len(drop) == 13
+    assert ("drop/top.txt", "drop/top.txt") in drop
+
+def test_process_pool_matches_inline_parsing(drop):
+    inline_store, inline_sparse = _Store(), SparseIndex()
+    inline, _ = run_pipeline(drop, inline_store, inline_sparse, parse_workers=0)
+    pooled_store, pooled_sparse = _Store(), SparseIndex()
+    pooled, stages = run_pipeline(drop, pooled_store, pooled_sparse, parse_workers=2, embed_batch=7, queue_size=1)
+    assert pooled == inline
+    assert sorted(pooled_store.ids) == sorted(inline_store.ids) == sorted(c for ids in inline.values() for c in ids)
+    assert pooled_sparse.by_source == inline_sparse.by_source
+    n = len(pooled_store.ids)
+    assert stages["parse"]["items"] == len(drop)
+    assert stages["chunk"]["items"] == stages["embed_write"]["items"] == n
+    assert stages["config"]["parse_workers"] == 2
+    assert pooled_store.calls >= n // 7  # written in embed_batch slices
+
+def test_progress_and_source_stats(drop):
+    seen, stats = [], {}
+    chunk_ids, _ = run_pipeline(drop, _Store(), SparseIndex(), parse_workers=0, source_stats=stats,
+                                team="risk", progress=seen.append)
+    assert seen[-1]["files_done"] == seen[-1]["files_total"] == len(drop)
+    assert seen[-1]["chunks"] == sum(len(v) for v in chunk_ids.values())
+    assert {s: st["chunks"] for s, st in stats.items()} == {s: len(v) for s, v in chunk_ids.items()}
+
+def test_large_structured_files_are_streamed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pipeline, "STREAM_BYTES", 1000)
+    monkeypatch.setattr(pipeline, "STREAM_BATCH_CHARS", 2000)
+    with open("events.jsonl", "w", encoding="utf-8") as f:
+        for i in range(200):
+            f.write(json.dumps({"id": i, "msg": f"payout event {i} settled"}) + "\n")
+    assert pipeline._streamed("events.jsonl")
+    sparse = SparseIndex()
+    chunk_ids, _ = run_pipeline([("events.jsonl", "events.jsonl")], _Store(), sparse, parse_workers=2)
+    ids = chunk_ids["events.jsonl"]
+    assert len(ids) == len(set(ids)) == len(sparse.by_source["events.jsonl"])
+    indexes = [sparse.docs[c]["metadata"]["chunk_index"] for c in ids]
+    assert indexes == list(range(len(ids)))  # numbering continues across streamed parts
+    text = " ".join(sparse.docs[c]["text"] for c in ids)
+    assert all(f"payout event {i} settled" in text for i in (0, 99, 199))
+
+def test_writer_error_stops_the_run(drop):
+    store = _Store(fail_at=2)
+    with pytest.raises(OSError, match="disk full"):
+        run_pipeline(drop, store, SparseIndex(), parse_workers=2, embed_batch=4, queue_size=1)
+
+def test_cancellation_stops_before_everything_is_parsed(drop):
+    calls = []
+
+    def check():
+        calls.append(1)
+        if len(calls) >= 2:
+            raise RuntimeError("cancelled")
+    store = _Store()
+    with pytest.raises(RuntimeError, match="cancelled"):
+        run_pipeline(drop, store, SparseIndex(), parse_workers=0, queue_size=1, check_cancelled=check)
+    assert len(calls) < len(drop)
@@ -0,0 +1,106 @@
+import math
+from collections import Counter
+
+import pytest
+from langchain_core.documents import Document
+
+from app.retriever.sparse import SparseIndex, tokenize
+
+DOCS = [
+    ("runbooks/payouts.md", "", "Payout limits per tier: T1 payouts are capped daily, T2 weekly."),
+    ("runbooks/payouts.md", "", "Escalate payout delays to the payments on-call and update the status page."),
+    ("runbooks/ledger.md", "risk", "Ledger desync root cause: a missing unique index on transfer ids."),
+    ("runbooks/ledger.md", "risk", "Risk tier T3 merchants need manual review of every payout."),
+    ("notes/webhooks.md", "platform", "Webhook failures retry with backoff; payouts webhooks retry longer."),
+    ("notes/refunds.md", "platform", "Refund policy: chargeback window is 120 days."),
+]
+
+def _docs():
+    out = []
+    for i, (source, team, text) in enumerate(DOCS):
+        out.append(Document(page_content=text, metadata={"source": source, "team": team, "chunk_id": f"c{i}"}))
+    return out
+
+def _index(**kw) -> SparseIndex:
+    idx = SparseIndex(**kw)
+    idx.add_documents(_docs())
+    return idx
+
+def _reference(query, k1=1.5, b=0.75):
+    """Textbook BM25 (Lucene-style IDF) over DOCS, by chunk id."""
+    tfs = [Counter(tokenize(text)) for _, _, text in DOCS]
+    avgdl = sum(sum(tf.values()) for tf in tfs) / len(tfs)
+    scores = {}
+    for i, tf in enumerate(tfs):
+        dl = sum(tf.values())
+        s = 0.0
+        for term in set(tokenize(query)):
+            if term not in tf:
+                continue
+            df = sum(1 for other in tfs if term in other)
+            idf = math.log(1 + (len(tfs) - df + 0.5) / (df + 0.5))
+            s += idf * tf[term] * (k1 + 1) / (tf[term] + k1 * (1 - b + b * dl / avgdl))
+        if s > 0:
+            scores[f"c{i}"] = s
+    return scores
+
+@pytest.mark.parametrize("query", ["payout", "payouts retry", "risk tier T3 review", "chargeback window days"])
+def test_scores_match_reference_bm25(query):
+    ref = _reference(query)
+    got = dict(_index().search_scores(query, k=len(DOCS)))
+    assert got.keys() == ref.keys()
+    for cid, score in ref.items():
+        assert got[cid] == pytest.approx(score, rel=1e-5)
+
+def test_batch_matches_single_queries():
+    idx = _index()
+    queries = ["payout", "payouts retry", "nothing matches this"]
+    for query, hits in zip(queries, idx.search_scores_batch(queries, k=3)):
+        single = idx.search_scores(query, k=3)
+        assert {c for c, _ in hits} == {c for c, _ in single}
+        assert [s for _, s in hits] == pytest.approx([s for _, s in single])
+
+def test_unknown_terms_score_nothing():
+    assert _index().search_scores("zebra quantum") == []
+
+def test_team_filter_keeps_corpus_wide_scores():
+    idx = _index()
+    everything = dict(idx.search_scores("payout payouts", k=len(DOCS)))
+    risk = dict(idx.search_scores("payout payouts", k=len(DOCS), teams=["risk"]))
+    assert risk.keys() == {"c3"}
+    # the partition only drops columns; IDF and length norms stay corpus-wide
+    assert risk["c3"] == pytest.approx(everything["c3"])
+    shared = idx.search("payout payouts", k=len(DOCS), teams=["", "platform"])
+    assert {d.metadata["team"] for d in shared} <= {"", "platform"}
+    assert idx.search("payout", teams=["nobody"]) == []
+
+def test_team_partition_rebuilt_after_mutation():
+    idx = _index()
+    assert idx.search_scores("refund", teams=["risk"]) == []
+    idx.add_documents([Document(page_content="Refund disputes go to risk.",
+                                metadata={"source": "notes/disputes.md", "team": "risk", "chunk_id": "d0"})])
+    assert [c for c, _ in idx.search_scores("refund", teams=["risk"])] == ["d0"]
+
+def test_delete_source_drops_its_chunks():
+    idx = _index()
+    assert idx.delete_source("runbooks/payouts.md") == 2
+    assert len(idx) == len(DOCS) - 2
+    hits = {c for c, _ in idx.search_scores("payout payouts", k=len(DOCS))}
+    assert hits == {"c3", "c4"}
+
+def test_pickle_round_trip(tmp_path):
+    path = str(tmp_path / "bm25.pkl")
+    idx = _index(path=path, k1=1.2, b=0.6)
+    idx.save()
+    loaded = SparseIndex.load(path)
+    assert (loaded.k1, loaded.b) == (1.2, 0.6)
+    assert len(loaded) == len(idx)
+    assert loaded.by_source == idx.by_source
+    for query in ("payout", "risk tier", "webhook retry"):
+        assert loaded.search_scores(query, k=4) == idx.search_scores(query, k=4)
+        assert loaded.search_scores(query, teams=["platform"]) == idx.search_scores(query, teams=["platform"])
+    doc = loaded.search("chargeback", k=1)[0]
+    assert doc.metadata == {"source": "notes/refunds.md", "team": "platform", "chunk_id": "c5"}
+
+def test_load_missing_file_is_empty(tmp_path):
+    assert len(SparseIndex.load(str(tmp_path / "nope.pkl"))) == 0
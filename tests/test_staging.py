@@ -0,0 +1,155 @@
+import os
+
+import pytest
+
+from app.ingest import index as ingest_index
+from app.ingest.index import ingest_paths
+from app.ingest.staging import LEASE_DIR, discard, generations, prune, stage, write_lock
+from app.rag import CURRENT_FILE, active_index_dir
+from app.retriever.pool import get_pool
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+def _doc(topic):
+    return f"# {topic}\n\n" + f"{topic} runbook step. " * 40
+
+def _ingest(team=None):
+    return ingest_paths(["docs"], parse_workers=0, team=team)
+
+def _gen_names():
+    return [os.path.basename(p) for _, p in generations()]
+
+def _sources(query, **kw):
+    return [d.metadata["source"] for d in get_pool().retriever(top_k=3, **kw).get_relevant_documents(query)]
+
+@pytest.fixture
+def corpus(workdir):
+    for name in ("alpha", "bravo", "charlie"):
+        _write(f"docs/{name}.md", _doc(name))
+    return workdir
+
+def test_first_ingest_adds_everything(corpus):
+    r = _ingest()
+    assert sorted(r["added"]) == ["docs/alpha.md", "docs/bravo.md", "docs/charlie.md"]
+    assert r["updated"] == r["removed"] == []
+    assert r["generation"] == "gen-000001"
+    assert os.path.basename(active_index_dir()) == "gen-000001"
+
+def test_manifest_diff(corpus):
+    _ingest()
+    _write("docs/alpha.md", _doc("zulu"))   # changed content
+    os.remove("docs/bravo.md")              # gone
+    _write("docs/delta.md", _doc("delta"))  # new
+    os.utime("docs/charlie.md")             # touched, same bytes
+    r = _ingest()
+    assert r["added"] == ["docs/delta.md"]
+    assert r["updated"] == ["docs/alpha.md"]
+    assert r["removed"] == ["docs/bravo.md"]
+    assert r["unchanged"] == 1
+    assert _sources("zulu runbook")[0] == "docs/alpha.md"
+    assert "docs/bravo.md" not in _sources("bravo runbook")
+
+def test_unchanged_run_publishes_nothing(corpus):
+    first = _ingest()
+    r = _ingest()
+    assert r["indexed"] == 0 and r["unchanged"] == 3
+    assert "generation" not in r
+    assert _gen_names() == [first["generation"]]
+
+def test_retag_reingests_under_new_team(corpus):
+    _ingest()
+    r = _ingest(team="risk")
+    assert sorted(r["updated"]) == ["docs/alpha.md", "docs/bravo.md", "docs/charlie.md"]
+    assert r["added"] == []
+    sparse = get_pool().sparse()
+    assert {d["metadata"]["team"] for d in sparse.docs.values()} == {"risk"}
+    assert _sources("alpha runbook", team="risk")[0] == "docs/alpha.md"
+    assert _sources("alpha runbook", team="payments") == []
+
+@pytest.mark.parametrize("content", ["", _doc("bravo")], ids=["emptied", "all-duplicates"])
+def test_update_without_chunks_drops_old_chunks(corpus, content):
+    _ingest()
+    _write("docs/alpha.md", content)
+    r = _ingest()
+    assert r["updated"] == ["docs/alpha.md"]
+    assert get_pool().manifest().files["docs/alpha.md"]["chunks"] == 0
+    assert "docs/alpha.md" not in get_pool().sparse().by_source
+    assert "docs/alpha.md" not in {d.metadata["source"] for d in get_pool().bundle().search("alpha runbook", k=10)}
+    assert "docs/alpha.md" not in _sources("alpha runbook")
+
+def test_publish_swaps_pool_to_new_generation(corpus):
+    first = _ingest()
+    pool = get_pool()
+    old_version = pool.index_version()
+    _write("docs/alpha.md", _doc("yankee"))
+    second = _ingest()
+    assert second["generation"] != first["generation"]
+    with open(CURRENT_FILE, encoding="utf-8") as f:
+        assert f.read() == second["generation"]
+    assert os.path.basename(pool.index_dir()) == second["generation"]
+    assert pool.index_version() == second["index_version"] > old_version
+    assert _sources("yankee runbook")[0] == "docs/alpha.md"
+    # the previous generation is kept for requests that still borrowed it
+    assert first["generation"] in _gen_names()
+
+def test_failed_ingest_leaves_live_index(corpus, monkeypatch):
+    first = _ingest()
+    _write("docs/alpha.md", _doc("xray"))
+
+    def boom(*a, **kw):
+        raise RuntimeError("store unavailable")
+    with monkeypatch.context() as m:
+        m.setattr(ingest_index, "make_vectorstore", boom)
+        with pytest.raises(RuntimeError):
+            _ingest()
+    assert os.path.basename(active_index_dir()) == first["generation"]
+    assert _gen_names() == [first["generation"]]  # staged copy dropped
+    assert _ingest()["updated"] == ["docs/alpha.md"]
+
+def test_stage_links_replaced_files_and_never_reuses_numbers(corpus):
+    live = _ingest()["generation"]
+    with write_lock():
+        staged = stage()
+        link_count = lambda rel: os.stat(os.path.join(staged, rel)).st_nlink
+        assert link_count("bm25.pkl") == 2
+        assert link_count("manifest.json") == 2
+        assert link_count(os.path.join("dense", "vectors.bin")) == 2
+        assert link_count(os.path.join("dense", "meta.sqlite")) == 1  # changed in place: copied
+        assert not os.path.exists(os.path.join(staged, "bundle"))
+        discard(staged)
+    assert _gen_names() == [live]
+    _write("docs/alpha.md", _doc("whiskey"))
+    r = _ingest()
+    assert r["generation"] == "gen-000003"  # gen-000002 was handed out and discarded
+    # appending to the staged vectors did not touch the live generation's file
+    assert os.stat(os.path.join(".chroma", live, "dense", "vectors.bin")).st_nlink == 1
+
+def test_prune_keeps_live_and_previous(corpus):
+    for topic in ("one", "two", "three", "four"):
+        _write("docs/alpha.md", _doc(topic))
+        last = _ingest()["generation"]
+    assert _gen_names() == ["gen-000003", "gen-000004"]
+    assert os.path.basename(active_index_dir()) == last == "gen-000004"
+
+def test_prune_drops_unpublished_and_keeps_leased(corpus):
+    _ingest()
+    for topic in ("one", "two"):
+        _write("docs/alpha.md", _doc(topic))
+        _ingest()
+    assert _gen_names() == ["gen-000002", "gen-000003"]
+    os.makedirs(os.path.join(".chroma", "gen-000001"))
+    os.makedirs(os.path.join(".chroma", "gen-000009"))  # staged by a crashed ingest
+    # a worker on another host still serves gen-000001
+    with open(os.path.join(LEASE_DIR, "otherhost-1"), "w", encoding="utf-8") as f:
+        f.write("gen-000001")
+    with write_lock():
+        removed = prune()
+    assert [os.path.basename(p) for p in removed] == ["gen-000009"]
+    assert _gen_names() == ["gen-000001", "gen-000002", "gen-000003"]
+    os.utime(os.path.join(LEASE_DIR, "otherhost-1"), (0, 0))  # expired lease
+    with write_lock():
+        prune()
+    assert _gen_names() == ["gen-000002", "gen-000003"]
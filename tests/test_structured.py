@@ -0,0 +1,138 @@
+import io
+import json
+
+import pytest
+
+from app.ingest.structured import iter_csv, iter_json, iter_json_records, iter_jsonl, iter_yaml, json_path
+
+TRICKY = [
+    'plain',
+    'quote " inside',
+    'backslash \\ and \\" escaped quote',
+    'brackets ] } [ { and , commas',
+    'ends with backslash \\',
+    'unicode é ✓   line separator',
+    'newline\nand tab\t',
+]
+
+@pytest.fixture(autouse=True)
+def _cwd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # sources are recorded relative to the cwd
+
+def _records(value, limit):
+    return list(iter_json_records(io.StringIO(json.dumps(value)), limit=limit))
+
+@pytest.mark.parametrize("key, expected", [
+    ("name", "$.name"),
+    ("_id2", "$._id2"),
+    (3, "$[3]"),
+    ("with space", '$["with space"]'),
+    ("a.b", '$["a.b"]'),
+    ("2nd", '$["2nd"]'),
+    ("name\n", '$["name\\n"]'),
+    ("", '$[""]'),
+    ("ключ", '$["ключ"]'),
+])
+def test_json_path(key, expected):
+    assert json_path("$", key) == expected
+
+def test_small_document_is_one_record():
+    doc = {"title": "Runbook", "steps": ["a", "b"]}
+    assert _records(doc, limit=4000) == [("$", doc)]
+
+def test_scalar_root():
+    assert _records("just a string", limit=10) == [("$", "just a string")]
+    assert list(iter_json_records(io.StringIO("  \n"))) == []
+
+def test_large_container_is_split_into_members():
+    items = [{"id": i, "text": TRICKY[i % len(TRICKY)]} for i in range(40)]
+    doc = {"service": "payouts", "items": items, "weird key": {"x": 1}}
+    recs = _records(doc, limit=200)
+    by_path = dict(recs)
+    assert [by_path[f"$.items[{i}]"] for i in range(40)] == items
+    assert by_path['$["weird key"]'] == {"x": 1}
+    assert by_path["$"] == {"service": "payouts"}  # scalars grouped under their parent
+
+def test_scalar_groups_are_flushed_at_the_limit():
+    doc = [f"value-{i:04d}" for i in range(100)]
+    recs = _records(doc, limit=120)
+    assert all(path == "$" for path, _ in recs)
+    assert len(recs) > 1
+    assert [v for _, group in recs for v in group] == doc
+
+@pytest.mark.parametrize("text", TRICKY)
+def test_escaped_strings_survive_block_boundaries(text):
+    # members larger than the 64K read block, strings cut at every offset
+    doc = {"rows": [{"n": i, "pad": "x" * (i * 7919 % 70000), "s": text} for i in range(12)]}
+    rows = {}
+    for path, value in _records(doc, limit=4000):
+        rows.setdefault(path, {}).update(value)  # rows over the limit come as scalar groups
+    assert [rows[f"$.rows[{i}]"] for i in range(12)] == doc["rows"]
+
+def test_nested_paths_quote_odd_keys():
+    doc = {"a b": {"c": [{"d": "y" * 50}, {"d": "z" * 50}]}}
+    paths = [p for p, _ in _records(doc, limit=60)]
+    assert paths == ['$["a b"].c[0]', '$["a b"].c[1]']
+
+@pytest.mark.parametrize("bad", ['{"a": 1', '{"a" 1}', '[1 2]', '{"a": 1} {"b": 2}'])
+def test_invalid_json_raises(bad):
+    with pytest.raises(ValueError):
+        list(iter_json_records(io.StringIO(bad), limit=2))
+
+def test_iter_json_documents(tmp_path):
+    (tmp_path / "cfg.json").write_text(json.dumps({"name": "svc", "owner": "payments"}), encoding="utf-8")
+    docs = list(iter_json(str(tmp_path / "cfg.json")))
+    assert len(docs) == 1
+    assert docs[0].metadata == {"source": "cfg.json", "json_path": "$"}
+    assert docs[0].page_content == '$\n{"name": "svc", "owner": "payments"}'
+
+def test_iter_jsonl_lines(tmp_path):
+    lines = [json.dumps({"q": t}) for t in TRICKY[:3]]
+    (tmp_path / "log.jsonl").write_text(lines[0] + "\n\n" + lines[1] + "\n" + lines[2] + "\n", encoding="utf-8")
+    docs = list(iter_jsonl(str(tmp_path / "log.jsonl")))
+    assert [d.metadata["line"] for d in docs] == [1, 3, 4]
+    assert [json.loads(d.page_content.split("\n", 1)[1]) for d in docs] == [{"q": t} for t in TRICKY[:3]]
+
+def test_iter_jsonl_reports_bad_line(tmp_path):
+    (tmp_path / "log.jsonl").write_text('{"ok": 1}\n{"broken": \n', encoding="utf-8")
+    with pytest.raises(ValueError, match=r"log\.jsonl:2"):
+        list(iter_jsonl(str(tmp_path / "log.jsonl")))
+
+def test_iter_csv_rows(tmp_path):
+    (tmp_path / "merchants.csv").write_text(
+        'name,tier,notes\n'
+        'Acme,T1,"likes, commas"\n'
+        'Globex,T3,"multi\nline"\n'
+        'Initech,,\n'
+        ',,\n',
+        encoding="utf-8")
+    docs = list(iter_csv(str(tmp_path / "merchants.csv")))
+    assert [d.page_content for d in docs] == [
+        "name: Acme\ntier: T1\nnotes: likes, commas",
+        "name: Globex\ntier: T3\nnotes: multi\nline",
+        "name: Initech",
+    ]
+    assert [d.metadata["row"] for d in docs] == [0, 1, 2]
+    assert [d.metadata["line"] for d in docs] == [2, 4, 5]  # the quoted newline spans lines 3-4
+
+def test_iter_tsv(tmp_path):
+    (tmp_path / "t.tsv").write_text("a\tb\n1\tx, y\n", encoding="utf-8")
+    docs = list(iter_csv(str(tmp_path / "t.tsv")))
+    assert [d.page_content for d in docs] == ["a: 1\nb: x, y"]
+
+def test_iter_csv_empty(tmp_path):
+    (tmp_path / "empty.csv").write_text("", encoding="utf-8")
+    assert list(iter_csv(str(tmp_path / "empty.csv"))) == []
+
+def test_iter_yaml_documents(tmp_path):
+    (tmp_path / "svc.yaml").write_text(
+        "name: payouts\nowner: \"team: payments\"\n"
+        "---\n"
+        "---\n"
+        "steps:\n  - restart\n  - 'quote \" here'\n",
+        encoding="utf-8")
+    docs = list(iter_yaml(str(tmp_path / "svc.yaml")))
+    assert [d.metadata["document"] for d in docs] == [0, 2]  # the empty document is skipped
+    assert all(d.metadata["json_path"] == "$" for d in docs)
+    assert json.loads(docs[0].page_content.split("\n", 1)[1]) == {"name": "payouts", "owner": "team: payments"}
+    assert json.loads(docs[1].page_content.split("\n", 1)[1]) == {"steps": ["restart", 'quote " here']}
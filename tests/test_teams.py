@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+import app.rag as rag
+from app.ingest.index import ingest_paths
+from app.rag import allowed_teams
+from app.retriever.pool import get_pool
+
+DOCS = {
+    "payments": ("docs/payments/payouts.md", "Payout limits per tier and payout escalation steps."),
+    "risk": ("docs/risk/payout-review.md", "Payout review for risky merchants and payout holds."),
+    None: ("docs/shared/glossary.md", "Glossary: payout, ledger, merchant tier, payout hold."),
+}
+
+@pytest.fixture
+def teams(workdir):
+    for team, (path, line) in DOCS.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"# {path}\n\n" + (line + " ") * 20)
+        ingest_paths([os.path.dirname(path)], parse_workers=0, team=team)
+    return workdir
+
+def _sources(team, bundle=True):
+    pool = get_pool()
+    # bm25= forces the stores themselves (the path used when there is no bundle)
+    r = pool.retriever(top_k=8, team=team) if bundle else pool.retriever(bm25=pool.sparse(), top_k=8, team=team)
+    return {d.metadata["source"] for d in r.get_relevant_documents("payout tier review hold")}
+
+def test_allowed_teams(monkeypatch):
+    assert allowed_teams(None) is None
+    assert allowed_teams(" Risk ") == ["risk", "shared"]
+    assert allowed_teams("shared") == ["shared"]
+    monkeypatch.setattr(rag, "TEAM_INCLUDE_SHARED", False)
+    assert allowed_teams("risk") == ["risk"]
+
+@pytest.mark.parametrize("bundle", [True, False], ids=["bundle", "stores"])
+def test_team_sees_own_and_shared_chunks(teams, bundle):
+    assert get_pool().serving_backend() == "bundle"
+    payments, risk, shared = (DOCS[t][0] for t in ("payments", "risk", None))
+    assert _sources(None, bundle) == {payments, risk, shared}
+    assert _sources("payments", bundle) == {payments, shared}
+    assert _sources("RISK", bundle) == {risk, shared}
+    assert _sources("shared", bundle) == {shared}
+    assert _sources("nobody", bundle) == {shared}
+
+def test_isolated_teams_skip_shared(teams, monkeypatch):
+    monkeypatch.setattr(rag, "TEAM_INCLUDE_SHARED", False)
+    assert _sources("risk") == {DOCS["risk"][0]}
+    assert _sources("nobody") == set()
+
+def test_chunks_and_index_stats_carry_the_team(teams):
+    sparse = get_pool().sparse()
+    assert {d["metadata"]["source"]: d["metadata"]["team"] for d in sparse.docs.values()} == {
+        DOCS["payments"][0]: "payments", DOCS["risk"][0]: "risk", DOCS[None][0]: "shared"}
+    by_team = get_pool().manifest().stats["by_team"]
+    assert set(by_team) == {"payments", "risk", "shared"}
+    assert all(v["sources"] == 1 and v["chunks"] > 0 for v in by_team.values())